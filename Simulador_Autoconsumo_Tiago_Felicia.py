@@ -5,6 +5,8 @@ import io
 import time
 import graficos as gfx
 import processamento_dados as proc_dados
+import diagrama_carga
+import grafo_calculo
 import calculos as calc
 import constantes as C
 import math
@@ -24,7 +26,10 @@ st.set_page_config(page_title="Simulador de Autoconsumo Solar Fotovoltaico - Por
 
 # --- Carregar ficheiro Excel do Hugging Face ---
 url_excel = "https://huggingface.co/spaces/tiagofelicia/simulador-autoconsumo/resolve/main/%E2%98%80%EF%B8%8F_Autoconsumo_Tiago_Felicia.xlsx"
-OMIE_CICLOS, CONSTANTES = proc_dados.carregar_dados_excel(url_excel)
+url_snapshot_omie = "https://huggingface.co/spaces/tiagofelicia/simulador-autoconsumo/resolve/main/data/OMIE_CICLOS.arrow"
+url_snapshot_constantes = "https://huggingface.co/spaces/tiagofelicia/simulador-autoconsumo/resolve/main/data/Constantes.arrow"
+# Partilhados por todas as sessões e só de leitura: nunca alterar no lugar (usar .copy() antes de modificar)
+OMIE_CICLOS, CONSTANTES = proc_dados.carregar_dados_omie(url_snapshot_omie, url_snapshot_constantes, url_excel)
 
 
 def atualizar_distrito_pelas_coords():
@@ -159,6 +164,8 @@ def reset_solar_callback():
         for key in keys_to_reset:
             if key in st.session_state:
                 del st.session_state[key]
+        # Resultados intermédios guardados pelo grafo de cálculo
+        grafo_calculo.esquecer(st.session_state, 'base_producao', 'solar')
         
         # Reinicia o estado de controlo
         st.session_state.calculo_executado = False
@@ -186,10 +193,16 @@ def calcular_simulacao_callback():
             posicao_montagem = mapa_montagem[st.session_state.solar_montagem]
             distrito_backup = st.session_state.distrito_selecionado
 
-            df_apos_solar, fonte_usada, erro_api = calc.simular_autoconsumo_completo(
-                df_analise_original, potencia, latitude, longitude, inclinacao, 
-                orientacao_graus, system_loss, posicao_montagem, distrito_backup, st.session_state.solar_sombra
+            # Produção de 1 kWp (só depende da localização e orientação) e depois a da potência escolhida
+            base_producao = grafo_calculo.etapa(
+                st.session_state, 'base_producao', calc.preparar_base_producao_solar,
+                df_analise_original, latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem, distrito_backup
             )
+            df_apos_solar = grafo_calculo.etapa(
+                st.session_state, 'solar', calc.aplicar_base_producao_solar,
+                df_analise_original, base_producao, potencia, st.session_state.solar_sombra
+            )
+            fonte_usada, erro_api = base_producao['fonte'], base_producao['erro_api']
             
             # --- ATUALIZAR ESTADO COMPLETO APÓS CÁLCULO SOLAR ---
             st.session_state.last_calculated_latitude = latitude
@@ -207,34 +220,19 @@ def calcular_simulacao_callback():
             st.session_state.calculo_executado = False
 
         # --- Aplicação da Simulação Solar ao Cenário Base ---
-        df_pre_bateria = calc.aplicar_simulacao_solar_aos_dados_base(df_analise_original, df_apos_solar)
+        df_pre_bateria = grafo_calculo.etapa(
+            st.session_state, 'pre_bateria', calc.aplicar_simulacao_solar_aos_dados_base, df_analise_original, df_apos_solar
+        )
 
         # --- Simulação da Bateria ---
-        df_simulado_final = df_pre_bateria.copy()
+        # Mudar só os parâmetros da bateria não repete as etapas solares acima
+        config_bateria = None
         if st.session_state.get('chk_simular_bateria', False):
-            capacidade = st.session_state.get('bat_capacidade', 5.0)
-            potencia_bat = st.session_state.get('bat_potencia', 2.5)
-            eficiencia = st.session_state.get('bat_eficiencia', 90)
-            dod = st.session_state.get('bat_dod', 80)
-
-            df_para_bateria = pd.DataFrame({
-                'DataHora': df_pre_bateria['DataHora'],
-                'Excedente_kWh': df_pre_bateria['Injecao_Rede_Final_kWh'],
-                'Consumo_Rede_kWh': df_pre_bateria['Consumo_Rede_Final_kWh']
-            })
-            df_com_bateria = calc.simular_bateria(df_para_bateria, capacidade, potencia_bat, eficiencia, dod)
-            
-            df_simulado_final['Consumo_Rede_Final_kWh'] = df_com_bateria['Consumo_Rede_kWh']
-            df_simulado_final['Injecao_Rede_Final_kWh'] = df_com_bateria['Excedente_kWh']
-
-            
-            # Adiciona as colunas de detalhe da bateria
-            battery_cols = ['Bateria_SoC_kWh', 'Bateria_Carga_kWh', 'Bateria_Descarga_kWh', 'Bateria_Energia_Entregue_kWh']
-            for col in battery_cols:
-                if col in df_com_bateria.columns:
-                    df_simulado_final[col] = df_com_bateria[col]
-                else: # Garante que as colunas existem mesmo que a função de bateria mude
-                    df_simulado_final[col] = 0.0
+            config_bateria = (
+                st.session_state.get('bat_capacidade', 5.0), st.session_state.get('bat_potencia', 2.5),
+                st.session_state.get('bat_eficiencia', 90), st.session_state.get('bat_dod', 80)
+            )
+        df_simulado_final = grafo_calculo.etapa(st.session_state, 'bateria', calc.aplicar_bateria_ao_cenario, df_pre_bateria, config_bateria)
         
         # Guardar os resultados finais no estado da sessão para a interface usar
         st.session_state.df_apos_solar = df_apos_solar
@@ -243,6 +241,43 @@ def calcular_simulacao_callback():
         st.session_state.erro_api_simulacao = erro_api if 'erro_api' in locals() else None
 
 
+# --- Etapas do grafo de cálculo (ver grafo_calculo.py) ---
+# Funções chamadas através de grafo_calculo.etapa: recebem como argumentos tudo aquilo de que dependem.
+def filtrar_diagrama(diagrama, data_inicio, data_fim):
+    return diagrama.intervalo(data_inicio, data_fim).para_dataframe()
+
+def calendario_do_periodo(df_analise, df_omie):
+    return calc.preparar_calendario_tarifario(df_analise['DataHora'], df_omie)
+
+def tabela_analise_consumos(df_consumos, df_omie):
+    consumos_agregados = proc_dados.agregar_consumos_por_periodo(df_consumos, df_omie)
+    omie_medios = proc_dados.calcular_medias_omie_para_todos_ciclos(df_consumos, df_omie)
+    return gfx.criar_tabela_analise_completa_html(consumos_agregados, omie_medios)
+
+def dados_graficos_consumo(df_consumos, df_omie_periodo, opcao_horaria, dias_periodo):
+    """Dados dos gráficos horário, diário, por dia da semana e mensal (consumo vs. OMIE)."""
+    df_merged = pd.merge(df_consumos, df_omie_periodo, on='DataHora', how='inner')
+    dados_horario, dados_diario = gfx.preparar_dados_para_graficos(df_consumos, df_omie_periodo, opcao_horaria, dias_periodo)
+    dados_semana = gfx.preparar_dados_dia_semana(df_merged, {'sel_opcao_horaria': opcao_horaria})
+    dados_mensal = gfx.preparar_dados_mensais(df_merged, {'sel_opcao_horaria': opcao_horaria})
+    return dados_horario, dados_diario, dados_semana, dados_mensal
+
+def comparacao_consumos(df_analise, df_resultado, df_omie):
+    """Consumos por período (inicial e simulado), a tabela comparativa e o DataFrame simulado usado nos gráficos."""
+    consumos_agregados_inicial = proc_dados.agregar_consumos_por_periodo(df_analise, df_omie)
+
+    df_para_tabela_simulada = df_resultado.copy()
+    df_para_tabela_simulada['Consumo (kWh)'] = df_para_tabela_simulada['Consumo_Rede_Final_kWh']
+    df_para_tabela_simulada['Injecao_Rede_kWh'] = df_para_tabela_simulada['Injecao_Rede_Final_kWh']
+    consumos_agregados_simulado = proc_dados.agregar_consumos_por_periodo(df_para_tabela_simulada, df_omie)
+
+    return {
+        'inicial': consumos_agregados_inicial,
+        'simulado': consumos_agregados_simulado,
+        'df_simulado': df_para_tabela_simulada,
+        'tabela_html': gfx.criar_tabela_comparativa_html(consumos_agregados_inicial, consumos_agregados_simulado),
+    }
+
 def exibir_inputs_precos_energia(opcao_horaria_selecionada):
     """
     Gera dinamicamente os campos de input para os preços de energia
@@ -673,15 +708,24 @@ if uploaded_files:
         reset_app_state()
 
         with st.spinner("A processar e validar ficheiros..."):
-            # Usar a nova função de validação
-            df_combinado, erro = proc_dados.validar_e_juntar_ficheiros(uploaded_files)
+            # Os ficheiros são lidos em paralelo; a barra avança à medida que cada um fica validado
+            barra_progresso = st.progress(0.0, text=f"A ler {len(uploaded_files)} ficheiro(s)...") if len(uploaded_files) > 1 else None
+
+            def mostrar_progresso(concluidos, total, nome):
+                if barra_progresso is not None:
+                    barra_progresso.progress(concluidos / total, text=f"Lido '{nome}' ({concluidos}/{total})")
+
+            df_combinado, erro = proc_dados.validar_e_juntar_ficheiros(uploaded_files, progresso=mostrar_progresso)
+            if barra_progresso is not None:
+                barra_progresso.empty()
 
             if erro:
                 st.error(erro)
                 st.session_state.dados_completos_ficheiro = None
             else:
                 st.success("Ficheiros validados e carregados com sucesso!")
-                st.session_state.dados_completos_ficheiro = df_combinado
+                # Guardado em formato compacto (float32 + minutos int64); ver diagrama_carga.DiagramaCarga
+                st.session_state.dados_completos_ficheiro = diagrama_carga.DiagramaCarga.de_dataframe(df_combinado)
                 # Guardar a chave dos ficheiros processados para evitar reprocessamento
                 st.session_state.chave_ficheiros_processados = chave_ficheiros_atuais
                 # Guardar os nomes dos ficheiros para exibição
@@ -712,13 +756,12 @@ is_diagram_mode = 'dados_completos_ficheiro' in st.session_state and st.session_
 # #######################################################################
 if is_diagram_mode:
     # --- PREPARAÇÃO INICIAL E FILTRO DE DATAS ---
-    df_consumos = st.session_state.dados_completos_ficheiro
     st.success(f"Modo Diagrama ativo, usando dados de: {st.session_state.get('nomes_ficheiros_processados', 'ficheiro(s) carregado(s)')}")
 
     # --- PASSO 1: INPUTS E FILTRAGEM INICIAL ---
-    df_consumos_total = st.session_state.dados_completos_ficheiro
-    min_date_ficheiro = df_consumos_total['DataHora'].min().date()
-    max_date_ficheiro = df_consumos_total['DataHora'].max().date()
+    diagrama_total = st.session_state.dados_completos_ficheiro
+    min_date_ficheiro = diagrama_total.primeiro_dia()
+    max_date_ficheiro = diagrama_total.ultimo_dia()
 
     col_f1, col_f2, col_f3 = st.columns(3)
     with col_f1:
@@ -730,24 +773,23 @@ if is_diagram_mode:
     with col_f3:
         gfx.exibir_metrica_personalizada("Nº de Dias", f"{dias} dias")
         
-    df_consumos_bruto_filtrado = df_consumos_total[
-        (df_consumos_total['DataHora'].dt.date >= data_inicio) &
-        (df_consumos_total['DataHora'].dt.date <= data_fim)
-    ].copy()
-
-    # Filtrar o DataFrame para o período selecionado
-    df_analise_original = df_consumos_total[
-        (df_consumos_total['DataHora'].dt.date >= data_inicio) &
-        (df_consumos_total['DataHora'].dt.date <= data_fim)
-    ].copy()
+    # Filtrar o diagrama para o período selecionado (vista sem cópia) e criar um único DataFrame para a análise.
+    # Nenhum dos passos seguintes altera este DataFrame, por isso os dados "brutos" do ficheiro são o mesmo objeto.
+    # Como é uma etapa do grafo de cálculo, enquanto as datas não mudam é sempre o mesmo objeto,
+    # e as etapas seguintes que dependem dele também não são recalculadas.
+    df_analise_original = grafo_calculo.etapa(st.session_state, 'filtro', filtrar_diagrama, diagrama_total, data_inicio, data_fim)
+    df_consumos_bruto_filtrado = df_analise_original
 
     # Guardamos o dataframe na memória para que o callback possa aceder-lhe
     st.session_state.df_analise_original = df_analise_original
 
-    df_omie_filtrado_para_analise = OMIE_CICLOS[
-        (OMIE_CICLOS['DataHora'] >= pd.to_datetime(data_inicio)) &
-        (OMIE_CICLOS['DataHora'] <= pd.to_datetime(data_fim) + pd.Timedelta(hours=23, minutes=59))
-    ].copy()
+    df_omie_filtrado_para_analise = grafo_calculo.etapa(
+        st.session_state, 'omie_periodo', proc_dados.fatia_por_datahora,
+        OMIE_CICLOS, pd.to_datetime(data_inicio), pd.to_datetime(data_fim) + pd.Timedelta(hours=23, minutes=59)
+    )
+
+    # Períodos horários e preço OMIE alinhados com as linhas de consumo (calculado uma vez por filtro de datas)
+    calendario_tarifario = grafo_calculo.etapa(st.session_state, 'calendario', calendario_do_periodo, df_analise_original, OMIE_CICLOS)
 
     # --- PASSO 2: SEPARAÇÃO DAS SECÇÕES ---
     # ##################################################################
@@ -831,16 +873,16 @@ if is_diagram_mode:
 
     # --- PASSO 2: ANÁLISE DE CONSUMOS E GRÁFICOS DO FICHEIRO ---
     st.markdown("##### Análise Detalhada de Consumos e Médias OMIE")
-    consumos_agregados_brutos = proc_dados.agregar_consumos_por_periodo(df_consumos_bruto_filtrado, OMIE_CICLOS)
-    omie_medios_para_tabela_bruta = proc_dados.calcular_medias_omie_para_todos_ciclos(df_consumos_bruto_filtrado, OMIE_CICLOS)
-    tabela_analise_html_bruta = gfx.criar_tabela_analise_completa_html(consumos_agregados_brutos, omie_medios_para_tabela_bruta)
+    tabela_analise_html_bruta = grafo_calculo.etapa(
+        st.session_state, 'tabela_analise_bruta', tabela_analise_consumos, df_consumos_bruto_filtrado, OMIE_CICLOS
+    )
     st.markdown(tabela_analise_html_bruta, unsafe_allow_html=True)
 
     with st.expander("Ver Gráficos de Análise (Consumo do Ficheiro vs. OMIE)"):
-        df_merged_bruto = pd.merge(df_consumos_bruto_filtrado, df_omie_filtrado_para_analise, on='DataHora', how='inner')
-        dados_horario_bruto, dados_diario_bruto = gfx.preparar_dados_para_graficos(df_consumos_bruto_filtrado, df_omie_filtrado_para_analise, st.session_state.sel_opcao_horaria, dias)
-        dados_semana_bruto = gfx.preparar_dados_dia_semana(df_merged_bruto, st.session_state)
-        dados_mensal_bruto = gfx.preparar_dados_mensais(df_merged_bruto, st.session_state)
+        dados_horario_bruto, dados_diario_bruto, dados_semana_bruto, dados_mensal_bruto = grafo_calculo.etapa(
+            st.session_state, 'graficos_brutos', dados_graficos_consumo,
+            df_consumos_bruto_filtrado, df_omie_filtrado_para_analise, st.session_state.sel_opcao_horaria, dias
+        )
 
         if dados_horario_bruto:
             st.components.v1.html(gfx.gerar_grafico_highcharts('grafico_bruto_horario', dados_horario_bruto), height=620)
@@ -1071,18 +1113,22 @@ if is_diagram_mode:
 # ########################################### ###
 
 
+            # Intervalo do dia selecionado (os dados estão ordenados por DataHora, com resolução ao minuto)
+            inicio_dia_grafico = pd.to_datetime(dia_selecionado_para_grafico)
+            fim_dia_grafico = inicio_dia_grafico + pd.Timedelta(hours=23, minutes=59)
+
             # Mostrar Gráfico Solar (se aplicável)
             if simular_paineis_check and 'df_apos_solar' in st.session_state and st.session_state.df_apos_solar is not None:
                 df_solar_res = st.session_state.df_apos_solar
-                df_dia_original = df_analise_original[df_analise_original['DataHora'].dt.date == dia_selecionado_para_grafico].copy()
-                df_dia_exemplo = df_solar_res[df_solar_res['DataHora'].dt.date == dia_selecionado_para_grafico].copy()
+                df_dia_original = proc_dados.fatia_por_datahora(df_analise_original, inicio_dia_grafico, fim_dia_grafico)
+                df_dia_exemplo = proc_dados.fatia_por_datahora(df_solar_res, inicio_dia_grafico, fim_dia_grafico)
                 dados_grafico = {'titulo': 'Produção Solar vs. Consumo Horário (no dia selecionado)', 'categorias': df_dia_exemplo['DataHora'].dt.strftime('%H:%M').tolist(), 'series': [{"name": "Consumo (kWh)", "data": df_dia_original['Consumo (kWh)'].round(3).tolist(), "color": "#2E75B6"}, {"name": "Produção Solar (kWh)", "data": df_dia_exemplo['Producao_Solar_kWh'].round(3).tolist(), "color": "#FFA500"}]}
                 st.components.v1.html(gfx.gerar_grafico_solar('grafico_autoconsumo_solar', dados_grafico), height=420)
 
             # Mostrar Gráfico da Bateria (se aplicável)
             if simular_bateria_check and 'df_simulado_final' in st.session_state and 'Bateria_Carga_kWh' in st.session_state.df_simulado_final.columns and st.session_state.df_simulado_final['Bateria_Carga_kWh'].sum() > 0:
                 df_bateria = st.session_state.df_simulado_final
-                df_dia_bateria = df_bateria[df_bateria['DataHora'].dt.date == dia_selecionado_para_grafico].copy()
+                df_dia_bateria = proc_dados.fatia_por_datahora(df_bateria, inicio_dia_grafico, fim_dia_grafico).copy()
                 df_dia_bateria['Fluxo_Carga_kW'] = df_dia_bateria['Bateria_Carga_kWh'] * 4
                 df_dia_bateria['Fluxo_Descarga_kW'] = -df_dia_bateria['Bateria_Descarga_kWh'] * 4
                 dados_grafico_bat = {'titulo': 'Comportamento da Bateria', 'categorias': df_dia_bateria['DataHora'].dt.strftime('%H:%M').tolist(), 'capacidade_util': st.session_state.bat_capacidade * (st.session_state.bat_dod / 100.0), 'series': [{"name": "Estado de Carga (SoC)", "type": "area", "data": df_dia_bateria['Bateria_SoC_kWh'].round(3).tolist(), "color": "#4472C4", "yAxis": 0}, {"name": "Fluxo (Carga/Descarga)", "type": "column", "data": (df_dia_bateria['Fluxo_Carga_kW'] + df_dia_bateria['Fluxo_Descarga_kW']).round(3).tolist(), "color": "#ED7D31", "yAxis": 1}]}
@@ -1180,30 +1226,25 @@ if is_diagram_mode:
             # --- ANÁLISE DO CONSUMO LÍQUIDO (TABELA E GRÁFICOS) ---
             st.markdown("##### Análise Comparativa de Consumos (Inicial vs. Simulado)")
             
-            df_para_tabela_inicial = df_analise_original.copy()
-            consumos_agregados_inicial = proc_dados.agregar_consumos_por_periodo(df_para_tabela_inicial, OMIE_CICLOS)
-
-            df_para_tabela_simulada = df_resultado.copy()
-            df_para_tabela_simulada['Consumo (kWh)'] = df_para_tabela_simulada['Consumo_Rede_Final_kWh']
-            df_para_tabela_simulada['Injecao_Rede_kWh'] = df_para_tabela_simulada['Injecao_Rede_Final_kWh']
-
-            consumos_agregados_simulado = proc_dados.agregar_consumos_por_periodo(df_para_tabela_simulada, OMIE_CICLOS)
-
-            tabela_comparativa_html = gfx.criar_tabela_comparativa_html(consumos_agregados_inicial, consumos_agregados_simulado)
-            st.markdown(tabela_comparativa_html, unsafe_allow_html=True)
+            comparacao = grafo_calculo.etapa(st.session_state, 'comparacao_consumos', comparacao_consumos, df_analise_original, df_resultado, OMIE_CICLOS)
+            consumos_agregados_inicial = comparacao['inicial']
+            consumos_agregados_simulado = comparacao['simulado']
+            df_para_tabela_simulada = comparacao['df_simulado']
+            st.markdown(comparacao['tabela_html'], unsafe_allow_html=True)
 
             with st.expander("Ver Gráficos de Análise (Consumo Após Simulação vs. OMIE)"):
-                df_merged_liquido = pd.merge(df_para_tabela_simulada, df_omie_filtrado_para_analise, on='DataHora', how='inner')
-                dados_horario_liq, dados_diario_liq = gfx.preparar_dados_para_graficos(df_para_tabela_simulada, df_omie_filtrado_para_analise, st.session_state.sel_opcao_horaria, dias)
-                dados_semana_liq = gfx.preparar_dados_dia_semana(df_merged_liquido, st.session_state)
-                dados_mensal_liq = gfx.preparar_dados_mensais(df_merged_liquido, st.session_state)
+                dados_horario_liq, dados_diario_liq, dados_semana_liq, dados_mensal_liq = grafo_calculo.etapa(
+                    st.session_state, 'graficos_liquidos', dados_graficos_consumo,
+                    df_para_tabela_simulada, df_omie_filtrado_para_analise, st.session_state.sel_opcao_horaria, dias
+                )
                 if dados_horario_liq: st.components.v1.html(gfx.gerar_grafico_highcharts('grafico_liq_horario', dados_horario_liq), height=620)
                 if dados_diario_liq: st.components.v1.html(gfx.gerar_grafico_highcharts('grafico_liq_diario', dados_diario_liq), height=620)
                 if dados_semana_liq: st.components.v1.html(gfx.gerar_grafico_highcharts('grafico_liq_semana', dados_semana_liq), height=620)
                 if dados_mensal_liq: st.components.v1.html(gfx.gerar_grafico_highcharts('grafico_liq_mensal', dados_mensal_liq), height=620)
 
             # Gera os dados do Excel em memória
-            excel_bytes = exportacao.criar_excel_para_simulador_tarifarios(
+            excel_bytes = grafo_calculo.etapa(
+                st.session_state, 'exportacao_tarifarios', exportacao.criar_excel_para_simulador_tarifarios,
                 df_original=st.session_state.df_analise_original,
                 df_simulado=st.session_state.df_simulado_final,
                 nome_cenario=st.session_state.metricas_simulacao_atual['nome']
@@ -1271,13 +1312,11 @@ if is_diagram_mode:
         # --- Bloco de Cálculos Financeiros ---
         with st.spinner("A calcular resultados financeiros..."):
             # 1. Calcular sempre o balanço financeiro do CENÁRIO ATUAL (do ficheiro)
-            df_cenario_atual_financeiro = pd.DataFrame({
-                'DataHora': df_analise_original['DataHora'],
-                'Consumo_Rede_Final_kWh': df_analise_original['Consumo (kWh)'],
-                'Injecao_Rede_Final_kWh': df_analise_original.get('Injecao_Rede_kWh', pd.Series(0))
-            })
+            # (etapas do grafo: mudar só os preços ou a venda recalcula apenas o financeiro e os gráficos)
+            df_cenario_atual_financeiro = grafo_calculo.etapa(st.session_state, 'cenario_atual', calc.cenario_atual_para_financeiro, df_analise_original)
             
-            financeiro_atual = calc.calcular_valor_financeiro_cenario(
+            financeiro_atual = grafo_calculo.etapa(
+                st.session_state, 'financeiro_atual', calc.calcular_valor_financeiro_cenario,
                 df_cenario=df_cenario_atual_financeiro,
                 df_omie_completo=OMIE_CICLOS,
                 precos_compra_kwh_siva=precos_energia_siva,
@@ -1288,7 +1327,8 @@ if is_diagram_mode:
                 modelo_venda=modelo_venda,
                 tipo_comissao=tipo_comissao,
                 valor_comissao=valor_comissao,
-                venda_excedente_ativa=venda_excedente_ativa_ui
+                venda_excedente_ativa=venda_excedente_ativa_ui,
+                calendario_tarifario=calendario_tarifario
             )
             st.session_state.financeiro_atual = financeiro_atual
 
@@ -1299,7 +1339,8 @@ if is_diagram_mode:
                 
                 df_simulado_para_financeiro = st.session_state.df_simulado_final
                 
-                financeiro_simulado = calc.calcular_valor_financeiro_cenario(
+                financeiro_simulado = grafo_calculo.etapa(
+                    st.session_state, 'financeiro_simulado', calc.calcular_valor_financeiro_cenario,
                     df_cenario=df_simulado_para_financeiro,
                     df_omie_completo=OMIE_CICLOS,
                     precos_compra_kwh_siva=precos_energia_siva,
@@ -1310,7 +1351,8 @@ if is_diagram_mode:
                     modelo_venda=modelo_venda,
                     tipo_comissao=tipo_comissao,
                     valor_comissao=valor_comissao,
-                    venda_excedente_ativa=venda_excedente_ativa_ui
+                    venda_excedente_ativa=venda_excedente_ativa_ui,
+                    calendario_tarifario=calendario_tarifario
                 )
                 st.session_state.financeiro_simulado = financeiro_simulado
 
@@ -1600,6 +1642,7 @@ if is_diagram_mode:
 
             parametros_custo_mensal = {
                 'df_omie_completo': OMIE_CICLOS,
+                'calendario_tarifario': calendario_tarifario,
                 'precos_compra_kwh_siva': precos_energia_siva,
                 'potencia_kva': st.session_state.sel_potencia,
                 'opcao_horaria_str': st.session_state.sel_opcao_horaria,
@@ -1613,9 +1656,14 @@ if is_diagram_mode:
             # É a simulação atual + os cenários guardados
             todos_cenarios_simulados = [
                 {"nome": st.session_state.metricas_simulacao_atual['nome'], "dataframe_resultado": st.session_state.df_simulado_final}
-            ] + st.session_state.cenarios_guardados
-
-            dados_grafico_custos = calc.calcular_custos_mensais(
+            ] + [
+                # Só o nome e o DataFrame de cada cenário guardado entram no cálculo (e na chave da etapa)
+                {"nome": cenario['nome'], "dataframe_resultado": cenario['dataframe_resultado']}
+                for cenario in st.session_state.cenarios_guardados
+            ]
+
+            dados_grafico_custos = grafo_calculo.etapa(
+                st.session_state, 'custos_mensais', calc.calcular_custos_mensais,
                 df_analise_original, 
                 todos_cenarios_simulados, 
                 **parametros_custo_mensal
@@ -1713,7 +1761,7 @@ if is_diagram_mode:
             }
 
             # 3. Gerar o PDF e o botão de download
-            pdf_bytes = gfx.gerar_relatorio_pdf(dados_para_relatorio)
+            pdf_bytes = grafo_calculo.etapa(st.session_state, 'relatorio_pdf', gfx.gerar_relatorio_pdf, dados_para_relatorio)
             # --- FIM DO BLOCO ---
 
             # --- BOTÕES DE DOWNLOAD (Relatório Detalhado e Análise Venda Excedente) ---
@@ -1734,7 +1782,8 @@ if is_diagram_mode:
                 
                 st.download_button(
                     label="💹 Descarregar Venda Excedente (Excel)",
-                    data=exportacao.criar_excel_analise_venda_excedente(
+                    data=grafo_calculo.etapa(
+                        st.session_state, 'exportacao_venda_excedente', exportacao.criar_excel_analise_venda_excedente,
                         df_original=st.session_state.df_analise_original,
                         df_simulado=st.session_state.df_simulado_final,
                         df_omie=OMIE_CICLOS,
@@ -1753,6 +1802,152 @@ if is_diagram_mode:
                 )
             # --- FIM DO BOTÃO ---
 
+        def preparar_avaliacao_sistemas(**parametros_especificos):
+            # Dados e parâmetros comuns ao Assistente de Dimensionamento e ao Comparador de Propostas
+            # (cada um acrescenta os seus, ex: as baterias da grelha ou os custos de referência)
+            # A produção de 1 kWp é calculada uma só vez; cada potência é apenas uma multiplicação
+            base_producao = grafo_calculo.etapa(
+                st.session_state, 'base_producao', calc.preparar_base_producao_solar,
+                st.session_state.df_analise_original,
+                st.session_state.solar_latitude, st.session_state.solar_longitude,
+                st.session_state.solar_inclinacao, st.session_state.solar_orientacao_graus,
+                st.session_state.solar_loss,
+                "free" if st.session_state.solar_montagem == "Instalação livre (free-standing)" else "building",
+                st.session_state.distrito_selecionado
+            )
+            dados_dimensionamento = calc.preparar_dados_dimensionamento(
+                st.session_state.df_analise_original, base_producao, st.session_state.solar_sombra, calendario_tarifario
+            )
+            parametros_dimensionamento = {
+                'eficiencia_bateria': st.session_state.bat_eficiencia,
+                'dod_bateria': st.session_state.bat_dod,
+                'precos_energia': precos_energia_siva,
+                'dias': dias,
+                'potencia_kva': st.session_state.sel_potencia,
+                'opcao_horaria': st.session_state.sel_opcao_horaria,
+                'familia_numerosa': is_familia_numerosa,
+                'modelo_venda': modelo_venda,
+                'tipo_comissao': tipo_comissao,
+                'valor_comissao': valor_comissao,
+                'venda_excedente_ativa': venda_excedente_ativa_ui,
+                'financeiro_atual': st.session_state.financeiro_atual,
+                'anos_analise': st.session_state.num_anos_analise,
+                'degradacao': st.session_state.slider_degradacao,
+                'inflacao_energia': st.session_state.slider_inflacao_energia,
+                'variacao_venda': st.session_state.slider_variacao_venda,
+                **parametros_especificos
+            }
+            return dados_dimensionamento, parametros_dimensionamento
+
+        #🎲 Análise de Incerteza (Monte Carlo) da simulação atual
+        if simulacao_pronta_para_mostrar:
+
+            st.markdown("---")
+            st.subheader("🎲 Análise de Incerteza do Investimento")
+
+            with st.expander("Payback e poupanças da simulação atual com anos meteorológicos, preços OMIE e taxas incertos (Monte Carlo)", expanded=False):
+                st.info(
+                    "Cada trajetória sorteia, para cada ano da análise, a produção de um ano meteorológico do PVGIS (2005-2023) "
+                    "e os preços OMIE de um ano histórico, e sorteia as taxas de degradação, inflação e variação do preço de venda "
+                    "à volta dos valores da Projeção a Longo Prazo. O resultado é o intervalo provável do payback e das poupanças."
+                )
+                col_mc1, col_mc2, col_mc3, col_mc4 = st.columns(4)
+                with col_mc1:
+                    num_trajetorias = st.number_input("Trajetórias", min_value=500, max_value=50000, value=5000, step=500)
+                with col_mc2:
+                    desvio_degradacao = st.number_input("Desvio da degradação (p.p.)", min_value=0.0, value=calc.DESVIOS_PADRAO_TAXAS['degradacao'], step=0.1, format="%.1f",
+                                                        help="Desvio padrão da degradação anual dos painéis, em pontos percentuais.")
+                with col_mc3:
+                    desvio_inflacao = st.number_input("Desvio da inflação (p.p.)", min_value=0.0, value=calc.DESVIOS_PADRAO_TAXAS['inflacao_energia'], step=0.5, format="%.1f",
+                                                      help="Desvio padrão da inflação anual do preço da energia, em pontos percentuais.")
+                with col_mc4:
+                    desvio_venda = st.number_input("Desvio da variação de venda (p.p.)", min_value=0.0, value=calc.DESVIOS_PADRAO_TAXAS['variacao_venda'], step=0.5, format="%.1f",
+                                                   help="Desvio padrão da variação anual do valor de venda do excedente, em pontos percentuais.")
+
+                if st.button("Simular Incerteza", use_container_width=True, type="primary"):
+                    with st.spinner("A simular as trajetórias..."):
+                        dados_avaliacao, parametros_avaliacao = preparar_avaliacao_sistemas()
+
+                        # Um perfil por ano meteorológico só existe com o PVGIS (o backup por distrito é um perfil médio)
+                        bases_por_ano = None
+                        if st.session_state.get('fonte_dados_simulacao') == "API PVGIS":
+                            bases_por_ano = grafo_calculo.etapa(
+                                st.session_state, 'bases_producao_anos', calc.preparar_bases_producao_por_ano,
+                                st.session_state.df_analise_original,
+                                st.session_state.solar_latitude, st.session_state.solar_longitude,
+                                st.session_state.solar_inclinacao, st.session_state.solar_orientacao_graus,
+                                st.session_state.solar_loss,
+                                "free" if st.session_state.solar_montagem == "Instalação livre (free-standing)" else "building"
+                            )
+                        omie_por_ano = grafo_calculo.etapa(st.session_state, 'omie_anos', calc.precos_omie_por_ano, calendario_tarifario['DataHora_ns'])
+                        dados_monte_carlo = calc.preparar_dados_monte_carlo(dados_avaliacao, bases_por_ano, st.session_state.solar_sombra, omie_por_ano)
+
+                        resultado_mc = calc.simular_monte_carlo(
+                            dados_monte_carlo, parametros_avaliacao,
+                            potencia_kwp=st.session_state.solar_potencia if st.session_state.get('chk_simular_paineis', False) else 0.0,
+                            bateria=(
+                                (st.session_state.bat_capacidade, st.session_state.bat_potencia) if st.session_state.get('chk_simular_bateria', False)
+                                else (0.0, 0.0)
+                            ),
+                            custo_instalacao=st.session_state.custo_instalacao,
+                            trajetorias=int(num_trajetorias),
+                            desvios_padrao={'degradacao': desvio_degradacao, 'inflacao_energia': desvio_inflacao, 'variacao_venda': desvio_venda}
+                        )
+
+                    percentis_mc = resultado_mc['percentis']
+                    anos_mc = int(st.session_state.num_anos_analise)
+
+                    def formatar_payback_mc(valor):
+                        return formatar_numero_pt(valor, casas_decimais=1, sufixo=" anos") if valor != float('inf') else f">{anos_mc} anos"
+
+                    st.markdown("### Intervalo Provável")
+                    col_p1, col_p2, col_p3 = st.columns(3)
+                    col_p1.metric("Payback P10 (otimista)", formatar_payback_mc(percentis_mc['payback_anos'][10]))
+                    col_p2.metric("Payback P50 (mediano)", formatar_payback_mc(percentis_mc['payback_anos'][50]))
+                    col_p3.metric("Payback P90 (pessimista)", formatar_payback_mc(percentis_mc['payback_anos'][90]))
+                    st.caption(
+                        f"Em {formatar_numero_pt(resultado_mc['probabilidade_payback'] * 100, casas_decimais=0)}% das "
+                        f"{resultado_mc['trajetorias']} trajetórias o investimento é recuperado em {anos_mc} anos. "
+                        "P10/P90: 10% das trajetórias ficam abaixo/acima deste valor."
+                    )
+
+                    df_percentis = pd.DataFrame([
+                        {"Indicador": rotulo, "P10": percentis_mc[chave][10], "P50": percentis_mc[chave][50], "P90": percentis_mc[chave][90]}
+                        for chave, rotulo in [
+                            ('poupanca_primeiro_ano', "Poupança no 1.º Ano (€)"),
+                            ('poupanca_total_periodo', f"Poupança Total em {anos_mc} anos (€)"),
+                            ('poupanca_liquida', f"Poupança Líquida em {anos_mc} anos (€)"),
+                        ]
+                    ])
+                    st.dataframe(df_percentis.style.format(
+                        formatter={coluna: lambda x: formatar_numero_pt(x, casas_decimais=0, sufixo=" €") for coluna in ("P10", "P50", "P90")}
+                    ), hide_index=True, use_container_width=True)
+
+                    acumulado_mc = resultado_mc['fluxo_caixa_acumulado_percentis']
+                    if anos_mc > 0:
+                        dados_grafico_mc = {
+                            'categorias': [f"Ano {i+1}" for i in range(anos_mc)],
+                            'investimento': st.session_state.custo_instalacao,
+                            'series': [
+                                {'name': 'Poupança Acumulada P10', 'type': 'line', 'data': [round(v, 2) for v in acumulado_mc[10]], 'color': '#F45B5B', 'dashStyle': 'shortdash'},
+                                {'name': 'Poupança Acumulada P50', 'type': 'line', 'data': [round(v, 2) for v in acumulado_mc[50]], 'color': '#434348'},
+                                {'name': 'Poupança Acumulada P90', 'type': 'line', 'data': [round(v, 2) for v in acumulado_mc[90]], 'color': '#2B908F', 'dashStyle': 'shortdash'},
+                                {'name': 'Investimento Inicial', 'type': 'line', 'data': [st.session_state.custo_instalacao] * anos_mc,
+                                 'color': '#90ED7D', 'dashStyle': 'shortdot', 'marker': {'enabled': False}}
+                            ]
+                        }
+                        st.components.v1.html(gfx.gerar_grafico_fluxo_caixa('grafico_fluxo_caixa_monte_carlo', dados_grafico_mc), height=420)
+
+                    fonte_meteorologica = (
+                        f"{len(resultado_mc['anos_meteorologicos'])} anos meteorológicos do PVGIS ({resultado_mc['anos_meteorologicos'][0]}-{resultado_mc['anos_meteorologicos'][-1]})"
+                        if bases_por_ano and bases_por_ano['anos'] else "perfil médio (sem anos meteorológicos do PVGIS)"
+                    )
+                    fonte_omie = (
+                        f"calendário e {', '.join(resultado_mc['anos_omie'][1:])} (histórico MIBEL)" if len(resultado_mc['anos_omie']) > 1
+                        else "calendário" + ("" if parametros_avaliacao['modelo_venda'] == 'Indexado ao OMIE' else " (a venda não é indexada ao OMIE)")
+                    )
+                    st.caption(f"Produção sorteada: {fonte_meteorologica}. Preços OMIE sorteados: {fonte_omie}.")
+
         #🛠️ Assistente de Dimensionamento de Sistema
         simulacao_ativa = st.session_state.get('chk_simular_paineis', False) or st.session_state.get('chk_simular_bateria', False)
 
@@ -1772,118 +1967,34 @@ if is_diagram_mode:
                     custo_por_kwh = st.number_input("Custo por kWh de bateria (€)", value=300, step=50)
 
 
-                # Opções de potências e baterias para o utilizador escolher
-                opcoes_paineis_kwp = [0.0, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 12.0, 14.0, 16.0, 18.0, 20.0] # 0.0 representa "Sem novos paineis"
-                opcoes_bateria_kwh = [0.0, 5.0, 7.5, 10.0, 15.0, 20.0, 25.0, 30.0, 35.0, 40.0] # 0.0 representa "Sem Bateria"
-
-                col_dim1, col_dim2 = st.columns(2)
-                with col_dim1:
-                    potencias_a_testar = st.multiselect("Potências de Painéis (kWp) a testar:", opcoes_paineis_kwp, default=[2.0, 3.0, 4.0])
-                with col_dim2:
-                    baterias_a_testar = st.multiselect("Capacidades de Bateria (kWh) a testar:", opcoes_bateria_kwh, default=[0.0, 5.0, 10.0])
-
-                # --- LÓGICA DE CONTROLO E LIMITE ---
-                num_combinacoes = len(potencias_a_testar) * len(baterias_a_testar)
-                LIMITE_COMBINACOES = 16 # O nosso limite prático
-
-                if num_combinacoes > 0:
-                    st.write(f"Total de combinações a calcular: **{num_combinacoes}**")
-
-                botao_desativado = False
-                if num_combinacoes > LIMITE_COMBINACOES:
-                    st.warning(f"Selecionou {num_combinacoes} combinações. Para garantir um tempo de cálculo razoável, por favor selecione um máximo de {LIMITE_COMBINACOES} combinações.")
-                    botao_desativado = True
-                elif num_combinacoes == 0:
-                    botao_desativado = True
-
-                if st.button("Analisar Dimensionamento", disabled=botao_desativado, use_container_width=True, type="primary"):
-                    resultados_dimensionamento = []
-                    barra_progresso = st.progress(0.0, text="A iniciar cálculos...")
-
-                    total_a_calcular = num_combinacoes
-                    calculo_atual = 0
-
-                    # Loop principal que itera por todas as combinações
-                    for p_kwp in potencias_a_testar:
-                        df_solar, _, _ = calc.simular_autoconsumo_completo(
-                            st.session_state.df_analise_original, p_kwp,
-                            st.session_state.solar_latitude, st.session_state.solar_longitude,
-                            st.session_state.solar_inclinacao, st.session_state.solar_orientacao_graus,
-                            st.session_state.solar_loss,
-                            "free" if st.session_state.solar_montagem == "Instalação livre (free-standing)" else "building",
-                            st.session_state.distrito_selecionado,
-                            st.session_state.solar_sombra
-                        )
-                        df_pre_bateria_cenario = calc.aplicar_simulacao_solar_aos_dados_base(st.session_state.df_analise_original, df_solar)
-
-                        for b_kwh in baterias_a_testar:
-                            calculo_atual += 1
-                            percentagem = calculo_atual / total_a_calcular
-                            barra_progresso.progress(percentagem, text=f"A calcular {calculo_atual}/{total_a_calcular}: Painéis {p_kwp:.1f} kWp, Bateria {b_kwh:.1f} kWh...")
-
-                            df_para_bateria = df_pre_bateria_cenario[['DataHora', 'Injecao_Rede_Final_kWh', 'Consumo_Rede_Final_kWh']].copy()
-                            df_para_bateria.rename(columns={'Injecao_Rede_Final_kWh': 'Excedente_kWh', 'Consumo_Rede_Final_kWh': 'Consumo_Rede_kWh'}, inplace=True)
-
-                            if b_kwh > 0:
-                                df_com_bateria = calc.simular_bateria(
-                                    df_com_solar=df_para_bateria,
-                                    capacidade_kwh=b_kwh, potencia_kw=b_kwh/2,
-                                    eficiencia_perc=st.session_state.bat_eficiencia, dod_perc=st.session_state.bat_dod
-                                )
-                                # Renomeamos as colunas aqui para o padrão esperado pela função financeira
-                                df_final_cenario = df_com_bateria.rename(columns={'Consumo_Rede_kWh': 'Consumo_Rede_Final_kWh', 'Excedente_kWh': 'Injecao_Rede_Final_kWh'})
-                            else:
-                                # Se não há bateria, apenas renomeamos as colunas do cenário solar
-                                df_final_cenario = df_para_bateria.rename(columns={'Consumo_Rede_kWh': 'Consumo_Rede_Final_kWh', 'Excedente_kWh': 'Injecao_Rede_Final_kWh'})
-
-                            # --- INÍCIO DO BLOCO DE CÁLCULO FINANCEIRO ---
-                            financeiro_cenario = calc.calcular_valor_financeiro_cenario(
-                                df_cenario=df_final_cenario,
-                                df_omie_completo=OMIE_CICLOS,
-                                precos_compra_kwh_siva=precos_energia_siva,
-                                dias_calculo=dias,
-                                potencia_kva=st.session_state.sel_potencia,
-                                opcao_horaria_str=st.session_state.sel_opcao_horaria,
-                                familia_numerosa_bool=is_familia_numerosa,
-                                modelo_venda=modelo_venda,
-                                tipo_comissao=tipo_comissao,
-                                valor_comissao=valor_comissao
-                            )
-
-                            # Calcula as poupanças anuais base para o payback
-                            financeiro_atual = st.session_state.financeiro_atual
-                            custo_evitado_periodo = financeiro_atual['custo_compra_c_iva'] - financeiro_cenario['custo_compra_c_iva']
-                            receita_adicional_periodo = financeiro_cenario['receita_venda'] - financeiro_atual['receita_venda']
-                            custo_evitado_anual = (custo_evitado_periodo * (365.25 / dias)) if dias > 0 else 0
-                            receita_adicional_anual = (receita_adicional_periodo * (365.25 / dias)) if dias > 0 else 0
-                            poupanca_anual_total = custo_evitado_anual + receita_adicional_anual
-
-                            custo_estimado = p_kwp * custo_por_kwp + b_kwh * custo_por_kwh
-
-                            # Chama o payback com as variáveis corretas
-                            analise_lp = calc.calcular_analise_longo_prazo(
-                                custo_instalacao=custo_estimado, # Usa o custo estimado para este cenário
-                                poupanca_autoconsumo_anual_base=custo_evitado_anual,
-                                poupanca_venda_anual_base=receita_adicional_anual,
-                                anos_analise=st.session_state.num_anos_analise, # Obtém da UI principal
-                                taxa_degradacao_perc=st.session_state.slider_degradacao,
-                                taxa_inflacao_energia_perc=st.session_state.slider_inflacao_energia,
-                                taxa_variacao_venda_perc=st.session_state.slider_variacao_venda
-                            )
-
-                            resultados_dimensionamento.append({
-                                "Painéis (kWp)": p_kwp,
-                                "Bateria (kWh)": b_kwh,
-                                "Custo Estimado (€)": custo_estimado,
-                                "Poupança Anual (€)": round(poupanca_anual_total),
-                                "Payback (anos)": round(analise_lp['payback_detalhado'], 1) if analise_lp['payback_detalhado'] != float('inf') else '>30'
-                            })
-
-                    barra_progresso.empty()
-
-                    if resultados_dimensionamento:
-                        df_resultados = pd.DataFrame(resultados_dimensionamento)
-                        st.markdown("### Resultados Comparativos")
+                modo_dimensionamento = st.radio("Modo", ["Comparar opções", "Procurar o ótimo"], horizontal=True, key="modo_dimensionamento")
+
+                if modo_dimensionamento == "Comparar opções":
+                    # Opções de potências e baterias para o utilizador escolher
+                    opcoes_paineis_kwp = [0.0, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 12.0, 14.0, 16.0, 18.0, 20.0] # 0.0 representa "Sem novos paineis"
+                    opcoes_bateria_kwh = [0.0, 5.0, 7.5, 10.0, 15.0, 20.0, 25.0, 30.0, 35.0, 40.0] # 0.0 representa "Sem Bateria"
+
+                    col_dim1, col_dim2 = st.columns(2)
+                    with col_dim1:
+                        potencias_a_testar = st.multiselect("Potências de Painéis (kWp) a testar:", opcoes_paineis_kwp, default=[2.0, 3.0, 4.0])
+                    with col_dim2:
+                        baterias_a_testar = st.multiselect("Capacidades de Bateria (kWh) a testar:", opcoes_bateria_kwh, default=[0.0, 5.0, 10.0])
+
+                    num_combinacoes = len(potencias_a_testar) * len(baterias_a_testar)
+                    if num_combinacoes > 0:
+                        st.write(f"Total de combinações a calcular: **{num_combinacoes}**")
+
+                    def mostrar_resultados_dimensionamento(espaco, resultados):
+                        # Tabela pela ordem das opções escolhidas (as potências terminam por qualquer ordem)
+                        resultados = sorted(resultados, key=lambda r: (potencias_a_testar.index(r['potencia_kwp']), baterias_a_testar.index(r['capacidade_kwh'])))
+                        df_resultados = pd.DataFrame([{
+                            "Painéis (kWp)": r['potencia_kwp'],
+                            "Bateria (kWh)": r['capacidade_kwh'],
+                            "Custo Estimado (€)": r['custo_estimado'],
+                            "Poupança Anual (€)": round(r['poupanca_anual']),
+                            # Sem retorno no horizonte de análise: NaN, mostrado como '>30'
+                            "Payback (anos)": round(r['payback_anos'], 1) if r['payback_anos'] != float('inf') else float('nan')
+                        } for r in resultados])
                         df_resultados_styled = df_resultados.style.highlight_min(
                             subset=['Payback (anos)'], color='lightgreen'
                         ).format(
@@ -1893,11 +2004,90 @@ if is_diagram_mode:
                                 "Poupança Anual (€)": lambda x: formatar_numero_pt(x, casas_decimais=0, sufixo=" €"),
                                 "Painéis (kWp)": lambda x: formatar_numero_pt(x, casas_decimais=1),
                                 "Bateria (kWh)": lambda x: formatar_numero_pt(x, casas_decimais=1),
-                                # Lógica especial para o Payback, para não formatar o texto '>30'
-                                "Payback (anos)": lambda x: formatar_numero_pt(x, casas_decimais=1) if isinstance(x, (int, float)) else x
+                                "Payback (anos)": lambda x: formatar_numero_pt(x, casas_decimais=1) if pd.notna(x) else '>30'
                             }
                         )
-                        st.dataframe(df_resultados_styled, use_container_width=True)
+                        espaco.dataframe(df_resultados_styled, use_container_width=True)
+
+                    if st.button("Analisar Dimensionamento", disabled=num_combinacoes == 0, use_container_width=True, type="primary"):
+                        resultados_dimensionamento = []
+                        barra_progresso = st.progress(0.0, text="A iniciar cálculos...")
+                        st.markdown("### Resultados Comparativos")
+                        espaco_resultados = st.empty()
+
+                        dados_dimensionamento, parametros_dimensionamento = preparar_avaliacao_sistemas(
+                            baterias_kwh=list(baterias_a_testar), custo_por_kwp=custo_por_kwp, custo_por_kwh=custo_por_kwh
+                        )
+
+                        # As potências são avaliadas em paralelo; a tabela vai sendo preenchida à medida que terminam
+                        for resultados_potencia in calc.varrer_dimensionamento(dados_dimensionamento, parametros_dimensionamento, potencias_a_testar):
+                            resultados_dimensionamento.extend(resultados_potencia)
+                            barra_progresso.progress(
+                                len(resultados_dimensionamento) / num_combinacoes,
+                                text=f"Calculadas {len(resultados_dimensionamento)}/{num_combinacoes} combinações (Painéis {resultados_potencia[0]['potencia_kwp']:.1f} kWp)..."
+                            )
+                            mostrar_resultados_dimensionamento(espaco_resultados, resultados_dimensionamento)
+
+                        barra_progresso.empty()
+
+                else:
+                    st.caption("Procura a combinação de painéis e bateria que otimiza o objetivo escolhido dentro dos intervalos indicados, avaliando apenas uma pequena parte das combinações possíveis.")
+                    col_opt1, col_opt2 = st.columns(2)
+                    with col_opt1:
+                        intervalo_kwp = st.slider("Potência de Painéis (kWp) entre:", 0.0, 20.0, (1.0, 10.0), step=0.1)
+                    with col_opt2:
+                        intervalo_kwh = st.slider("Capacidade de Bateria (kWh) entre:", 0.0, 40.0, (0.0, 20.0), step=0.5)
+                    col_opt3, col_opt4 = st.columns(2)
+                    with col_opt3:
+                        objetivo_otimizacao = st.selectbox("Objetivo", list(calc.OBJETIVOS_OTIMIZACAO), format_func=calc.OBJETIVOS_OTIMIZACAO.get)
+                    with col_opt4:
+                        taxa_desconto = st.number_input("Taxa de desconto para o VAL (%)", value=4.0, step=0.5, format="%.1f", disabled=objetivo_otimizacao != 'val')
+
+                    if st.button("Procurar Dimensionamento Ótimo", use_container_width=True, type="primary"):
+                        dados_dimensionamento, parametros_dimensionamento = preparar_avaliacao_sistemas(
+                            custo_por_kwp=custo_por_kwp, custo_por_kwh=custo_por_kwh, taxa_desconto=taxa_desconto
+                        )
+                        aviso_progresso = st.empty()
+                        resultado_otimizacao = calc.otimizar_dimensionamento(
+                            dados_dimensionamento, parametros_dimensionamento, objetivo_otimizacao,
+                            intervalo_kwp, intervalo_kwh, passo_kwp=0.1, passo_kwh=0.5,
+                            progresso=lambda avaliados: aviso_progresso.caption(f"⏳ {avaliados} combinações avaliadas...")
+                        )
+                        aviso_progresso.empty()
+
+                        melhor = resultado_otimizacao['melhor']
+                        st.markdown(f"### Dimensionamento Ótimo: {calc.OBJETIVOS_OTIMIZACAO[objetivo_otimizacao]}")
+                        col_res1, col_res2, col_res3 = st.columns(3)
+                        col_res1.metric("Painéis", formatar_numero_pt(melhor['potencia_kwp'], casas_decimais=1, sufixo=" kWp"))
+                        col_res2.metric("Bateria", formatar_numero_pt(melhor['capacidade_kwh'], casas_decimais=1, sufixo=" kWh") if melhor['capacidade_kwh'] > 0 else "Sem bateria")
+                        col_res3.metric("Custo Estimado", formatar_numero_pt(melhor['custo_estimado'], casas_decimais=0, sufixo=" €"))
+                        col_res4, col_res5, col_res6 = st.columns(3)
+                        col_res4.metric("Poupança Anual", formatar_numero_pt(melhor['poupanca_anual'], casas_decimais=0, sufixo=" €"))
+                        col_res5.metric("Payback", formatar_numero_pt(melhor['payback_anos'], casas_decimais=1, sufixo=" anos") if melhor['payback_anos'] != float('inf') else ">30 anos")
+                        col_res6.metric(f"Poupança Líquida em {int(st.session_state.num_anos_analise)} anos", formatar_numero_pt(melhor['poupanca_liquida'], casas_decimais=0, sufixo=" €"),
+                                        help="Poupança acumulada no período de análise, descontado o custo estimado da instalação.")
+                        st.caption(f"Foram avaliadas {len(resultado_otimizacao['avaliados'])} combinações, em vez das {resultado_otimizacao['pontos_grelha']} de uma grelha com passos de 0,1 kWp e 0,5 kWh.")
+
+                        st.markdown("#### Fronteira de Pareto: Custo vs Poupança Anual")
+                        st.caption("Combinações avaliadas em que nenhuma outra poupa o mesmo ou mais por um custo igual ou inferior.")
+                        df_pareto = pd.DataFrame([{
+                            "Painéis (kWp)": r['potencia_kwp'],
+                            "Bateria (kWh)": r['capacidade_kwh'],
+                            "Custo Estimado (€)": r['custo_estimado'],
+                            "Poupança Anual (€)": round(r['poupanca_anual']),
+                            "Payback (anos)": round(r['payback_anos'], 1) if r['payback_anos'] != float('inf') else float('nan'),
+                            "VAL (€)": round(r['val'])
+                        } for r in resultado_otimizacao['fronteira_pareto']])
+                        st.dataframe(df_pareto.style.format(
+                            formatter={
+                                "Custo Estimado (€)": lambda x: formatar_numero_pt(x, casas_decimais=0, sufixo=" €"),
+                                "Poupança Anual (€)": lambda x: formatar_numero_pt(x, casas_decimais=0, sufixo=" €"),
+                                "VAL (€)": lambda x: formatar_numero_pt(x, casas_decimais=0, sufixo=" €"),
+                                "Painéis (kWp)": lambda x: formatar_numero_pt(x, casas_decimais=1),
+                                "Bateria (kWh)": lambda x: formatar_numero_pt(x, casas_decimais=1),
+                                "Payback (anos)": lambda x: formatar_numero_pt(x, casas_decimais=1) if pd.notna(x) else '>30'
+                            }
+                        ), use_container_width=True)
 
         st.markdown("---")
         st.subheader("⚖️ Comparador de Propostas Comerciais")
@@ -1961,77 +2151,21 @@ if is_diagram_mode:
                     if not st.session_state.propostas_comerciais:
                         st.warning("Por favor, adicione pelo menos uma proposta antes de comparar.")
                     else:
-                        resultados_finais = []
-                        barra_progresso = st.progress(0.0, text="A iniciar comparação...")
-
-                        num_propostas = len(st.session_state.propostas_comerciais)
-                        
-                        # Loop principal que calcula cada proposta
-                        for i, prop in enumerate(st.session_state.propostas_comerciais):
-                            barra_progresso.progress((i + 1) / num_propostas, text=f"A simular: {prop['nome']}...")
-
-                            # 1. Simulação Solar
-                            df_solar, _, _ = calc.simular_autoconsumo_completo(
-                                st.session_state.df_analise_original, prop['kwp'],
-                                st.session_state.solar_latitude, st.session_state.solar_longitude,
-                                st.session_state.solar_inclinacao, st.session_state.solar_orientacao_graus,
-                                st.session_state.solar_loss,
-                                "free" if st.session_state.solar_montagem == "Instalação livre (free-standing)" else "building",
-                                st.session_state.distrito_selecionado,
-                                st.session_state.solar_sombra
-                            )
-                            df_pre_bateria_prop = calc.aplicar_simulacao_solar_aos_dados_base(st.session_state.df_analise_original, df_solar)
-
-                            # 2. Simulação da Bateria (se aplicável)
-                            df_final_prop = df_pre_bateria_prop.copy()
-                            if prop['kwh_bat'] > 0:
-                                df_para_bateria_prop = df_pre_bateria_prop.rename(columns={'Injecao_Rede_Final_kWh': 'Excedente_kWh', 'Consumo_Rede_Final_kWh': 'Consumo_Rede_kWh'})
-                                
-                                # Passo 1: Correr a simulação da bateria
-                                df_com_bateria_resultado = calc.simular_bateria(
-                                    df_para_bateria_prop, prop['kwh_bat'], prop['kwh_bat']/2,
-                                    st.session_state.bat_eficiencia, st.session_state.bat_dod
-                                )
-
-                                # Passo 2: Renomear as colunas de volta para o nome esperado pela função financeira
-                                df_final_prop = df_com_bateria_resultado.rename(columns={
-                                    'Consumo_Rede_kWh': 'Consumo_Rede_Final_kWh', 
-                                    'Excedente_kWh': 'Injecao_Rede_Final_kWh'
-                                })
-
-                            # 3. Cálculo Financeiro
-                            financeiro_prop = calc.calcular_valor_financeiro_cenario(
-                                df_cenario=df_final_prop, df_omie_completo=OMIE_CICLOS,
-                                precos_compra_kwh_siva=precos_energia_siva, dias_calculo=dias,
-                                potencia_kva=st.session_state.sel_potencia, opcao_horaria_str=st.session_state.sel_opcao_horaria,
-                                familia_numerosa_bool=is_familia_numerosa, modelo_venda=modelo_venda,
-                                tipo_comissao=tipo_comissao, valor_comissao=valor_comissao, venda_excedente_ativa=venda_excedente_ativa_ui
-                            )
+                        # Propostas com a mesma potência partilham a simulação solar, e com a mesma bateria o despacho;
+                        # as potências distintas são calculadas em paralelo
+                        with st.spinner(f"A simular {len(st.session_state.propostas_comerciais)} proposta(s)..."):
+                            dados_propostas, parametros_propostas = preparar_avaliacao_sistemas()
+                            avaliacoes_propostas = calc.avaliar_propostas(dados_propostas, parametros_propostas, st.session_state.propostas_comerciais)
+
+                        resultados_finais = [{
+                            "Proposta": prop['nome'], "Painéis (kWp)": prop['kwp'], "Bateria (kWh)": prop['kwh_bat'],
+                            "Custo Total (€)": prop['custo'], "Poupança Anual (€)": prop['poupanca_anual'],
+                            "ROI Anual (%)": prop['roi_simples_anual'],
+                            "TIR (%)": prop['tir'],
+                            "Payback (anos)": prop['payback_anos'],
+                            "Poupança a 25 anos (€)": prop['poupanca_total_periodo'] if st.session_state.num_anos_analise == 25 else "N/A"
+                        } for prop in avaliacoes_propostas]
 
-                            # 4. Cálculo do Payback
-                            financeiro_atual = st.session_state.financeiro_atual
-                            custo_evitado_anual = ((financeiro_atual['custo_compra_c_iva'] - financeiro_prop['custo_compra_c_iva']) * (365.25 / dias))
-                            receita_adicional_anual = ((financeiro_prop['receita_venda'] - financeiro_atual['receita_venda']) * (365.25 / dias))
-                            
-                            analise_lp = calc.calcular_analise_longo_prazo(
-                                custo_instalacao=prop['custo'], poupanca_autoconsumo_anual_base=custo_evitado_anual,
-                                poupanca_venda_anual_base=receita_adicional_anual, anos_analise=st.session_state.num_anos_analise,
-                                taxa_degradacao_perc=st.session_state.slider_degradacao, taxa_inflacao_energia_perc=st.session_state.slider_inflacao_energia,
-                                taxa_variacao_venda_perc=st.session_state.slider_variacao_venda
-                            )
-
-                            # Guardar os resultados para esta proposta
-                            resultados_finais.append({
-                                "Proposta": prop['nome'], "Painéis (kWp)": prop['kwp'], "Bateria (kWh)": prop['kwh_bat'],
-                                "Custo Total (€)": prop['custo'], "Poupança Anual (€)": custo_evitado_anual + receita_adicional_anual,
-                                # --- Adicionar ROI aos resultados ---
-                                "ROI Anual (%)": analise_lp['roi_simples_anual'],
-                                "Payback (anos)": analise_lp['payback_detalhado'],
-                                "Poupança a 25 anos (€)": analise_lp['poupanca_total_periodo'] if st.session_state.num_anos_analise == 25 else "N/A"
-                            })
-
-                        
-                        barra_progresso.empty()
                         st.session_state.resultados_comparacao = resultados_finais # Guardar no estado para exibição
                         st.rerun()
 
@@ -2045,13 +2179,14 @@ if is_diagram_mode:
                 df_resultados_styled = df_resultados.style.highlight_min(
                     subset=['Payback (anos)'], color='#D4EDDA'
                 ).highlight_max(
-                    subset=['Poupança Anual (€)', 'Poupança a 25 anos (€)', 'ROI Anual (%)'], color='#D4EDDA' # Adicionar ROI aqui
+                    subset=['Poupança Anual (€)', 'Poupança a 25 anos (€)', 'ROI Anual (%)', 'TIR (%)'], color='#D4EDDA' # Adicionar ROI aqui
                 ).format(formatter={
                     "Custo Total (€)": lambda x: formatar_numero_pt(x, casas_decimais=0, sufixo=" €"),
                     "Poupança Anual (€)": lambda x: formatar_numero_pt(x, casas_decimais=0, sufixo=" €"),
                     "Poupança a 25 anos (€)": lambda x: formatar_numero_pt(x, casas_decimais=0, sufixo=" €") if isinstance(x, (int, float)) else x,
                     "Payback (anos)": lambda x: formatar_numero_pt(x, casas_decimais=1) if x != float('inf') else '>30',
                     "ROI Anual (%)": lambda x: formatar_numero_pt(x, casas_decimais=1, sufixo=" %"), # Adicionar formatação para ROI
+                    "TIR (%)": lambda x: formatar_numero_pt(x, casas_decimais=1, sufixo=" %") if pd.notna(x) else '-',
                     "Painéis (kWp)": "{:.2f}", "Bateria (kWh)": "{:.1f}",
                 })
                 st.dataframe(df_resultados_styled, use_container_width=True, hide_index=True)
@@ -0,0 +1,227 @@
+# --- Armazém de preços MIBEL particionado por ano ---
+#
+# Os preços quarto-horários (Data, Hora, Preco_PT, Preco_ES, em hora de Espanha) ficam num CSV por ano
+# (data/mibel/MIBEL_AAAA.csv) e num pequeno manifesto JSON com os dias cobertos por cada ano.
+# A atualização diária só toca nos anos com dias novos ou alterados: dias novos no fim do ano são
+# acrescentados ao ficheiro (append); só uma correção a um dia já existente obriga a reescrever esse ano.
+# Quem lê (Fase 2, aplicação) carrega apenas os anos de que precisa.
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+DIRETORIO_ARMAZEM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "mibel")
+FICHEIRO_MANIFESTO = "manifesto.json"
+MODELO_FICHEIRO_ANO = "MIBEL_{ano}.csv"
+VERSAO_MANIFESTO = 1
+
+COLUNAS = ['Data', 'Hora', 'Preco_PT', 'Preco_ES']
+FORMATO_PRECO = "%.2f"
+CASAS_DECIMAIS = 2
+
+
+def _escrever_atomico(caminho, conteudo):
+    """Substitui 'caminho' por 'conteudo' (texto) de forma atómica: ficheiro temporário + rename."""
+    diretorio = os.path.dirname(caminho)
+    fd, caminho_tmp = tempfile.mkstemp(dir=diretorio, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(conteudo)
+        os.chmod(caminho_tmp, 0o644)
+        os.replace(caminho_tmp, caminho)
+    except BaseException:
+        if os.path.exists(caminho_tmp):
+            os.remove(caminho_tmp)
+        raise
+
+
+def _caminho_ano(ano, diretorio):
+    return os.path.join(diretorio, MODELO_FICHEIRO_ANO.format(ano=ano))
+
+
+def _normalizar(df):
+    """
+    Deixa os registos no formato do armazém: Data (datetime64, dia), Hora (int64) e preços
+    arredondados às casas decimais gravadas, sem linhas incompletas nem (Data, Hora) repetidos
+    (fica o último), ordenados por Data e Hora.
+    """
+    df = pd.DataFrame({
+        'Data': pd.to_datetime(df['Data']).dt.normalize(),
+        'Hora': pd.to_numeric(df['Hora'], errors='coerce'),
+        'Preco_PT': pd.to_numeric(df['Preco_PT'], errors='coerce').round(CASAS_DECIMAIS),
+        'Preco_ES': pd.to_numeric(df['Preco_ES'], errors='coerce').round(CASAS_DECIMAIS),
+    })
+    df = df.dropna(subset=['Data', 'Hora', 'Preco_PT'])
+    df['Hora'] = df['Hora'].astype(np.int64)
+    df = df.drop_duplicates(['Data', 'Hora'], keep='last')
+    return df.sort_values(['Data', 'Hora']).reset_index(drop=True)
+
+
+def _para_csv(df, com_cabecalho):
+    return df[COLUNAS].to_csv(index=False, header=com_cabecalho, float_format=FORMATO_PRECO,
+                     date_format="%Y-%m-%d", lineterminator="\n")
+
+
+def _tabela_vazia():
+    return pd.DataFrame({'Data': pd.Series(dtype='datetime64[ns]'), 'Hora': pd.Series(dtype=np.int64),
+                         'Preco_PT': pd.Series(dtype=np.float64), 'Preco_ES': pd.Series(dtype=np.float64)})
+
+
+def _ler_ano(ano, diretorio):
+    caminho = _caminho_ano(ano, diretorio)
+    if not os.path.exists(caminho):
+        return _tabela_vazia()
+    return pd.read_csv(caminho, parse_dates=['Data'], dtype={'Hora': np.int64})
+
+
+def _intervalos_dias(dias):
+    """Comprime uma lista ordenada de dias em intervalos contínuos ['AAAA-MM-DD/AAAA-MM-DD', ...]."""
+    intervalos = []
+    for dia in dias:
+        if intervalos and dia - intervalos[-1][1] == timedelta(days=1):
+            intervalos[-1][1] = dia
+        else:
+            intervalos.append([dia, dia])
+    return [f"{inicio.isoformat()}/{fim.isoformat()}" for inicio, fim in intervalos]
+
+
+def _resumo_ano(df_ano, ano):
+    dias = sorted(df_ano['Data'].dt.date.unique())
+    return {
+        'ficheiro': MODELO_FICHEIRO_ANO.format(ano=ano),
+        'registos': int(len(df_ano)),
+        'dias': len(dias),
+        'primeiro_dia': dias[0].isoformat() if dias else None,
+        'ultimo_dia': dias[-1].isoformat() if dias else None,
+        'intervalos': _intervalos_dias(dias),
+    }
+
+
+def ler_manifesto(diretorio=DIRETORIO_ARMAZEM):
+    """Devolve o manifesto do armazém ({'versao', 'anos': {ano (str): resumo}}), ou None se não existir."""
+    caminho = os.path.join(diretorio, FICHEIRO_MANIFESTO)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _gravar_manifesto(manifesto, diretorio):
+    manifesto['anos'] = dict(sorted(manifesto['anos'].items()))
+    _escrever_atomico(os.path.join(diretorio, FICHEIRO_MANIFESTO),
+                      json.dumps(manifesto, indent=2, ensure_ascii=False) + "\n")
+
+
+def anos_disponiveis(diretorio=DIRETORIO_ARMAZEM):
+    """Lista (int, ordenada) dos anos com dados no armazém."""
+    manifesto = ler_manifesto(diretorio)
+    return sorted(int(ano) for ano in manifesto['anos']) if manifesto else []
+
+
+def ler_precos(anos=None, data_inicio=None, data_fim=None, diretorio=DIRETORIO_ARMAZEM):
+    """
+    Lê os preços do armazém, carregando só os ficheiros dos anos necessários.
+
+    'anos' limita os anos lidos (por omissão todos os do manifesto); 'data_inicio' e 'data_fim'
+    (inclusive) limitam também os dias. Retorna um DataFrame com as colunas Data (datetime64),
+    Hora, Preco_PT e Preco_ES, ordenado por Data e Hora (vazio se o armazém não existir).
+    """
+    selecionados = anos_disponiveis(diretorio)
+    if anos is not None:
+        anos = {int(ano) for ano in anos}
+        selecionados = [ano for ano in selecionados if ano in anos]
+    if data_inicio is not None:
+        data_inicio = pd.Timestamp(data_inicio).normalize()
+        selecionados = [ano for ano in selecionados if ano >= data_inicio.year]
+    if data_fim is not None:
+        data_fim = pd.Timestamp(data_fim).normalize()
+        selecionados = [ano for ano in selecionados if ano <= data_fim.year]
+
+    df = pd.concat([_ler_ano(ano, diretorio) for ano in selecionados] or [_tabela_vazia()], ignore_index=True)
+    if data_inicio is not None:
+        df = df[df['Data'] >= data_inicio]
+    if data_fim is not None:
+        df = df[df['Data'] <= data_fim]
+    return df.reset_index(drop=True)
+
+
+def _dias_alterados(existente, novos):
+    """
+    Dias de 'novos' que não existem em 'existente' ou cujos registos (Hora e preços) são diferentes.
+    Ambos os DataFrames já normalizados e ordenados.
+    """
+    valores_existentes = {
+        dia: grupo[['Hora', 'Preco_PT', 'Preco_ES']].to_numpy(dtype=np.float64)
+        for dia, grupo in existente.groupby('Data', sort=False)
+    }
+    alterados = []
+    for dia, grupo in novos.groupby('Data', sort=True):
+        anteriores = valores_existentes.get(dia)
+        valores = grupo[['Hora', 'Preco_PT', 'Preco_ES']].to_numpy(dtype=np.float64)
+        if anteriores is None or anteriores.shape != valores.shape or not np.array_equal(anteriores, valores, equal_nan=True):
+            alterados.append(dia)
+    return alterados
+
+
+def gravar_dias(df, diretorio=DIRETORIO_ARMAZEM):
+    """
+    Integra no armazém os dias presentes em 'df' (colunas Data, Hora, Preco_PT, Preco_ES).
+
+    Cada dia de 'df' substitui por inteiro o mesmo dia no armazém; dias iguais aos já gravados
+    são ignorados e os dias que não aparecem em 'df' ficam como estão. Por cada ano tocado:
+    se todos os dias alterados são novos e posteriores ao último dia do ano, as linhas são
+    acrescentadas ao fim do ficheiro; caso contrário, só esse ano é reescrito (de forma atómica).
+    O manifesto é atualizado no fim.
+
+    Retorna {'dias_novos': [...], 'dias_substituidos': [...], 'anos_acrescentados': [...],
+    'anos_reescritos': [...]} (dias como datetime.date, anos como int).
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    manifesto = ler_manifesto(diretorio) or {'versao': VERSAO_MANIFESTO, 'anos': {}}
+    novos = _normalizar(df)
+    resumo = {'dias_novos': [], 'dias_substituidos': [], 'anos_acrescentados': [], 'anos_reescritos': []}
+
+    for ano, novos_ano in novos.groupby(novos['Data'].dt.year, sort=True):
+        ano = int(ano)
+        caminho = _caminho_ano(ano, diretorio)
+        existente = _ler_ano(ano, diretorio)
+        alterados = _dias_alterados(existente, novos_ano)
+        if not alterados:
+            continue
+
+        dias_existentes = set(existente['Data'])
+        substituidos = [dia for dia in alterados if dia in dias_existentes]
+        acrescentar = os.path.exists(caminho) and not substituidos and (
+            existente.empty or min(alterados) > existente['Data'].max())
+
+        linhas_alteradas = novos_ano[novos_ano['Data'].isin(alterados)]
+        if acrescentar:
+            with open(caminho, "a", encoding="utf-8", newline="") as f:
+                f.write(_para_csv(linhas_alteradas, com_cabecalho=False))
+            final = pd.concat([existente, linhas_alteradas], ignore_index=True)
+            resumo['anos_acrescentados'].append(ano)
+        else:
+            final = pd.concat([existente[~existente['Data'].isin(alterados)], linhas_alteradas], ignore_index=True)
+            final = final.sort_values(['Data', 'Hora']).reset_index(drop=True)
+            _escrever_atomico(caminho, _para_csv(final, com_cabecalho=True))
+            resumo['anos_reescritos'].append(ano)
+
+        manifesto['anos'][str(ano)] = _resumo_ano(final, ano)
+        resumo['dias_novos'].extend(dia.date() for dia in alterados if dia not in dias_existentes)
+        resumo['dias_substituidos'].extend(dia.date() for dia in substituidos)
+
+    if resumo['anos_acrescentados'] or resumo['anos_reescritos'] or not os.path.exists(os.path.join(diretorio, FICHEIRO_MANIFESTO)):
+        _gravar_manifesto(manifesto, diretorio)
+    return resumo
+
+
+def migrar_csv_unico(caminho_csv, diretorio=DIRETORIO_ARMAZEM):
+    """
+    Cria (ou completa) o armazém a partir de um CSV único no formato antigo
+    (ex: data/MIBEL_ano_atual_ACUM.csv). Retorna o resumo de gravar_dias.
+    """
+    df = pd.read_csv(caminho_csv, encoding='utf-8-sig')
+    return gravar_dias(df, diretorio)
@@ -0,0 +1,67 @@
+import hashlib
+import io
+import os
+import numpy as np
+import pandas as pd
+import cache_disco
+
+SUBDIRETORIO_CACHE = "consumos"
+
+# Limite da cache em disco (MB). Um ano de dados quarto-horários ocupa tipicamente algumas centenas de kB.
+LIMITE_CACHE_MB = float(os.environ.get("AUTOCONSUMO_CACHE_CONSUMOS_MB", 200))
+
+# Versão do formato/leitura: mudar sempre que processar_ficheiro_consumos passar a devolver outro resultado,
+# para que as entradas antigas deixem de ser usadas (ficam a ser removidas pela evicção LRU).
+VERSAO = 1
+
+
+def chave_cache(conteudo):
+    """Nome da entrada para os bytes de um ficheiro da E-Redes: hash SHA-256 do conteúdo (e versão do formato)."""
+    return f"{hashlib.sha256(conteudo).hexdigest()}_v{VERSAO}.npz"
+
+
+def _serializar_consumos(df):
+    """
+    Formato colunar compacto (npz comprimido): o índice, DataHora em ns (int64) e cada coluna numérica
+    no seu dtype, pela ordem original das colunas.
+    """
+    arrays = {
+        'colunas': np.array(df.columns, dtype=str),
+        'indice': df.index.to_numpy(dtype=np.int64),
+    }
+    for i, coluna in enumerate(df.columns):
+        if coluna == 'DataHora':
+            arrays[f'c{i}'] = df[coluna].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        else:
+            arrays[f'c{i}'] = df[coluna].to_numpy()
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _desserializar_consumos(conteudo):
+    with np.load(io.BytesIO(conteudo)) as dados:
+        colunas = [str(c) for c in dados['colunas']]
+        valores = {}
+        for i, coluna in enumerate(colunas):
+            valores[coluna] = dados[f'c{i}'].astype('datetime64[ns]') if coluna == 'DataHora' else dados[f'c{i}']
+        return pd.DataFrame(valores, index=pd.Index(dados['indice']), columns=colunas)
+
+
+def ler_consumos(conteudo):
+    """DataFrame já processado para estes bytes, ou None se não estiver na cache (ou a entrada estiver corrompida)."""
+    entrada = cache_disco.ler_entrada(SUBDIRETORIO_CACHE, chave_cache(conteudo))
+    if entrada is None:
+        return None
+    try:
+        return _desserializar_consumos(entrada)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def guardar_consumos(conteudo, df):
+    """Guarda o DataFrame processado a partir destes bytes, respeitando o limite de tamanho (LRU)."""
+    cache_disco.guardar_entrada(
+        SUBDIRETORIO_CACHE, chave_cache(conteudo), _serializar_consumos(df),
+        limite_bytes=int(LIMITE_CACHE_MB * 1024 * 1024)
+    )
@@ -0,0 +1,74 @@
+import os
+import tempfile
+from pathlib import Path
+
+# --- Diretório base da cache persistente ---
+# Pode ser alterado com a variável de ambiente AUTOCONSUMO_CACHE_DIR (ex: um volume partilhado entre workers).
+DIRETORIO_CACHE = Path(os.environ.get("AUTOCONSUMO_CACHE_DIR", Path.home() / ".cache" / "autoconsumo"))
+
+
+def _diretorio(subdiretorio):
+    caminho = DIRETORIO_CACHE / subdiretorio
+    caminho.mkdir(parents=True, exist_ok=True)
+    return caminho
+
+
+def ler_entrada(subdiretorio, nome_ficheiro):
+    """
+    Lê uma entrada da cache em disco. Retorna os bytes ou None se não existir.
+    A data de modificação é atualizada a cada leitura, servindo de "último acesso" para a evicção LRU.
+    """
+    caminho = DIRETORIO_CACHE / subdiretorio / nome_ficheiro
+    try:
+        conteudo = caminho.read_bytes()
+    except (FileNotFoundError, OSError):
+        return None
+    try:
+        os.utime(caminho)
+    except OSError:
+        pass
+    return conteudo
+
+
+def guardar_entrada(subdiretorio, nome_ficheiro, conteudo, limite_bytes):
+    """
+    Grava uma entrada na cache de forma atómica (ficheiro temporário + rename),
+    para que outros processos nunca leiam um ficheiro incompleto,
+    e aplica a evicção LRU para manter o subdiretório abaixo de 'limite_bytes'.
+    """
+    try:
+        diretorio = _diretorio(subdiretorio)
+        fd, caminho_tmp = tempfile.mkstemp(dir=diretorio, prefix=".tmp_")
+        with os.fdopen(fd, "wb") as f:
+            f.write(conteudo)
+        os.replace(caminho_tmp, diretorio / nome_ficheiro)
+        aplicar_limite_tamanho(subdiretorio, limite_bytes)
+    except OSError:
+        # A cache é apenas uma otimização: uma falha de escrita nunca deve interromper a simulação
+        pass
+
+
+def aplicar_limite_tamanho(subdiretorio, limite_bytes):
+    """
+    Remove as entradas usadas há mais tempo até o subdiretório ficar abaixo de 'limite_bytes'.
+    """
+    entradas = []
+    for caminho in (DIRETORIO_CACHE / subdiretorio).iterdir():
+        if caminho.name.startswith(".tmp_"):
+            continue
+        try:
+            estado = caminho.stat()
+        except FileNotFoundError:
+            continue
+        entradas.append((estado.st_mtime, estado.st_size, caminho))
+
+    tamanho_total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, caminho in sorted(entradas, key=lambda e: e[0]):
+        if tamanho_total <= limite_bytes:
+            break
+        try:
+            caminho.unlink()
+            tamanho_total -= tamanho
+        except FileNotFoundError:
+            # Outro processo já a removeu
+            tamanho_total -= tamanho
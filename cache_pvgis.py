@@ -0,0 +1,112 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+import requests
+import cache_disco
+
+URL_PVGIS_SERIESCALC = "https://re.jrc.ec.europa.eu/api/seriescalc"
+SUBDIRETORIO_CACHE = "pvgis"
+
+# Limite da cache em disco (MB). Cada local ocupa tipicamente algumas centenas de kB.
+LIMITE_CACHE_MB = float(os.environ.get("AUTOCONSUMO_CACHE_PVGIS_MB", 200))
+
+# Passo de quantização das coordenadas (graus). 0.05° (~5 km) corresponde à resolução da
+# grelha de radiação do PVGIS, pelo que locais dentro da mesma célula partilham a mesma série.
+PASSO_COORDENADAS = 0.05
+
+
+def quantizar_parametros(latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem):
+    """
+    Arredonda os parâmetros do pedido ao PVGIS para os valores usados como chave da cache
+    (e enviados à API, para que a série guardada corresponda exatamente à chave).
+    """
+    lat_q = round(round(float(latitude) / PASSO_COORDENADAS) * PASSO_COORDENADAS, 4)
+    lon_q = round(round(float(longitude) / PASSO_COORDENADAS) * PASSO_COORDENADAS, 4)
+    return {
+        'lat': lat_q,
+        'lon': lon_q,
+        'angle': int(round(float(inclinacao))),
+        'aspect': int(round(float(orientacao_graus))),
+        'loss': round(float(system_loss), 1),
+        'mountingplace': str(posicao_montagem),
+    }
+
+
+def chave_cache(parametros):
+    return (f"lat{parametros['lat']:.2f}_lon{parametros['lon']:.2f}_ang{parametros['angle']}"
+            f"_asp{parametros['aspect']}_loss{parametros['loss']:.1f}_{parametros['mountingplace']}.npz")
+
+
+def _serializar_serie(tempos, potencia_w):
+    """
+    Formato binário compacto (npz comprimido):
+    - os instantes como minutos desde a época; se a série for horária regular guarda-se só o início,
+    - a potência em centésimas de W (int32) quando isso não perde precisão, senão float64.
+    """
+    minutos = tempos.astype('datetime64[m]').astype(np.int64)
+    arrays = {}
+    if len(minutos) > 1 and np.all(np.diff(minutos) == 60):
+        arrays['inicio_minutos'] = np.array([minutos[0]], dtype=np.int64)
+        arrays['n'] = np.array([len(minutos)], dtype=np.int64)
+    else:
+        arrays['tempos_minutos'] = minutos
+
+    centesimas = np.round(potencia_w * 100.0)
+    if np.all(np.isfinite(potencia_w)) and np.all(centesimas / 100.0 == potencia_w) and np.abs(centesimas).max(initial=0) < 2**31:
+        arrays['P_centesimas'] = centesimas.astype(np.int32)
+    else:
+        arrays['P'] = potencia_w.astype(np.float64)
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _desserializar_serie(conteudo):
+    with np.load(io.BytesIO(conteudo)) as dados:
+        if 'tempos_minutos' in dados:
+            minutos = dados['tempos_minutos']
+        else:
+            minutos = dados['inicio_minutos'][0] + 60 * np.arange(dados['n'][0], dtype=np.int64)
+        if 'P_centesimas' in dados:
+            potencia_w = dados['P_centesimas'].astype(np.float64) / 100.0
+        else:
+            potencia_w = dados['P']
+    return pd.DataFrame({'time': minutos.astype('datetime64[m]').astype('datetime64[ns]'), 'P': potencia_w})
+
+
+def obter_serie_horaria_pvgis(latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem):
+    """
+    Devolve a série horária completa do PVGIS (todos os anos disponíveis, 2005-2023) para 1 kWp,
+    como DataFrame com as colunas 'time' (datetime) e 'P' (W).
+
+    Procura primeiro na cache em disco (partilhada entre processos e persistente entre reinícios);
+    só contacta a API se o local quantizado ainda não for conhecido.
+    As exceções de rede (requests) e de formato (KeyError/TypeError) são propagadas ao chamador.
+    """
+    parametros = quantizar_parametros(latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem)
+    nome_entrada = chave_cache(parametros)
+
+    conteudo = cache_disco.ler_entrada(SUBDIRETORIO_CACHE, nome_entrada)
+    if conteudo is not None:
+        try:
+            return _desserializar_serie(conteudo)
+        except (OSError, ValueError, KeyError):
+            pass # Entrada corrompida: volta a pedir à API e reescreve
+
+    params = dict(parametros, peakpower=1, outputformat='json', pvcalculation=1, browser=0)
+    # Por defeito, a API retorna todos os anos disponíveis (2005-2023)
+    response = requests.get(URL_PVGIS_SERIESCALC, params=params, timeout=30)
+    response.raise_for_status()
+    dados_json = response.json()
+
+    df_hourly_raw = pd.DataFrame(dados_json['outputs']['hourly'])
+    tempos = pd.to_datetime(df_hourly_raw['time'], format='%Y%m%d:%H%M').to_numpy()
+    potencia_w = pd.to_numeric(df_hourly_raw['P'], errors='coerce').to_numpy(dtype=np.float64)
+
+    cache_disco.guardar_entrada(
+        SUBDIRETORIO_CACHE, nome_entrada, _serializar_serie(tempos, potencia_w),
+        limite_bytes=int(LIMITE_CACHE_MB * 1024 * 1024)
+    )
+    return pd.DataFrame({'time': tempos, 'P': potencia_w})
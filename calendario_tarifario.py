@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+# Ciclos horários presentes na aba OMIE_CICLOS (uma coluna de períodos por ciclo)
+CICLOS = ('BD', 'BS', 'TD', 'TS')
+
+# Código usado para intervalos sem correspondência na tabela OMIE_CICLOS (ou com período vazio)
+CODIGO_DESCONHECIDO = -1
+
+
+def _datahora_em_ns(datahora):
+    """Converte uma coluna/array de datas para int64 (ns desde a época), sem fuso horário."""
+    return pd.DatetimeIndex(datahora).tz_localize(None).asi8
+
+
+def construir_calendario_tarifario(datahora, df_omie_ciclos):
+    """
+    Alinha a tabela OMIE_CICLOS com as linhas de consumo dadas por 'datahora'.
+
+    Retorna um dicionário com arrays posicionados exatamente como as linhas de consumo
+    (equivalente a um merge 'left' em DataHora, feito uma única vez):
+    - 'DataHora_ns': os instantes das linhas (int64), para verificar o alinhamento;
+    - 'codigos': {ciclo: array int8} com o índice do período em 'rotulos' (ou -1 se desconhecido);
+    - 'rotulos': {ciclo: lista ordenada dos períodos, ex: ['F', 'V'] ou ['C', 'P', 'V']};
+    - 'omie': preço OMIE (€/MWh, float64; NaN se desconhecido).
+    """
+    datahora_ns = _datahora_em_ns(datahora)
+    indice_omie = pd.Index(_datahora_em_ns(df_omie_ciclos['DataHora']))
+    posicoes = indice_omie.get_indexer(datahora_ns)
+    encontrado = posicoes >= 0
+
+    codigos = {}
+    rotulos = {}
+    for ciclo in CICLOS:
+        if ciclo not in df_omie_ciclos.columns:
+            continue
+        codigos_tabela, rotulos_ciclo = pd.factorize(df_omie_ciclos[ciclo], sort=True)
+        codigos_linhas = np.full(len(datahora_ns), CODIGO_DESCONHECIDO, dtype=np.int8)
+        codigos_linhas[encontrado] = codigos_tabela[posicoes[encontrado]]
+        codigos[ciclo] = codigos_linhas
+        rotulos[ciclo] = list(rotulos_ciclo)
+
+    omie = np.full(len(datahora_ns), np.nan)
+    if 'OMIE' in df_omie_ciclos.columns:
+        omie_tabela = pd.to_numeric(df_omie_ciclos['OMIE'], errors='coerce').to_numpy(dtype=np.float64)
+        omie[encontrado] = omie_tabela[posicoes[encontrado]]
+
+    return {
+        'DataHora_ns': datahora_ns,
+        'codigos': codigos,
+        'rotulos': rotulos,
+        'omie': omie,
+    }
+
+
+def calendario_alinhado(calendario, datahora):
+    """Indica se o calendário corresponde, linha a linha, às datas dadas."""
+    return calendario is not None and np.array_equal(calendario['DataHora_ns'], _datahora_em_ns(datahora))
+
+
+def somar_por_periodo(calendario, ciclo, valores):
+    """
+    Soma 'valores' (alinhados com o calendário) por período do ciclo, com np.bincount.
+    Devolve {período: soma} apenas para os períodos que ocorrem, por ordem alfabética
+    (o mesmo resultado de um groupby pelo período; NaN são tratados como 0).
+    """
+    codigos = calendario['codigos'][ciclo]
+    rotulos = calendario['rotulos'][ciclo]
+    conhecidos = codigos >= 0
+    codigos_validos = codigos[conhecidos]
+    valores_validos = np.nan_to_num(np.asarray(valores, dtype=np.float64)[conhecidos])
+
+    ocorrencias = np.bincount(codigos_validos, minlength=len(rotulos))
+    somas = np.bincount(codigos_validos, weights=valores_validos, minlength=len(rotulos))
+    return {rotulo: somas[i] for i, rotulo in enumerate(rotulos) if ocorrencias[i] > 0}
+
+
+def receita_venda_omie(calendario, injecao_kwh, tipo_comissao, valor_comissao):
+    """
+    Receita (€) da injeção vendida a preço indexado ao OMIE, intervalo a intervalo,
+    como produto interno entre a injeção e o preço de venda (OMIE em falta conta como 0).
+    """
+    preco_venda_kwh = precos_venda_omie(calendario, tipo_comissao, valor_comissao)
+    return float(np.dot(np.nan_to_num(np.asarray(injecao_kwh, dtype=np.float64)), preco_venda_kwh))
+
+
+def somar_por_grupo_e_periodo(calendario, ciclo, grupos, n_grupos, valores):
+    """
+    Versão matricial de somar_por_periodo: soma 'valores' por (grupo x período) com um só np.bincount.
+    'grupos' indica o grupo de cada linha (ex: o mês, 0..n_grupos-1; negativo para ignorar a linha).
+    Devolve (somas, ocorrencias), ambas matrizes n_grupos x n_períodos.
+    """
+    codigos = calendario['codigos'][ciclo]
+    n_periodos = len(calendario['rotulos'][ciclo])
+    validos = (codigos >= 0) & (grupos >= 0)
+    celulas = grupos[validos].astype(np.int64) * n_periodos + codigos[validos]
+    valores_validos = np.nan_to_num(np.asarray(valores, dtype=np.float64)[validos])
+
+    tamanho = n_grupos * n_periodos
+    ocorrencias = np.bincount(celulas, minlength=tamanho).reshape(n_grupos, n_periodos)
+    somas = np.bincount(celulas, weights=valores_validos, minlength=tamanho).reshape(n_grupos, n_periodos)
+    return somas, ocorrencias
+
+
+def precos_venda_omie(calendario, tipo_comissao, valor_comissao):
+    """Preço de venda (€/kWh) de cada intervalo, indexado ao OMIE e já descontada a comissão."""
+    omie = np.nan_to_num(calendario['omie'])
+    if tipo_comissao == 'Percentual (%)':
+        preco_venda_kwh = (omie / 1000) * (1 - valor_comissao / 100)
+    else:
+        preco_venda_kwh = (omie - valor_comissao) / 1000
+    return np.maximum(preco_venda_kwh, 0.0)
@@ -0,0 +1,108 @@
+import datetime
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Colunas do DataFrame de consumos (processamento_dados.processar_ficheiro_consumos) -> atributo do contentor
+COLUNAS = {
+    'Consumo (kWh)': 'consumo_rede',
+    'Injecao_Rede_kWh': 'injecao_rede',
+    'Consumo_Total_Casa_kWh': 'consumo_total_casa',
+    'Injecao_Total_UPAC_kWh': 'injecao_total_upac',
+    'Autoconsumo_Settlement_kWh': 'autoconsumo_settlement',
+    'Potencia_kW_Para_Analise': 'potencia_para_analise',
+}
+
+# Os valores da E-Redes vêm em kW com 3 casas decimais; divididos por 4 (kWh por quarto de hora) ficam com até 5.
+# Com essa precisão, float32 + arredondamento a 5 casas devolve exatamente o float64 original.
+CASAS_DECIMAIS = 5
+MINUTOS_POR_DIA = 24 * 60
+
+
+def _compactar(valores):
+    """float32 se a conversão for reversível (ver _expandir) para todos os valores; senão mantém float64."""
+    valores = np.asarray(valores, dtype=np.float64)
+    compactos = valores.astype(np.float32)
+    if np.array_equal(np.round(compactos.astype(np.float64), CASAS_DECIMAIS), valores, equal_nan=True):
+        return compactos
+    return valores
+
+
+def _expandir(valores):
+    if valores.dtype == np.float32:
+        return np.round(valores.astype(np.float64), CASAS_DECIMAIS)
+    return valores.copy()
+
+
+def _minutos_do_dia(data):
+    """Minutos desde a época da meia-noite de 'data' (date, datetime ou Timestamp)."""
+    return int(np.datetime64(pd.Timestamp(data).normalize().to_datetime64(), 'm').astype(np.int64))
+
+
+@dataclass(eq=False)
+class DiagramaCarga:
+    """
+    Diagrama de carga quarto-horário em formato compacto, para guardar na sessão:
+    o instante de cada linha em minutos desde a época (int64, por ordem crescente) e uma array por coluna
+    de energia (float32 sempre que não perde precisão). 'posicao_inicial' é a posição da primeira linha
+    no diagrama completo, usada como início do índice em para_dataframe().
+
+    intervalo() devolve vistas (sem cópia) sobre as mesmas arrays; para_dataframe() cria o DataFrame
+    com os nomes de colunas usados no resto do simulador.
+    """
+    __slots__ = ('minutos', 'posicao_inicial') + tuple(COLUNAS.values())
+
+    minutos: np.ndarray
+    posicao_inicial: int
+    consumo_rede: np.ndarray
+    injecao_rede: np.ndarray
+    consumo_total_casa: np.ndarray
+    injecao_total_upac: np.ndarray
+    autoconsumo_settlement: np.ndarray
+    potencia_para_analise: np.ndarray
+
+    @classmethod
+    def de_dataframe(cls, df):
+        """Cria o contentor a partir do DataFrame de validar_e_juntar_ficheiros (ordenado por DataHora)."""
+        minutos = df['DataHora'].to_numpy(dtype='datetime64[ns]').astype('datetime64[m]').astype(np.int64)
+        return cls(
+            minutos=minutos,
+            posicao_inicial=0,
+            **{atributo: _compactar(df[coluna].to_numpy()) for coluna, atributo in COLUNAS.items()}
+        )
+
+    def __len__(self):
+        return len(self.minutos)
+
+    @property
+    def nbytes(self):
+        return self.minutos.nbytes + sum(getattr(self, atributo).nbytes for atributo in COLUNAS.values())
+
+    def primeiro_dia(self):
+        return self.minutos[:1].astype('datetime64[m]').astype(datetime.datetime)[0].date()
+
+    def ultimo_dia(self):
+        return self.minutos[-1:].astype('datetime64[m]').astype(datetime.datetime)[0].date()
+
+    def intervalo(self, data_inicio, data_fim):
+        """
+        Linhas dos dias data_inicio..data_fim (inclusive), por pesquisa binária nos minutos ordenados.
+        As arrays do resultado são vistas sobre as deste contentor (não há cópia dos dados).
+        """
+        inicio, fim = np.searchsorted(
+            self.minutos, [_minutos_do_dia(data_inicio), _minutos_do_dia(data_fim) + MINUTOS_POR_DIA], side='left'
+        )
+        fim = max(inicio, fim)
+        return DiagramaCarga(
+            minutos=self.minutos[inicio:fim],
+            posicao_inicial=self.posicao_inicial + int(inicio),
+            **{atributo: getattr(self, atributo)[inicio:fim] for atributo in COLUNAS.values()}
+        )
+
+    def para_dataframe(self):
+        """DataFrame (float64) com as colunas do DataFrame de consumos original e as posições no diagrama completo como índice."""
+        dados = {'DataHora': self.minutos.astype('datetime64[m]').astype('datetime64[ns]')}
+        for coluna, atributo in COLUNAS.items():
+            dados[coluna] = _expandir(getattr(self, atributo))
+        return pd.DataFrame(dados, index=pd.RangeIndex(self.posicao_inicial, self.posicao_inicial + len(self)))
@@ -0,0 +1,78 @@
+# --- Grafo de cálculo incremental para o modelo de reexecução do Streamlit ---
+#
+# Cada interação com um widget volta a correr o script inteiro. As etapas pesadas
+# (filtro -> solar -> bateria -> financeiro -> gráficos/exportações) são chamadas através de
+# etapa(estado, nome, funcao, *entradas): o resultado fica guardado na sessão junto com a chave
+# das entradas, e só volta a ser calculado quando alguma das entradas muda.
+#
+# A chave é um hash SHA-256 das entradas. Valores simples (números, texto, datas, e listas,
+# tuplos ou dicionários destes) entram pelo seu valor; os restantes objetos (DataFrames,
+# arrays, o diagrama de carga) entram pela identidade. Como uma etapa cujas entradas não mudaram
+# devolve o mesmo objeto, as etapas que dependem dela também não mudam: as dependências do grafo
+# são os próprios argumentos, e nunca é preciso percorrer os dados para calcular a chave.
+# Por isso, as entradas e os resultados das etapas não devem ser alterados no lugar.
+import datetime
+import hashlib
+import numbers
+
+import numpy as np
+
+# Chave do st.session_state (ou de outro dicionário) onde ficam os resultados das etapas
+CHAVE_MEMORIA = "grafo_calculo"
+
+TIPOS_POR_VALOR = (
+    str, bytes, bool, numbers.Number, np.generic, type(None),
+    datetime.date, datetime.time, datetime.timedelta,
+)
+
+
+def _descrever(valor, objetos):
+    """
+    Texto que identifica 'valor' para a chave da etapa. Os objetos guardados por identidade
+    são acrescentados a 'objetos' (a entrada da memória mantém-nos vivos, para que o mesmo id
+    não possa ser reutilizado por outro objeto enquanto a entrada existir).
+    """
+    if isinstance(valor, TIPOS_POR_VALOR):
+        return f"{type(valor).__name__}:{valor!r}"
+    if isinstance(valor, (list, tuple)):
+        return f"{type(valor).__name__}[" + ",".join(_descrever(v, objetos) for v in valor) + "]"
+    if isinstance(valor, dict):
+        return "dict{" + ",".join(f"{_descrever(k, objetos)}:{_descrever(v, objetos)}" for k, v in valor.items()) + "}"
+    objetos.append(valor)
+    return f"id:{id(valor)}"
+
+
+def chave_entradas(entradas, entradas_nomeadas):
+    """Retorna (hash das entradas, lista dos objetos incluídos por identidade)."""
+    objetos = []
+    descricao = _descrever(entradas, objetos) + "|" + _descrever(dict(sorted(entradas_nomeadas.items())), objetos)
+    return hashlib.sha256(descricao.encode("utf-8")).hexdigest(), objetos
+
+
+def etapa(estado, nome, funcao, *entradas, **entradas_nomeadas):
+    """
+    Devolve funcao(*entradas, **entradas_nomeadas), reutilizando o último resultado da etapa
+    'nome' se as entradas forem as mesmas. 'estado' é o dicionário da sessão (st.session_state);
+    cada etapa guarda apenas o seu último resultado.
+
+    Todas as entradas de que o resultado depende têm de ser passadas como argumentos
+    (não usar valores capturados pela função).
+    """
+    memoria = estado.setdefault(CHAVE_MEMORIA, {})
+    chave, objetos = chave_entradas(entradas, entradas_nomeadas)
+    anterior = memoria.get(nome)
+    if anterior is not None and anterior['chave'] == chave:
+        return anterior['resultado']
+
+    resultado = funcao(*entradas, **entradas_nomeadas)
+    memoria[nome] = {'chave': chave, 'objetos': objetos, 'resultado': resultado}
+    return resultado
+
+
+def esquecer(estado, *nomes):
+    """Remove os resultados guardados das etapas indicadas (ou de todas, sem nomes)."""
+    memoria = estado.get(CHAVE_MEMORIA)
+    if not memoria:
+        return
+    for nome in (nomes or list(memoria)):
+        memoria.pop(nome, None)
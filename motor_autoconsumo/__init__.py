@@ -0,0 +1,24 @@
+# --- Motor de simulação de autoconsumo, sem Streamlit ---
+#
+# O mesmo pipeline da aplicação, em módulos que podem correr num processo de trabalho, num script
+# ou em lote (python -m motor_autoconsumo, ver cli.py):
+#   ingestao     -> ficheiros da E-Redes e dados OMIE
+#   solar        -> produção PVGIS (ou backup por distrito) e autoconsumo
+#   bateria      -> despacho da bateria sobre o cenário solar
+#   financeiro   -> custo com IVA, venda de excedente e balanço de cada cenário
+#   longo_prazo  -> payback, fluxo de caixa e ROI
+#   cenario      -> um cliente e uma lista de cenários do princípio ao fim
+#   dimensionamento -> varrimento paralelo de potências x baterias (Assistente de Dimensionamento)
+#   monte_carlo  -> incerteza do payback e das poupanças (anos meteorológicos, anos OMIE e taxas sorteadas)
+#   processos    -> contexto ("spawn") dos processos de trabalho usados pelo pacote
+#
+# calculos.py e processamento_dados.py são a camada da aplicação por cima deste pacote
+# (st.cache_data, mensagens de erro e atualização dos dados OMIE).
+import os
+import sys
+
+# Os módulos partilhados com a aplicação (motor_bateria, calendario_tarifario, cache_pvgis, ...)
+# estão na raiz do repositório
+_RAIZ_REPOSITORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _RAIZ_REPOSITORIO not in sys.path:
+    sys.path.insert(0, _RAIZ_REPOSITORIO)
@@ -0,0 +1,76 @@
+# --- Bateria: despacho sobre o cenário após a simulação solar ---
+import numpy as np
+import pandas as pd
+
+import motor_bateria
+
+
+def simular_bateria(df_com_solar, capacidade_kwh, potencia_kw, eficiencia_perc, dod_perc):
+    """
+    Simula o comportamento de uma bateria, usando o excedente solar para carregar
+    e descarregando para cobrir o consumo da casa.
+    """
+    if df_com_solar.empty:
+        return df_com_solar
+
+    df = df_com_solar.copy()
+
+    # --- Despacho sobre arrays contíguos (compilado com Numba, se disponível) ---
+    resultado = motor_bateria.despachar_bateria(
+        df['Excedente_kWh'].to_numpy(), df['Consumo_Rede_kWh'].to_numpy(),
+        capacidade_kwh, potencia_kw, eficiencia_perc, dod_perc
+    )
+
+    df['Excedente_kWh'] = resultado['Excedente_kWh']
+    df['Consumo_Rede_kWh'] = resultado['Consumo_Rede_kWh']
+    df['Bateria_SoC_kWh'] = resultado['Bateria_SoC_kWh']
+    df['Bateria_Carga_kWh'] = resultado['Bateria_Carga_kWh']
+    df['Bateria_Descarga_kWh'] = resultado['Bateria_Descarga_kWh']
+
+    # A energia entregue só existe nos intervalos com descarga (NaN nos restantes),
+    # e a coluna só é criada se a bateria chegou a descarregar
+    entregue = resultado['Bateria_Energia_Entregue_kWh']
+    if not np.isnan(entregue).all():
+        df['Bateria_Energia_Entregue_kWh'] = entregue
+
+    return df
+
+def simular_baterias_em_lote(df_com_solar, configuracoes):
+    """
+    Simula várias baterias sobre o mesmo cenário solar numa só passagem.
+    'configuracoes' é uma lista de tuplos (capacidade_kwh, potencia_kw, eficiencia_perc, dod_perc).
+    Retorna o dicionário compacto de motor_bateria.despachar_baterias_em_lote (uma linha por configuração).
+    """
+    return motor_bateria.despachar_baterias_em_lote(
+        df_com_solar['Excedente_kWh'].to_numpy(), df_com_solar['Consumo_Rede_kWh'].to_numpy(),
+        [tuple(config) for config in configuracoes]
+    )
+
+def aplicar_bateria_ao_cenario(df_pre_bateria, config_bateria):
+    """
+    Cenário final: o cenário após a simulação solar (aplicar_simulacao_solar_aos_dados_base) com a bateria aplicada
+    ('config_bateria' = (capacidade, potência, eficiência, DoD), ou None sem bateria).
+    """
+    df_simulado_final = df_pre_bateria.copy()
+    if config_bateria is None:
+        return df_simulado_final
+
+    capacidade, potencia_bat, eficiencia, dod = config_bateria
+    df_para_bateria = pd.DataFrame({
+        'DataHora': df_pre_bateria['DataHora'],
+        'Excedente_kWh': df_pre_bateria['Injecao_Rede_Final_kWh'],
+        'Consumo_Rede_kWh': df_pre_bateria['Consumo_Rede_Final_kWh']
+    })
+    df_com_bateria = simular_bateria(df_para_bateria, capacidade, potencia_bat, eficiencia, dod)
+    
+    df_simulado_final['Consumo_Rede_Final_kWh'] = df_com_bateria['Consumo_Rede_kWh']
+    df_simulado_final['Injecao_Rede_Final_kWh'] = df_com_bateria['Excedente_kWh']
+
+    # Adiciona as colunas de detalhe da bateria
+    battery_cols = ['Bateria_SoC_kWh', 'Bateria_Carga_kWh', 'Bateria_Descarga_kWh', 'Bateria_Energia_Entregue_kWh']
+    for col in battery_cols:
+        if col in df_com_bateria.columns:
+            df_simulado_final[col] = df_com_bateria[col]
+        else: # Garante que as colunas existem mesmo que a função de bateria mude
+            df_simulado_final[col] = 0.0
+    return df_simulado_final
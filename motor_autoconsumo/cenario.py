@@ -0,0 +1,226 @@
+# --- Um cliente do princípio ao fim: filtro -> solar -> bateria -> financeiro -> longo prazo ---
+#
+# Um cenário é um dicionário com os mesmos parâmetros (e os mesmos valores por omissão) que os widgets
+# do simulador; normalizar_cenario completa-o a partir de CENARIO_PADRAO. Os cálculos de cada cliente
+# passam por grafo_calculo.etapa, tal como na aplicação: cenários seguidos com o mesmo período, local
+# ou painéis reutilizam o filtro, o calendário tarifário, a base de produção e a simulação solar.
+import datetime
+
+import numpy as np
+
+import constantes as C
+import diagrama_carga
+import grafo_calculo
+from motor_autoconsumo import bateria, financeiro, longo_prazo, solar
+
+# Preços de energia por omissão (€/kWh, s/ IVA) para cada tipo de opção horária
+PRECOS_ENERGIA_PADRAO = {
+    "simples": {"S": 0.1658},
+    "bi-horário": {"V": 0.1094, "F": 0.2008},
+    "tri-horário": {"V": 0.1094, "C": 0.1777, "P": 0.2448},
+}
+
+SOLAR_PADRAO = {
+    'potencia_kwp': 2.0, 'latitude': 40.5374, 'longitude': -7.0367, 'inclinacao': 35, 'orientacao_graus': 0,
+    'perdas': 14, 'montagem': "free", 'sombra': 0, 'distrito': 'Guarda',
+}
+BATERIA_PADRAO = {'capacidade_kwh': 5.0, 'potencia_kw': 2.5, 'eficiencia': 90, 'dod': 80}
+VENDA_PADRAO = {'ativa': True, 'modelo': "Preço Fixo", 'tipo_comissao': None, 'valor_comissao': 0.05}
+LONGO_PRAZO_PADRAO = {'anos': 25, 'degradacao': 0.5, 'inflacao_energia': 3.0, 'variacao_venda': 0.0}
+
+# 'data_inicio'/'data_fim' None = todo o período do ficheiro; 'precos_energia' None = PRECOS_ENERGIA_PADRAO;
+# 'solar' ou 'bateria' None = sem novos painéis / sem bateria
+CENARIO_PADRAO = {
+    'nome': "Cenário",
+    'data_inicio': None, 'data_fim': None,
+    'potencia_kva': 3.45, 'opcao_horaria': "Simples", 'precos_energia': None, 'familia_numerosa': False,
+    'venda': VENDA_PADRAO,
+    'solar': SOLAR_PADRAO,
+    'bateria': None,
+    'custo_instalacao': 2000.0,
+    'longo_prazo': LONGO_PRAZO_PADRAO,
+}
+SUBCENARIOS_PADRAO = {'venda': VENDA_PADRAO, 'solar': SOLAR_PADRAO, 'bateria': BATERIA_PADRAO, 'longo_prazo': LONGO_PRAZO_PADRAO}
+
+# Colunas do resumo de cada cenário (simular_cliente), pela ordem em que são escritas pela linha de comandos
+COLUNAS_RESUMO = [
+    'cenario', 'data_inicio', 'data_fim', 'dias', 'fonte_solar', 'aviso',
+    'consumo_rede_atual_kwh', 'injecao_rede_atual_kwh', 'producao_solar_kwh',
+    'consumo_rede_simulado_kwh', 'injecao_rede_simulada_kwh',
+    'custo_compra_atual', 'receita_venda_atual', 'balanco_atual',
+    'custo_compra_simulado', 'receita_venda_simulada', 'balanco_simulado',
+    'custo_evitado_anual', 'receita_adicional_anual', 'poupanca_anual',
+    'custo_instalacao', 'anos_analise', 'payback_anos', 'poupanca_total_periodo', 'roi_simples_anual',
+]
+
+
+def _completar(padrao, valores, onde):
+    desconhecidas = set(valores) - set(padrao)
+    if desconhecidas:
+        raise ValueError(f"Parâmetros desconhecidos em {onde}: {', '.join(sorted(desconhecidas))}.")
+    return {**padrao, **valores}
+
+
+def _data(valor):
+    if valor is None or isinstance(valor, datetime.date):
+        return valor
+    return datetime.date.fromisoformat(str(valor))
+
+
+def normalizar_cenario(cenario):
+    """
+    Cenário completo a partir de um dicionário parcial (ex: lido de JSON), com os valores por omissão
+    do simulador. Lança ValueError para parâmetros desconhecidos ou opções horárias inválidas.
+    """
+    completo = _completar(CENARIO_PADRAO, cenario, "cenário")
+    for chave, padrao in SUBCENARIOS_PADRAO.items():
+        if completo[chave] is not None:
+            completo[chave] = _completar(padrao, completo[chave], f"'{chave}'")
+
+    opcoes_validas = {opcao.lower(): opcao for opcao in C.OPCOES_HORARIAS_TOTAIS}
+    opcao = opcoes_validas.get(str(completo['opcao_horaria']).lower())
+    if opcao is None:
+        raise ValueError(f"Opção horária inválida: '{completo['opcao_horaria']}'.")
+    if completo['potencia_kva'] >= 27.6 and not opcao.lower().startswith("tri-horário"):
+        raise ValueError("Para potências a partir de 27,6 kVA a opção horária tem de ser tri-horária.")
+    completo['opcao_horaria'] = opcao
+
+    if completo['precos_energia'] is None:
+        tipo = next(tipo for tipo in PRECOS_ENERGIA_PADRAO if tipo in opcao.lower())
+        completo['precos_energia'] = dict(PRECOS_ENERGIA_PADRAO[tipo])
+    completo['data_inicio'] = _data(completo['data_inicio'])
+    completo['data_fim'] = _data(completo['data_fim'])
+    return completo
+
+
+# --- Etapas (ver grafo_calculo.etapa) ---
+def _filtrar_diagrama(diagrama, data_inicio, data_fim):
+    return diagrama.intervalo(data_inicio, data_fim).para_dataframe()
+
+
+def _calendario_do_periodo(df_analise, df_omie):
+    return financeiro.preparar_calendario_tarifario(df_analise['DataHora'], df_omie)
+
+
+def _financeiro(df_cenario, df_omie, calendario, dias, potencia_kva, opcao_horaria, precos_energia, familia_numerosa, venda):
+    return financeiro.calcular_valor_financeiro_cenario(
+        df_cenario=df_cenario,
+        df_omie_completo=df_omie,
+        precos_compra_kwh_siva=precos_energia,
+        dias_calculo=dias,
+        potencia_kva=potencia_kva,
+        opcao_horaria_str=opcao_horaria,
+        # Como na aplicação, a opção de família numerosa só existe até 6,9 kVA
+        familia_numerosa_bool=familia_numerosa and potencia_kva <= 6.9,
+        # Com a venda inativa, os valores não têm efeito (como na aplicação)
+        modelo_venda=venda['modelo'] if venda['ativa'] else "Preço Fixo",
+        tipo_comissao=venda['tipo_comissao'] if venda['ativa'] else None,
+        valor_comissao=venda['valor_comissao'] if venda['ativa'] else 0,
+        venda_excedente_ativa=venda['ativa'],
+        calendario_tarifario=calendario
+    )
+
+
+def simular_cenario(estado, diagrama, df_omie, cenario, obter_perfil=solar.obter_perfil_producao_horaria_pvgis):
+    """
+    Simula um cenário (já normalizado) sobre o diagrama de carga de um cliente e devolve o resumo
+    (um dicionário com as chaves de COLUNAS_RESUMO). 'estado' é o dicionário onde as etapas guardam
+    os resultados, partilhado entre os cenários do mesmo cliente.
+    """
+    data_inicio = max(cenario['data_inicio'] or diagrama.primeiro_dia(), diagrama.primeiro_dia())
+    data_fim = min(cenario['data_fim'] or diagrama.ultimo_dia(), diagrama.ultimo_dia())
+    dias = (data_fim - data_inicio).days + 1 if data_fim >= data_inicio else 0
+
+    df_analise = grafo_calculo.etapa(estado, 'filtro', _filtrar_diagrama, diagrama, data_inicio, data_fim)
+    calendario = grafo_calculo.etapa(estado, 'calendario', _calendario_do_periodo, df_analise, df_omie)
+
+    # --- Solar ---
+    df_solar = None
+    fonte_solar = aviso = None
+    parametros_solar = cenario['solar']
+    if parametros_solar is not None:
+        base_producao = grafo_calculo.etapa(
+            estado, 'base_producao', solar.preparar_base_producao_solar,
+            df_analise, parametros_solar['latitude'], parametros_solar['longitude'],
+            parametros_solar['inclinacao'], parametros_solar['orientacao_graus'], parametros_solar['perdas'],
+            parametros_solar['montagem'], parametros_solar['distrito'], obter_perfil=obter_perfil
+        )
+        df_solar = grafo_calculo.etapa(
+            estado, 'solar', solar.aplicar_base_producao_solar,
+            df_analise, base_producao, parametros_solar['potencia_kwp'], parametros_solar['sombra']
+        )
+        fonte_solar, aviso = base_producao['fonte'], base_producao['erro_api']
+        if base_producao['producao_por_kwp'] is None:
+            aviso = solar.MENSAGEM_SEM_BACKUP.format(distrito=parametros_solar['distrito'])
+
+    # --- Bateria ---
+    df_pre_bateria = grafo_calculo.etapa(estado, 'pre_bateria', solar.aplicar_simulacao_solar_aos_dados_base, df_analise, df_solar)
+    config_bateria = None
+    if cenario['bateria'] is not None:
+        parametros_bateria = cenario['bateria']
+        config_bateria = (
+            parametros_bateria['capacidade_kwh'], parametros_bateria['potencia_kw'],
+            parametros_bateria['eficiencia'], parametros_bateria['dod']
+        )
+    df_simulado = grafo_calculo.etapa(estado, 'bateria', bateria.aplicar_bateria_ao_cenario, df_pre_bateria, config_bateria)
+
+    # --- Financeiro ---
+    df_cenario_atual = grafo_calculo.etapa(estado, 'cenario_atual', financeiro.cenario_atual_para_financeiro, df_analise)
+    tarifario = (
+        dias, cenario['potencia_kva'], cenario['opcao_horaria'], cenario['precos_energia'],
+        cenario['familia_numerosa'], cenario['venda']
+    )
+    financeiro_atual = grafo_calculo.etapa(estado, 'financeiro_atual', _financeiro, df_cenario_atual, df_omie, calendario, *tarifario)
+    financeiro_simulado = grafo_calculo.etapa(estado, 'financeiro_simulado', _financeiro, df_simulado, df_omie, calendario, *tarifario)
+    custo_evitado_anual, receita_adicional_anual = financeiro.poupancas_anuais_base(financeiro_atual, financeiro_simulado, dias)
+
+    # --- Longo prazo ---
+    parametros_lp = cenario['longo_prazo']
+    analise_lp = longo_prazo.calcular_analise_longo_prazo(
+        custo_instalacao=cenario['custo_instalacao'],
+        poupanca_autoconsumo_anual_base=custo_evitado_anual,
+        poupanca_venda_anual_base=receita_adicional_anual,
+        anos_analise=parametros_lp['anos'],
+        taxa_degradacao_perc=parametros_lp['degradacao'],
+        taxa_inflacao_energia_perc=parametros_lp['inflacao_energia'],
+        taxa_variacao_venda_perc=parametros_lp['variacao_venda']
+    )
+
+    return {
+        'cenario': cenario['nome'],
+        'data_inicio': data_inicio.isoformat(),
+        'data_fim': data_fim.isoformat(),
+        'dias': dias,
+        'fonte_solar': fonte_solar,
+        'aviso': aviso,
+        'consumo_rede_atual_kwh': float(np.nansum(df_cenario_atual['Consumo_Rede_Final_kWh'].to_numpy(dtype=np.float64))),
+        'injecao_rede_atual_kwh': float(np.nansum(df_cenario_atual['Injecao_Rede_Final_kWh'].to_numpy(dtype=np.float64))),
+        'producao_solar_kwh': float(df_pre_bateria['Producao_Solar_kWh_Nova'].sum()),
+        'consumo_rede_simulado_kwh': float(np.nansum(df_simulado['Consumo_Rede_Final_kWh'].to_numpy(dtype=np.float64))),
+        'injecao_rede_simulada_kwh': float(np.nansum(df_simulado['Injecao_Rede_Final_kWh'].to_numpy(dtype=np.float64))),
+        'custo_compra_atual': financeiro_atual['custo_compra_c_iva'],
+        'receita_venda_atual': financeiro_atual['receita_venda'],
+        'balanco_atual': financeiro_atual['balanco_final'],
+        'custo_compra_simulado': financeiro_simulado['custo_compra_c_iva'],
+        'receita_venda_simulada': financeiro_simulado['receita_venda'],
+        'balanco_simulado': financeiro_simulado['balanco_final'],
+        'custo_evitado_anual': custo_evitado_anual,
+        'receita_adicional_anual': receita_adicional_anual,
+        'poupanca_anual': custo_evitado_anual + receita_adicional_anual,
+        'custo_instalacao': cenario['custo_instalacao'],
+        'anos_analise': analise_lp['anos_analise'],
+        'payback_anos': analise_lp['payback_detalhado'],
+        'poupanca_total_periodo': analise_lp['poupanca_total_periodo'],
+        'roi_simples_anual': analise_lp['roi_simples_anual'],
+    }
+
+
+def simular_cliente(df_consumos, df_omie, cenarios, obter_perfil=solar.obter_perfil_producao_horaria_pvgis):
+    """
+    Simula todos os 'cenarios' (normalizados) para o DataFrame de consumos de um cliente
+    (validar_e_juntar_ficheiros). Retorna a lista dos resumos, pela mesma ordem.
+    """
+    # O mesmo formato compacto que a aplicação guarda na sessão, para que o filtro dê os mesmos valores
+    diagrama = diagrama_carga.DiagramaCarga.de_dataframe(df_consumos)
+    estado = {}
+    return [simular_cenario(estado, diagrama, df_omie, cenario, obter_perfil) for cenario in cenarios]
@@ -0,0 +1,171 @@
+# --- Linha de comandos: simulação em lote de uma pasta de diagramas de carga ---
+#
+#   python -m motor_autoconsumo CLIENTES CENARIOS.json [-o resultados.csv] [--omie FICHEIRO] [--processos N]
+#
+# Em CLIENTES, cada ficheiro .xlsx da E-Redes é um cliente, e cada subpasta também (os ficheiros .xlsx
+# da subpasta são juntos, como quando se carregam vários ficheiros na aplicação). CENARIOS.json é um
+# cenário, uma lista de cenários ou {"cenarios": [...]} (ver cenario.CENARIO_PADRAO). O resultado é um
+# CSV com uma linha por cliente e cenário, escrito à medida que os clientes terminam.
+#
+# Os clientes são distribuídos por um ProcessPoolExecutor. Os dados OMIE são lidos uma vez no processo
+# principal (e herdados pelos processos de trabalho, ou lidos por cada um se não for possível herdar).
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from motor_autoconsumo import cenario, ingestao
+
+DIRETORIO_REPOSITORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT_OMIE = os.path.join(DIRETORIO_REPOSITORIO, "data", "OMIE_CICLOS.arrow")
+EXCEL_OMIE = os.path.join(DIRETORIO_REPOSITORIO, "☀️_Autoconsumo_Tiago_Felicia.xlsx")
+
+# Processos usados para simular os clientes em paralelo
+PROCESSOS_LOTE = int(os.environ.get("AUTOCONSUMO_PROCESSOS_LOTE", os.cpu_count() or 1))
+
+COLUNAS_RESULTADO = ['cliente', 'ficheiros'] + cenario.COLUNAS_RESUMO + ['erro']
+
+
+def listar_clientes(diretorio):
+    """
+    Lista ordenada de (nome do cliente, [caminhos dos ficheiros .xlsx]) de uma pasta de clientes
+    ('diretorio' também pode ser um único ficheiro .xlsx).
+    """
+    if os.path.isfile(diretorio):
+        return [(os.path.splitext(os.path.basename(diretorio))[0], [diretorio])] if diretorio.lower().endswith(".xlsx") else []
+    if not os.path.isdir(diretorio):
+        return []
+    clientes = []
+    for entrada in sorted(os.scandir(diretorio), key=lambda e: e.name):
+        if entrada.is_dir():
+            ficheiros = sorted(
+                os.path.join(entrada.path, nome) for nome in os.listdir(entrada.path) if nome.lower().endswith(".xlsx")
+            )
+            if ficheiros:
+                clientes.append((entrada.name, ficheiros))
+        elif entrada.name.lower().endswith(".xlsx"):
+            clientes.append((os.path.splitext(entrada.name)[0], [entrada.path]))
+    return clientes
+
+
+def ler_cenarios(caminho):
+    """Lê e normaliza os cenários de um ficheiro JSON (lança ValueError se algum for inválido)."""
+    with open(caminho, encoding="utf-8") as f:
+        especificacao = json.load(f)
+    if isinstance(especificacao, dict):
+        especificacao = especificacao.get('cenarios', [especificacao])
+    if not especificacao:
+        raise ValueError(f"'{caminho}' não tem nenhum cenário.")
+    return [cenario.normalizar_cenario(spec) for spec in especificacao]
+
+
+# (OMIE_CICLOS, Constantes) do processo atual
+_DADOS_OMIE = None
+
+
+def _inicializar_processo(caminho_omie):
+    global _DADOS_OMIE
+    if _DADOS_OMIE is None:
+        _DADOS_OMIE = ingestao.carregar_omie_local(caminho_omie)
+
+
+def _simular_cliente(tarefa):
+    """Lê os ficheiros de um cliente e simula todos os cenários. Retorna as linhas do resultado."""
+    nome, caminhos, cenarios = tarefa
+    linha_base = {'cliente': nome, 'ficheiros': ";".join(os.path.basename(c) for c in caminhos)}
+    try:
+        conteudos = []
+        for caminho in caminhos:
+            with open(caminho, "rb") as f:
+                conteudos.append((os.path.basename(caminho), f.read()))
+        # Um cliente por processo: os ficheiros do cliente são lidos em sequência
+        df_consumos, erro = ingestao.validar_e_juntar_conteudos(conteudos, processos=1)
+        if erro:
+            return [{**linha_base, 'erro': erro}]
+        resumos = cenario.simular_cliente(df_consumos, _DADOS_OMIE[0], cenarios)
+    except Exception as e:
+        return [{**linha_base, 'erro': f"Erro ao simular o cliente: {e}"}]
+    return [{**linha_base, **resumo} for resumo in resumos]
+
+
+def simular_lote(clientes, cenarios, caminho_omie, processos=PROCESSOS_LOTE):
+    """
+    Simula os 'cenarios' para cada cliente de 'clientes' (listar_clientes) e devolve, pela ordem
+    dos clientes e à medida que ficam prontas, as linhas do resultado de cada um.
+    Se um processo de trabalho terminar de forma anormal, os clientes em falta são simulados em sequência.
+    """
+    _inicializar_processo(caminho_omie)
+    tarefas = [(nome, caminhos, cenarios) for nome, caminhos in clientes]
+    if len(tarefas) > 1 and processos > 1:
+        try:
+            executor = ProcessPoolExecutor(
+                max_workers=min(processos, len(tarefas)), initializer=_inicializar_processo, initargs=(caminho_omie,)
+            )
+        except OSError:
+            executor = None # Ambiente sem suporte para processos: simula em sequência
+        if executor is not None:
+            entregues = 0
+            with executor:
+                # Blocos de vários clientes por tarefa, para diluir a comunicação entre processos
+                blocos = max(1, min(16, len(tarefas) // (processos * 4)))
+                try:
+                    for linhas in executor.map(_simular_cliente, tarefas, chunksize=blocos):
+                        entregues += 1
+                        yield linhas
+                except BrokenProcessPool:
+                    pass # Um processo terminou de forma anormal: os clientes em falta são simulados em sequência
+            tarefas = tarefas[entregues:]
+    for tarefa in tarefas:
+        yield _simular_cliente(tarefa)
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m motor_autoconsumo",
+        description="Simula cenários de autoconsumo (solar, bateria, financeiro e longo prazo) para uma pasta de diagramas de carga da E-Redes."
+    )
+    parser.add_argument("clientes", help="pasta com um ficheiro .xlsx (ou uma subpasta de ficheiros .xlsx) por cliente")
+    parser.add_argument("cenarios", help="ficheiro JSON com o cenário ou a lista de cenários a simular")
+    parser.add_argument("-o", "--saida", default="resultados_autoconsumo.csv", help="ficheiro CSV de resultados (por omissão: %(default)s)")
+    parser.add_argument("--omie", default=None,
+                        help="dados OMIE: snapshot OMIE_CICLOS.arrow ou o Excel do simulador (por omissão, o snapshot em data/ ou o Excel do repositório)")
+    parser.add_argument("--processos", type=int, default=PROCESSOS_LOTE, help="processos em paralelo (por omissão: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    caminho_omie = args.omie
+    if caminho_omie is None:
+        caminho_omie = SNAPSHOT_OMIE if ingestao.PYARROW_DISPONIVEL and os.path.exists(SNAPSHOT_OMIE) else EXCEL_OMIE
+
+    try:
+        cenarios = ler_cenarios(args.cenarios)
+    except (OSError, ValueError) as e:
+        print(f"❌ Cenários inválidos: {e}")
+        return 2
+    clientes = listar_clientes(args.clientes)
+    if not clientes:
+        print(f"❌ Nenhum ficheiro .xlsx encontrado em '{args.clientes}'.")
+        return 2
+
+    print(f"⏳ {len(clientes)} cliente(s) x {len(cenarios)} cenário(s), dados OMIE de '{caminho_omie}', {args.processos} processo(s)...")
+    inicio = time.perf_counter()
+    com_erro = 0
+    with open(args.saida, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.DictWriter(f, fieldnames=COLUNAS_RESULTADO)
+        escritor.writeheader()
+        for concluidos, linhas in enumerate(simular_lote(clientes, cenarios, caminho_omie, args.processos), start=1):
+            escritor.writerows(linhas)
+            f.flush()
+            if linhas[0].get('erro'):
+                com_erro += 1
+                print(f"   ⚠️ {linhas[0]['cliente']}: {linhas[0]['erro']}")
+            if concluidos % 100 == 0 or concluidos == len(clientes):
+                print(f"   - {concluidos}/{len(clientes)} clientes ({time.perf_counter() - inicio:.1f} s)")
+
+    print(f"✅ Resultados em '{args.saida}' ({len(clientes) - com_erro} cliente(s) simulados, {com_erro} com erro).")
+    return 0
@@ -0,0 +1,545 @@
+# --- Assistente de Dimensionamento: varrimento de potências de painéis x capacidades de bateria ---
+#
+# Cada potência de painéis é uma tarefa: o cenário solar é a base de produção de 1 kWp multiplicada
+# pela potência, todas as baterias dessa potência são despachadas numa só passagem
+# (motor_bateria.despachar_baterias_em_lote) e cada combinação segue para o financeiro e o longo prazo.
+#
+# As tarefas são distribuídas por um ProcessPoolExecutor. Os arrays só de leitura (consumo, injeção,
+# produção de 1 kWp e calendário tarifário) são publicados uma vez num bloco de memória partilhada
+# (multiprocessing.shared_memory) e cada processo de trabalho lê-os sem cópia; as tarefas só levam a potência.
+# Os processos são criados com "spawn" (ver processos.py) e cada um começa por importar o pandas, o numba e o motor
+# (cerca de 1 s), por isso só se usam processos quando o trabalho (combinações x intervalos de 15 min) passa
+# LIMIAR_TRABALHO_PROCESSOS; abaixo disso, avaliar em sequência é mais rápido.
+#
+# Em vez da grelha de opções, otimizar_dimensionamento procura o ótimo em intervalos contínuos de potência
+# e capacidade (secção áurea nos dois eixos), avaliando uma pequena fração dos pontos de uma grelha densa.
+#
+# avaliar_propostas usa os mesmos núcleos no Comparador de Propostas, sem repetir o trabalho comum a várias propostas.
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import motor_bateria
+from motor_autoconsumo import financeiro, longo_prazo
+from motor_autoconsumo.processos import CONTEXTO_PROCESSOS
+
+# Processos usados para avaliar as potências em paralelo
+PROCESSOS_DIMENSIONAMENTO = int(os.environ.get("AUTOCONSUMO_PROCESSOS_DIMENSIONAMENTO", os.cpu_count() or 1))
+# Trabalho mínimo (combinações x intervalos de 15 min) para compensar o arranque dos processos. Em sequência
+# avaliam-se cerca de 25 milhões por segundo (1 vCPU), por isso o limiar corresponde a uns 3 s de cálculo.
+LIMIAR_TRABALHO_PROCESSOS = int(os.environ.get("AUTOCONSUMO_LIMIAR_PROCESSOS_DIMENSIONAMENTO", 75_000_000))
+
+
+def preparar_dados_dimensionamento(df_analise, base_producao, fator_sombra, calendario):
+    """
+    Arrays do período em análise usados por todas as combinações, alinhados linha a linha com df_analise:
+    consumo, injeção já existente, produção de 1 kWp (com a sombra, se aplicável) e o calendário tarifário.
+    'producao_por_kwp' é None se a base não tiver produção (backup sem dados): o cenário fica igual ao atual.
+    """
+    consumo = df_analise['Consumo (kWh)'].to_numpy(dtype=np.float64)
+    injecao_base = (
+        df_analise['Injecao_Rede_kWh'].to_numpy(dtype=np.float64) if 'Injecao_Rede_kWh' in df_analise.columns
+        else np.zeros(len(df_analise))
+    )
+
+    producao_por_kwp = base_producao['producao_por_kwp']
+    if producao_por_kwp is not None:
+        producao_por_kwp = np.asarray(producao_por_kwp, dtype=np.float64)
+        if base_producao['aplica_sombra']:
+            producao_por_kwp = producao_por_kwp * (1 - (fator_sombra / 100.0))
+
+    return {
+        'DataHora': pd.to_datetime(df_analise['DataHora']).to_numpy(),
+        'consumo': consumo,
+        'injecao_base': injecao_base,
+        'producao_por_kwp': producao_por_kwp,
+        'calendario': calendario,
+    }
+
+
+def fluxos_da_potencia(dados, parametros, potencia_kwp, baterias):
+    """
+    Consumo da rede e injeção finais de uma potência de painéis com cada bateria de 'baterias'
+    ([(capacidade_kwh, potencia_kw)], capacidade 0 = sem bateria): uma só simulação solar
+    e um só despacho em lote para todas as baterias.
+    Retorna uma lista de (consumo_rede_final, injecao_final), pela ordem de 'baterias'.
+    """
+    consumo = dados['consumo']
+
+    # --- Cenário solar (igual a aplicar_base_producao_solar + aplicar_simulacao_solar_aos_dados_base) ---
+    if dados['producao_por_kwp'] is None:
+        consumo_rede = consumo
+        injecao = dados['injecao_base']
+    else:
+        producao = dados['producao_por_kwp'] * potencia_kwp
+        # Intervalos sem consumo (NaN) não contam autoconsumo nem excedente, como no merge da aplicação
+        autoconsumo = np.nan_to_num(np.minimum(consumo, producao))
+        excedente = np.nan_to_num(np.maximum(0, producao - consumo))
+        consumo_rede = np.maximum(consumo - autoconsumo, 0)
+        injecao = dados['injecao_base'] + excedente
+
+    # --- Todas as baterias desta potência numa só passagem ---
+    baterias_com_capacidade = [(b_kwh, b_kw) for b_kwh, b_kw in baterias if b_kwh > 0]
+    lote_baterias = motor_bateria.despachar_baterias_em_lote(
+        injecao, consumo_rede,
+        [(b_kwh, b_kw, parametros['eficiencia_bateria'], parametros['dod_bateria']) for b_kwh, b_kw in baterias_com_capacidade]
+    )
+
+    fluxos = []
+    for b_kwh, b_kw in baterias:
+        if b_kwh > 0:
+            k = baterias_com_capacidade.index((b_kwh, b_kw))
+            fluxos.append((lote_baterias['Consumo_Rede_kWh'][k], lote_baterias['Excedente_kWh'][k]))
+        else:
+            fluxos.append((consumo_rede, injecao))
+    return fluxos
+
+
+def financeiro_do_cenario(dados, parametros, consumo_final, injecao_final):
+    """Balanço financeiro (calcular_valor_financeiro_cenario) de um cenário dado pelo consumo da rede e a injeção finais."""
+    return financeiro.calcular_valor_financeiro_cenario(
+        df_cenario=pd.DataFrame({
+            'DataHora': dados['DataHora'],
+            'Consumo_Rede_Final_kWh': consumo_final,
+            'Injecao_Rede_Final_kWh': injecao_final
+        }),
+        df_omie_completo=None,
+        precos_compra_kwh_siva=parametros['precos_energia'],
+        dias_calculo=parametros['dias'],
+        potencia_kva=parametros['potencia_kva'],
+        opcao_horaria_str=parametros['opcao_horaria'],
+        familia_numerosa_bool=parametros['familia_numerosa'],
+        modelo_venda=parametros['modelo_venda'],
+        tipo_comissao=parametros['tipo_comissao'],
+        valor_comissao=parametros['valor_comissao'],
+        venda_excedente_ativa=parametros.get('venda_excedente_ativa', True),
+        calendario_tarifario=dados['calendario']
+    )
+
+
+def poupancas_da_potencia(dados, parametros, potencia_kwp, baterias_kwh):
+    """
+    Poupanças anuais base de uma potência de painéis com cada capacidade de 'baterias_kwh' (0 = sem bateria,
+    potência de carga/descarga de metade da capacidade), face a parametros['financeiro_atual'].
+    Retorna uma lista de (custo_evitado_anual, receita_adicional_anual), pela ordem de 'baterias_kwh'.
+    """
+    fluxos = fluxos_da_potencia(dados, parametros, potencia_kwp, [(b_kwh, b_kwh / 2) for b_kwh in baterias_kwh])
+    return [
+        financeiro.poupancas_anuais_base(
+            parametros['financeiro_atual'], financeiro_do_cenario(dados, parametros, consumo_final, injecao_final), parametros['dias']
+        )
+        for consumo_final, injecao_final in fluxos
+    ]
+
+
+def _resultados_longo_prazo(parametros, custos_instalacao, poupancas):
+    """
+    Payback, ROI, poupança no período (bruta e líquida do custo), VAL e TIR de vários investimentos
+    de uma só vez ('poupancas' = [(custo_evitado_anual, receita_adicional_anual), ...]).
+    """
+    custos_evitados = [custo_evitado for custo_evitado, _ in poupancas]
+    receitas_adicionais = [receita for _, receita in poupancas]
+    analise_lp = longo_prazo.calcular_analise_longo_prazo_em_lote(
+        custos_instalacao, custos_evitados, receitas_adicionais,
+        anos_analise=parametros['anos_analise'],
+        taxa_degradacao_perc=parametros['degradacao'],
+        taxa_inflacao_energia_perc=parametros['inflacao_energia'],
+        taxa_variacao_venda_perc=parametros['variacao_venda'],
+        taxa_desconto_perc=parametros.get('taxa_desconto', 0.0)
+    )
+    return [{
+        'custo_evitado_anual': custos_evitados[i],
+        'receita_adicional_anual': receitas_adicionais[i],
+        'poupanca_anual': custos_evitados[i] + receitas_adicionais[i],
+        'payback_anos': float(analise_lp['payback_detalhado'][i]),
+        'roi_simples_anual': float(analise_lp['roi_simples_anual'][i]),
+        'poupanca_total_periodo': float(analise_lp['poupanca_total_periodo'][i]),
+        'poupanca_liquida': float(analise_lp['poupanca_total_periodo'][i] - custos_instalacao[i]),
+        'val': float(analise_lp['val'][i]),
+        'tir': float(analise_lp['tir'][i]),
+    } for i in range(len(poupancas))]
+
+
+def avaliar_potencia(dados, parametros, potencia_kwp):
+    """
+    Avalia uma potência de painéis com todas as baterias de parametros['baterias_kwh'].
+    Retorna uma lista de dicionários (um por bateria, pela mesma ordem) com o custo estimado,
+    as poupanças anuais base, o payback, o ROI, a poupança no período (bruta e líquida do custo),
+    o VAL (à taxa parametros['taxa_desconto'], em %, se indicada) e a TIR.
+    """
+    baterias_kwh = parametros['baterias_kwh']
+    poupancas = poupancas_da_potencia(dados, parametros, potencia_kwp, baterias_kwh)
+    custos = [potencia_kwp * parametros['custo_por_kwp'] + b_kwh * parametros['custo_por_kwh'] for b_kwh in baterias_kwh]
+    return [
+        {'potencia_kwp': potencia_kwp, 'capacidade_kwh': b_kwh, 'custo_estimado': custo, **resultado_lp}
+        for b_kwh, custo, resultado_lp in zip(baterias_kwh, custos, _resultados_longo_prazo(parametros, custos, poupancas))
+    ]
+
+
+# --- Memória partilhada ---
+
+# Arrays que só alguns 'dados' têm (ex: os anos meteorológicos e de preços OMIE do monte_carlo)
+_ARRAYS_OPCIONAIS = ('producao_por_kwp_anos', 'omie_anos')
+
+
+def _arrays_partilhaveis(dados):
+    """Os arrays de 'dados' (incluindo os do calendário) num dicionário plano {nome: array}."""
+    arrays = {nome: dados[nome] for nome in ('consumo', 'injecao_base', 'producao_por_kwp') if dados[nome] is not None}
+    arrays.update({nome: dados[nome] for nome in _ARRAYS_OPCIONAIS if dados.get(nome) is not None})
+    arrays['DataHora'] = dados['DataHora'].astype('datetime64[ns]').view(np.int64)
+    calendario = dados['calendario']
+    arrays['calendario.DataHora_ns'] = calendario['DataHora_ns']
+    arrays['calendario.omie'] = calendario['omie']
+    for ciclo, codigos in calendario['codigos'].items():
+        arrays[f'calendario.codigos.{ciclo}'] = codigos
+    return arrays
+
+
+def _publicar(dados):
+    """
+    Copia os arrays de 'dados' para um bloco de memória partilhada.
+    Retorna (bloco, descricao); 'descricao' é o que um processo de trabalho precisa para os ler (ver _ligar).
+    """
+    arrays = {nome: np.ascontiguousarray(a) for nome, a in _arrays_partilhaveis(dados).items()}
+    posicoes = {}
+    tamanho = 0
+    for nome, a in arrays.items():
+        tamanho = -(-tamanho // 8) * 8 # Alinhamento a 8 bytes
+        posicoes[nome] = (tamanho, a.dtype.str, a.shape)
+        tamanho += a.nbytes
+
+    bloco = shared_memory.SharedMemory(create=True, size=max(tamanho, 1))
+    for nome, a in arrays.items():
+        inicio, dtype, forma = posicoes[nome]
+        np.ndarray(forma, dtype=dtype, buffer=bloco.buf, offset=inicio)[...] = a
+
+    descricao = {
+        'bloco': bloco.name,
+        'arrays': posicoes,
+        'rotulos': dados['calendario']['rotulos'],
+        'com_producao': dados['producao_por_kwp'] is not None,
+    }
+    return bloco, descricao
+
+
+def _ligar(descricao):
+    """Reconstrói, num processo de trabalho, os 'dados' publicados por _publicar (vistas só de leitura, sem cópia)."""
+    bloco = shared_memory.SharedMemory(name=descricao['bloco'])
+
+    arrays = {}
+    for nome, (inicio, dtype, forma) in descricao['arrays'].items():
+        a = np.ndarray(forma, dtype=dtype, buffer=bloco.buf, offset=inicio)
+        a.flags.writeable = False
+        arrays[nome] = a
+
+    codigos = {nome.rsplit('.', 1)[1]: a for nome, a in arrays.items() if nome.startswith('calendario.codigos.')}
+    dados = {
+        'DataHora': arrays['DataHora'].view('datetime64[ns]'),
+        'consumo': arrays['consumo'],
+        'injecao_base': arrays['injecao_base'],
+        'producao_por_kwp': arrays['producao_por_kwp'] if descricao['com_producao'] else None,
+        'calendario': {
+            'DataHora_ns': arrays['calendario.DataHora_ns'],
+            'codigos': codigos,
+            'rotulos': descricao['rotulos'],
+            'omie': arrays['calendario.omie'],
+        },
+    }
+    dados.update({nome: arrays[nome] for nome in _ARRAYS_OPCIONAIS if nome in arrays})
+    return bloco, dados
+
+
+# (bloco, dados, parametros) do processo de trabalho atual
+_ESTADO_PROCESSO = None
+
+
+def _inicializar_processo(descricao, parametros):
+    global _ESTADO_PROCESSO
+    bloco, dados = _ligar(descricao)
+    _ESTADO_PROCESSO = (bloco, dados, parametros)
+
+
+def _avaliar_potencia_no_processo(potencia_kwp):
+    _, dados, parametros = _ESTADO_PROCESSO
+    return avaliar_potencia(dados, parametros, potencia_kwp)
+
+
+def processos_para_trabalho(dados, combinacoes, tarefas, processos=PROCESSOS_DIMENSIONAMENTO):
+    """
+    Processos a usar para avaliar 'combinacoes' combinações em 'tarefas' tarefas: 1 (em sequência) se o trabalho
+    não passar LIMIAR_TRABALHO_PROCESSOS, senão 'processos' (no máximo um por tarefa).
+    """
+    if combinacoes * len(dados['consumo']) < LIMIAR_TRABALHO_PROCESSOS:
+        return 1
+    return min(processos, tarefas)
+
+
+@contextmanager
+def _processos_de_trabalho(dados, parametros, processos):
+    """
+    ProcessPoolExecutor com 'dados' publicados em memória partilhada (libertada à saída),
+    ou None se processos <= 1 ou o ambiente não suportar processos/memória partilhada (avaliar em sequência).
+    """
+    if processos <= 1:
+        yield None
+        return
+    try:
+        bloco, descricao = _publicar(dados)
+    except OSError:
+        yield None
+        return
+    try:
+        try:
+            executor = ProcessPoolExecutor(
+                max_workers=processos, mp_context=CONTEXTO_PROCESSOS,
+                initializer=_inicializar_processo, initargs=(descricao, parametros)
+            )
+        except OSError:
+            executor = None
+        if executor is None:
+            yield None
+        else:
+            with executor:
+                yield executor
+    finally:
+        bloco.close()
+        bloco.unlink()
+
+
+def varrer_dimensionamento(dados, parametros, potencias_kwp, processos=PROCESSOS_DIMENSIONAMENTO):
+    """
+    Avalia todas as combinações de 'potencias_kwp' x parametros['baterias_kwh'].
+    'dados' vem de preparar_dados_dimensionamento; 'parametros' tem os preços, a opção horária, a venda,
+    o financeiro atual, a eficiência/DoD da bateria, os custos de referência e os parâmetros de longo prazo.
+
+    Devolve, à medida que cada potência termina (não necessariamente pela ordem dada), a lista
+    de resultados dessa potência (ver avaliar_potencia), para a tabela poder ir sendo preenchida.
+    Se o gerador for fechado a meio (nova execução da página), as potências ainda por começar são canceladas.
+    """
+    potencias_kwp = list(potencias_kwp)
+    combinacoes = len(potencias_kwp) * len(parametros['baterias_kwh'])
+    processos = processos_para_trabalho(dados, combinacoes, len(potencias_kwp), processos)
+    with _processos_de_trabalho(dados, parametros, processos) as executor:
+        if executor is not None:
+            futuros = [executor.submit(_avaliar_potencia_no_processo, p_kwp) for p_kwp in potencias_kwp]
+            try:
+                for futuro in as_completed(futuros):
+                    yield futuro.result()
+            finally:
+                # Não ficar à espera das restantes potências ao sair do executor
+                for futuro in futuros:
+                    futuro.cancel()
+            return
+    for p_kwp in potencias_kwp:
+        yield avaliar_potencia(dados, parametros, p_kwp)
+
+
+def _poupancas_da_potencia_no_processo(tarefa):
+    _, dados, parametros = _ESTADO_PROCESSO
+    return poupancas_da_potencia(dados, parametros, *tarefa)
+
+
+def avaliar_propostas(dados, parametros, propostas, processos=PROCESSOS_DIMENSIONAMENTO):
+    """
+    Avalia as propostas do Comparador de Propostas ({'nome', 'kwp', 'kwh_bat', 'custo'}).
+
+    O trabalho comum é feito uma só vez: as propostas com a mesma potência partilham a simulação solar
+    e as que têm também a mesma bateria partilham o despacho e o financeiro (poupancas_da_potencia).
+    As potências distintas são avaliadas em paralelo se o trabalho o justificar (processos_para_trabalho,
+    normalmente não: são poucas combinações); o longo prazo de todas as propostas, cada uma com o seu
+    custo, é calculado de uma só vez (longo_prazo.calcular_analise_longo_prazo_em_lote).
+    Retorna uma lista de resultados pela ordem das propostas.
+    """
+    baterias_por_potencia = {}
+    for proposta in propostas:
+        baterias = baterias_por_potencia.setdefault(proposta['kwp'], [])
+        if proposta['kwh_bat'] not in baterias:
+            baterias.append(proposta['kwh_bat'])
+    tarefas = list(baterias_por_potencia.items())
+    combinacoes = sum(len(baterias) for baterias in baterias_por_potencia.values())
+
+    processos = processos_para_trabalho(dados, combinacoes, len(tarefas), processos)
+    with _processos_de_trabalho(dados, parametros, processos) as executor:
+        if executor is not None:
+            lista_poupancas = list(executor.map(_poupancas_da_potencia_no_processo, tarefas))
+        else:
+            lista_poupancas = [poupancas_da_potencia(dados, parametros, *tarefa) for tarefa in tarefas]
+
+    poupancas = {
+        (p_kwp, b_kwh): poupanca
+        for (p_kwp, baterias), poupancas_potencia in zip(tarefas, lista_poupancas)
+        for b_kwh, poupanca in zip(baterias, poupancas_potencia)
+    }
+    resultados_lp = _resultados_longo_prazo(
+        parametros, [proposta['custo'] for proposta in propostas],
+        [poupancas[(proposta['kwp'], proposta['kwh_bat'])] for proposta in propostas]
+    )
+    return [{**proposta, **resultado_lp} for proposta, resultado_lp in zip(propostas, resultados_lp)]
+
+
+# --- Procura do dimensionamento ótimo ---
+
+OBJETIVOS_OTIMIZACAO = {
+    'payback': "Menor payback",
+    'val': "Maior VAL (valor atual líquido)",
+    'poupanca_liquida': "Maior poupança líquida no período de análise",
+}
+
+# Uma bateria maior que não aumenta a poupança anual mais do que isto (€/ano) está saturada:
+# todas as capacidades acima custam mais e não poupam mais (são dominadas)
+TOLERANCIA_SATURACAO_EUR = 1.0
+
+_RAZAO_AUREA = (math.sqrt(5) - 1) / 2
+
+
+def _pontuacao(resultado, objetivo):
+    """Valor a minimizar para o objetivo. Sem investimento não há payback (não conta como ótimo)."""
+    if objetivo == 'payback':
+        return resultado['payback_anos'] if resultado['custo_estimado'] > 0 else float('inf')
+    return -resultado[objetivo]
+
+
+def _grelha(minimo, maximo, passo):
+    """Pontos de 'minimo' a 'maximo' (inclusive), espaçados de 'passo'."""
+    n = max(0, int(math.floor((maximo - minimo) / passo + 1e-9)))
+    return [round(minimo + i * passo, 6) for i in range(n + 1)]
+
+
+def _pontos_interiores(a, b):
+    """Os dois pontos interiores da secção áurea de [a, b] (índices inteiros, com a < c < d < b)."""
+    c = b - int(round((b - a) * _RAZAO_AUREA))
+    d = a + int(round((b - a) * _RAZAO_AUREA))
+    c, d = min(c, d), max(c, d)
+    c = min(max(c, a + 1), b - 2)
+    d = min(max(d, c + 1), b - 1)
+    return c, d
+
+
+def _pontos_secao_aurea(n):
+    """Número aproximado (por excesso) de pontos que a secção áurea avalia numa grelha de n pontos."""
+    if n <= 3:
+        return n
+    return min(n, 2 * math.ceil(math.log(n) / -math.log(_RAZAO_AUREA)) + 3)
+
+
+def _limite_saturacao(avaliados):
+    """
+    Menor índice p avaliado tal que uma capacidade maior, também avaliada, não poupa mais
+    (até TOLERANCIA_SATURACAO_EUR); tudo acima de p é dominado. None se ainda não houver saturação.
+    """
+    indices = sorted(avaliados)
+    for posicao, p in enumerate(indices):
+        poupanca_p = avaliados[p]['poupanca_anual']
+        if any(avaliados[q]['poupanca_anual'] <= poupanca_p + TOLERANCIA_SATURACAO_EUR for q in indices[posicao + 1:]):
+            return p
+    return None
+
+
+def otimizar_bateria(dados, parametros, potencia_kwp, objetivo, intervalo_kwh, passo_kwh):
+    """
+    Procura, para uma potência de painéis, a capacidade de bateria que otimiza 'objetivo'
+    (secção áurea sobre a grelha de 'passo_kwh' em 'intervalo_kwh'). As capacidades acima da saturação
+    da bateria são cortadas logo que esta é detetada. Retorna todos os resultados avaliados.
+    """
+    capacidades = _grelha(intervalo_kwh[0], intervalo_kwh[1], passo_kwh)
+    avaliados = {}
+
+    def avaliar(i):
+        if i not in avaliados:
+            avaliados[i] = avaliar_potencia(dados, {**parametros, 'baterias_kwh': [capacidades[i]]}, potencia_kwp)[0]
+        return _pontuacao(avaliados[i], objetivo)
+
+    a, b = 0, len(capacidades) - 1
+    avaliar(a) # A capacidade mínima (normalmente, sem bateria) é a referência para a saturação
+    while b - a > 2:
+        c, d = _pontos_interiores(a, b)
+        if avaliar(c) <= avaliar(d):
+            b = d
+        else:
+            a = c
+        limite = _limite_saturacao(avaliados)
+        if limite is not None and limite < b:
+            a, b = min(a, limite), limite
+    for i in range(a, b + 1):
+        avaliar(i)
+    return [avaliados[i] for i in sorted(avaliados)]
+
+
+def _otimizar_bateria_no_processo(tarefa):
+    _, dados, parametros = _ESTADO_PROCESSO
+    return otimizar_bateria(dados, parametros, *tarefa)
+
+
+def fronteira_pareto(resultados):
+    """
+    Resultados não dominados em custo (menor) vs poupança anual (maior), por ordem crescente de custo:
+    cada ponto da fronteira poupa mais do que todos os mais baratos.
+    """
+    fronteira = []
+    for resultado in sorted(resultados, key=lambda r: (r['custo_estimado'], -r['poupanca_anual'])):
+        if not fronteira or resultado['poupanca_anual'] > fronteira[-1]['poupanca_anual']:
+            fronteira.append(resultado)
+    return fronteira
+
+
+def otimizar_dimensionamento(dados, parametros, objetivo, intervalo_kwp, intervalo_kwh, passo_kwp=0.1, passo_kwh=0.5,
+                             processos=PROCESSOS_DIMENSIONAMENTO, progresso=None):
+    """
+    Procura a potência de painéis e a capacidade de bateria que otimizam 'objetivo' (ver OBJETIVOS_OTIMIZACAO)
+    nos intervalos contínuos dados (discretizados em 'passo_kwp' e 'passo_kwh').
+
+    Secção áurea sobre a potência; para cada potência avaliada, secção áurea sobre a capacidade
+    (otimizar_bateria). Os dois pontos interiores de cada passo são avaliados em paralelo, se o trabalho
+    estimado o justificar (processos_para_trabalho).
+    'progresso', se indicado, é chamado como progresso(pontos_avaliados) depois de cada passo.
+
+    Retorna {'melhor', 'fronteira_pareto', 'avaliados', 'pontos_grelha'}: o melhor resultado, a fronteira
+    de Pareto custo vs poupança anual dos pontos avaliados, todos os pontos avaliados e o número de pontos
+    que uma grelha densa com os mesmos passos teria.
+    """
+    if objetivo not in OBJETIVOS_OTIMIZACAO:
+        raise ValueError(f"Objetivo desconhecido: '{objetivo}'. Opções: {', '.join(OBJETIVOS_OTIMIZACAO)}.")
+    potencias = _grelha(intervalo_kwp[0], intervalo_kwp[1], passo_kwp)
+    por_potencia = {}
+
+    def melhor_da_potencia(i):
+        return min(_pontuacao(r, objetivo) for r in por_potencia[i])
+
+    # Estimativa do trabalho: a secção áurea avalia cerca de 2 log(n) + 3 pontos em cada eixo
+    combinacoes = _pontos_secao_aurea(len(potencias)) * _pontos_secao_aurea(len(_grelha(intervalo_kwh[0], intervalo_kwh[1], passo_kwh)))
+    processos = processos_para_trabalho(dados, combinacoes, 2, processos)
+    with _processos_de_trabalho(dados, parametros, processos) as executor:
+        def avaliar_potencias(indices):
+            novos = [i for i in dict.fromkeys(indices) if i not in por_potencia]
+            tarefas = [(potencias[i], objetivo, intervalo_kwh, passo_kwh) for i in novos]
+            if executor is not None:
+                resultados = executor.map(_otimizar_bateria_no_processo, tarefas)
+            else:
+                resultados = (otimizar_bateria(dados, parametros, *tarefa) for tarefa in tarefas)
+            for i, resultados_potencia in zip(novos, resultados):
+                por_potencia[i] = resultados_potencia
+            if progresso is not None:
+                progresso(sum(len(r) for r in por_potencia.values()))
+
+        a, b = 0, len(potencias) - 1
+        while b - a > 2:
+            c, d = _pontos_interiores(a, b)
+            avaliar_potencias([c, d])
+            if melhor_da_potencia(c) <= melhor_da_potencia(d):
+                b = d
+            else:
+                a = c
+        avaliar_potencias(range(a, b + 1))
+
+    avaliados = [r for i in sorted(por_potencia) for r in por_potencia[i]]
+    return {
+        'melhor': min(avaliados, key=lambda r: _pontuacao(r, objetivo)),
+        'fronteira_pareto': fronteira_pareto(avaliados),
+        'avaliados': avaliados,
+        'pontos_grelha': len(potencias) * len(_grelha(intervalo_kwh[0], intervalo_kwh[1], passo_kwh)),
+    }
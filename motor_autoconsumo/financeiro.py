@@ -0,0 +1,409 @@
+# --- Financeiro: custo da energia com IVA, receita de venda e balanço de cada cenário ---
+import numpy as np
+import pandas as pd
+
+import calendario_tarifario as cal_tarifario
+
+
+# --- Função para obter valores da aba Constantes ---
+def obter_constante(nome_constante, constantes_df):
+    constante_row = constantes_df[constantes_df['constante'] == nome_constante]
+    if not constante_row.empty:
+        valor = constante_row['valor_unitário'].iloc[0]
+        try:
+            return float(valor)
+        except (ValueError, TypeError):
+            # st.warning(f"Valor não numérico para constante '{nome_constante}': {valor}")
+            return 0.0
+    else:
+        # st.warning(f"Constante '{nome_constante}' não encontrada.")
+        return 0.0
+
+# --- Função: Calcular custo de energia com IVA (limite 200 ou 300 kWh/30 dias apenas <= 6.9 kVA), para diferentes opções horárias
+def calcular_custo_energia_com_iva(
+    consumo_kwh_total_periodo, preco_energia_final_sem_iva_simples,
+    precos_energia_final_sem_iva_horario, dias_calculo, potencia_kva,
+    opcao_horaria_str, consumos_horarios, familia_numerosa_bool
+):
+    if not isinstance(opcao_horaria_str, str):
+        return {'custo_com_iva': 0.0, 'custo_sem_iva': 0.0, 'valor_iva_6': 0.0, 'valor_iva_23': 0.0}
+
+    opcao_horaria_lower = opcao_horaria_str.lower()
+    iva_normal_perc = 0.23
+    iva_reduzido_perc = 0.06
+    
+    custo_total_com_iva = 0.0
+    custo_total_sem_iva = 0.0
+    total_iva_6_energia = 0.0
+    total_iva_23_energia = 0.0
+
+    precos_horarios = precos_energia_final_sem_iva_horario if isinstance(precos_energia_final_sem_iva_horario, dict) else {}
+    consumos_periodos = consumos_horarios if isinstance(consumos_horarios, dict) else {}
+
+    # Calcular custo total sem IVA primeiro
+    if opcao_horaria_lower == "simples":
+        consumo_s = float(consumo_kwh_total_periodo)
+        preco_s = float(preco_energia_final_sem_iva_simples or 0.0)
+        custo_total_sem_iva = consumo_s * preco_s
+    else: # Bi ou Tri
+        for periodo, consumo_p in consumos_periodos.items():
+            consumo_p_float = float(consumo_p if consumo_p is not None else 0.0) # Forma mais segura
+            preco_h = float(precos_horarios.get(periodo, 0.0)) # Removemos o 'or 0.0'
+            custo_total_sem_iva += consumo_p_float * preco_h
+            
+    # Determinar limite para IVA reduzido
+    limite_kwh_periodo_global = 0.0
+    if potencia_kva <= 6.9:
+        limite_kwh_mensal = 300 if familia_numerosa_bool else 200
+        limite_kwh_periodo_global = (limite_kwh_mensal * dias_calculo / 30.0) if dias_calculo > 0 else 0.0
+
+    if limite_kwh_periodo_global == 0.0: # Sem IVA reduzido, tudo a 23%
+        total_iva_23_energia = custo_total_sem_iva * iva_normal_perc
+        custo_total_com_iva = custo_total_sem_iva + total_iva_23_energia
+    else: # Com IVA reduzido/Normal
+        if opcao_horaria_lower == "simples":
+            consumo_s = float(consumo_kwh_total_periodo)
+            preco_s = float(preco_energia_final_sem_iva_simples or 0.0)
+
+            
+            consumo_para_iva_reduzido = min(consumo_s, limite_kwh_periodo_global)
+            consumo_para_iva_normal = max(0.0, consumo_s - limite_kwh_periodo_global)
+            
+            base_iva_6 = consumo_para_iva_reduzido * preco_s
+            base_iva_23 = consumo_para_iva_normal * preco_s
+            
+            total_iva_6_energia = base_iva_6 * iva_reduzido_perc
+            total_iva_23_energia = base_iva_23 * iva_normal_perc
+            custo_total_com_iva = base_iva_6 + total_iva_6_energia + base_iva_23 + total_iva_23_energia
+        else: # Bi ou Tri rateado
+            consumo_total_real_periodos = sum(float(v or 0.0) for v in consumos_periodos.values())
+            if consumo_total_real_periodos > 0:
+                for periodo, consumo_periodo in consumos_periodos.items():
+                    consumo_periodo_float = float(consumo_periodo or 0.0)
+                    preco_periodo = float(precos_horarios.get(periodo, 0.0) or 0.0)
+                    
+                    fracao_consumo_periodo = consumo_periodo_float / consumo_total_real_periodos
+                    limite_para_este_periodo_rateado = limite_kwh_periodo_global * fracao_consumo_periodo
+                    
+                    consumo_periodo_iva_reduzido = min(consumo_periodo_float, limite_para_este_periodo_rateado)
+                    consumo_periodo_iva_normal = max(0.0, consumo_periodo_float - limite_para_este_periodo_rateado)
+                    
+                    base_periodo_iva_6 = consumo_periodo_iva_reduzido * preco_periodo
+                    base_periodo_iva_23 = consumo_periodo_iva_normal * preco_periodo
+                    
+                    iva_6_este_periodo = base_periodo_iva_6 * iva_reduzido_perc
+                    iva_23_este_periodo = base_periodo_iva_23 * iva_normal_perc
+                    
+                    total_iva_6_energia += iva_6_este_periodo
+                    total_iva_23_energia += iva_23_este_periodo
+                    custo_total_com_iva += base_periodo_iva_6 + iva_6_este_periodo + base_periodo_iva_23 + iva_23_este_periodo
+            else: # Se consumo_total_real_periodos for 0, tudo é zero
+                 custo_total_com_iva = 0.0
+                 # total_iva_6_energia e total_iva_23_energia permanecem 0.0
+
+    return {
+        'custo_com_iva': round(custo_total_com_iva, 4),
+        'custo_sem_iva': round(custo_total_sem_iva, 4),
+        'valor_iva_6': round(total_iva_6_energia, 4),
+        'valor_iva_23': round(total_iva_23_energia, 4)
+    }
+
+
+# Coluna de períodos da aba OMIE_CICLOS correspondente a cada opção horária
+CICLO_POR_OPCAO_HORARIA = {
+    'bi-horário - ciclo diário': 'BD', 'bi-horário - ciclo semanal': 'BS',
+    'tri-horário - ciclo diário': 'TD', 'tri-horário - ciclo semanal': 'TS'
+}
+
+
+def preparar_calendario_tarifario(datahora, df_omie_completo):
+    """
+    Calendário tarifário (períodos BD/BS/TD/TS e preço OMIE) alinhado com as linhas de consumo.
+    Calculado uma vez por ficheiro e filtro de datas, e reutilizado em todos os cálculos financeiros.
+    """
+    return cal_tarifario.construir_calendario_tarifario(datahora, df_omie_completo)
+
+
+
+def calcular_valor_financeiro_cenario(
+    df_cenario,
+    df_omie_completo,
+    precos_compra_kwh_siva, # Dicionário com preços por período
+    dias_calculo,
+    potencia_kva,
+    opcao_horaria_str,
+    familia_numerosa_bool,
+    # --- Para venda ---
+    modelo_venda,
+    tipo_comissao,
+    valor_comissao,
+    venda_excedente_ativa=True,
+    calendario_tarifario=None
+
+):
+    """
+    Calcula o valor financeiro de um cenário de autoconsumo, com cálculo detalhado
+    do custo de compra da rede e da receita de venda do excedente.
+
+    'calendario_tarifario' (opcional) é o calendário pré-calculado para as mesmas linhas de
+    df_cenario (ver preparar_calendario_tarifario); se não corresponder, é construído aqui.
+    """
+    if df_cenario.empty:
+        return {'custo_compra_c_iva': 0, 'receita_venda': 0, 'balanco_final': 0, 'preco_medio_venda': 0}
+
+    # --- 1. CÁLCULO DETALHADO DO CUSTO DE COMPRA DA REDE ---
+    
+    # 1.1. Períodos horários e preço OMIE de cada intervalo, alinhados com as linhas do cenário
+    if not cal_tarifario.calendario_alinhado(calendario_tarifario, df_cenario['DataHora']):
+        calendario_tarifario = cal_tarifario.construir_calendario_tarifario(df_cenario['DataHora'], df_omie_completo)
+    consumo_rede = df_cenario['Consumo_Rede_Final_kWh'].to_numpy(dtype=np.float64)
+    
+    # 1.2. Agregar o consumo da rede por cada período horário (V, F, C, P, etc.)
+    consumos_rede_por_periodo = {}
+    oh_lower = opcao_horaria_str.lower()
+    
+    ciclo_col = CICLO_POR_OPCAO_HORARIA.get(oh_lower)
+
+    consumo_rede_total = np.nansum(consumo_rede)
+    if oh_lower == "simples":
+        consumos_rede_por_periodo['S'] = consumo_rede_total
+    elif ciclo_col and ciclo_col in calendario_tarifario['codigos']:
+        # Soma os kWh da rede para cada período do ciclo (ex: 'BD' -> 'V', 'F')
+        somas = cal_tarifario.somar_por_periodo(calendario_tarifario, ciclo_col, consumo_rede)
+        consumos_rede_por_periodo.update(somas)
+
+    # 1.3. Chamar a sua função de cálculo de custo de energia com os dados corretos
+    
+    # Extrair o preço simples ou o dicionário de preços horários
+    preco_simples = precos_compra_kwh_siva.get('S')
+    precos_horarios = {k: v for k, v in precos_compra_kwh_siva.items() if k != 'S'}
+
+    # Usamos a sua função já existente!
+    resultado_custo_energia = calcular_custo_energia_com_iva(
+        consumo_kwh_total_periodo=consumo_rede_total,
+        preco_energia_final_sem_iva_simples=preco_simples,
+        precos_energia_final_sem_iva_horario=precos_horarios,
+        dias_calculo=dias_calculo,
+        potencia_kva=potencia_kva,
+        opcao_horaria_str=opcao_horaria_str,
+        consumos_horarios=consumos_rede_por_periodo,
+        familia_numerosa_bool=familia_numerosa_bool
+    )
+    
+    custo_compra_final_com_iva = resultado_custo_energia['custo_com_iva']
+
+    # --- 2. CÁLCULO DA RECEITA DE VENDA ---
+    injecao_rede_total = df_cenario['Injecao_Rede_Final_kWh'].sum()
+    receita_venda = 0
+    preco_medio_venda = 0
+
+    if venda_excedente_ativa and injecao_rede_total > 0:
+        if modelo_venda == 'Preço Fixo':
+            receita_venda = injecao_rede_total * valor_comissao
+            preco_medio_venda = valor_comissao
+        
+        elif modelo_venda == 'Indexado ao OMIE':
+            receita_venda = cal_tarifario.receita_venda_omie(
+                calendario_tarifario, df_cenario['Injecao_Rede_Final_kWh'].to_numpy(dtype=np.float64),
+                tipo_comissao, valor_comissao
+            )
+            
+            preco_medio_venda = receita_venda / injecao_rede_total if injecao_rede_total > 0 else 0
+
+    # 3. Balanço Final
+    balanco_final = custo_compra_final_com_iva - receita_venda
+
+    return {
+        'custo_compra_c_iva': custo_compra_final_com_iva,
+        'receita_venda': receita_venda,
+        'balanco_final': balanco_final,
+        'preco_medio_venda': preco_medio_venda
+    }
+
+def calcular_poupanca_upac_existente(analise_real, financeiro_atual, preco_compra_kwh):
+    """
+    Calcula a poupança gerada por um sistema UPAC já existente e retorna o detalhe.
+    """
+    # Custo que o utilizador TERIA se não tivesse painéis (teria de comprar todo o consumo)
+    custo_sem_upac = analise_real['consumo_total_casa'] * preco_compra_kwh
+
+    # Custo que o utilizador TEM com a sua UPAC atual (o seu balanço final)
+    custo_com_upac = financeiro_atual['balanco_final']
+    
+    poupanca_gerada_total = custo_sem_upac - custo_com_upac
+
+    # --- Detalhe da Poupança ---
+    # 1. Poupança por evitar comprar energia (valor do autoconsumo)
+    valor_do_autoconsumo = analise_real['autoconsumo_total'] * preco_compra_kwh
+    
+    # 2. Receita da venda de excedente (já calculada no balanço financeiro)
+    receita_da_venda = financeiro_atual['receita_venda']
+    
+    # Retorna um dicionário com todos os valores
+    return {
+        'total': poupanca_gerada_total,
+        'por_autoconsumo': valor_do_autoconsumo,
+        'por_venda_excedente': receita_da_venda
+    }
+def cenario_atual_para_financeiro(df_analise):
+    """O cenário atual (o do ficheiro) com as colunas usadas por calcular_valor_financeiro_cenario."""
+    return pd.DataFrame({
+        'DataHora': df_analise['DataHora'],
+        'Consumo_Rede_Final_kWh': df_analise['Consumo (kWh)'],
+        'Injecao_Rede_Final_kWh': df_analise.get('Injecao_Rede_kWh', pd.Series(0))
+    })
+
+def poupancas_anuais_base(financeiro_atual, financeiro_cenario, dias_calculo):
+    """
+    Poupança anual base de um cenário face ao atual, decomposta em custo evitado na compra
+    e receita adicional de venda (os valores do período extrapolados para 365,25 dias).
+    Retorna (custo_evitado_anual, receita_adicional_anual).
+    """
+    if dias_calculo <= 0:
+        return 0, 0
+    custo_evitado_periodo = financeiro_atual['custo_compra_c_iva'] - financeiro_cenario['custo_compra_c_iva']
+    receita_adicional_periodo = financeiro_cenario['receita_venda'] - financeiro_atual['receita_venda']
+    return custo_evitado_periodo * (365.25 / dias_calculo), receita_adicional_periodo * (365.25 / dias_calculo)
+
+def _balancos_mensais_cenario(datahora, consumo_rede, injecao_rede, meses_chave, calendario, **kwargs):
+    """
+    Balanço financeiro de cada mês de um cenário, numa só passagem pelos dados.
+
+    'meses_chave' são os meses a calcular (ano*12 + mês-1, ordenados). Os consumos são agregados
+    numa matriz (mês x período) com np.bincount e a receita de venda por mês da mesma forma;
+    só o custo com IVA (limite de IVA reduzido proporcional aos dias de cada mês) é feito mês a mês.
+    Devolve uma lista com o balanço de cada mês (0 para meses sem dados).
+    """
+    opcao_horaria = kwargs.get('opcao_horaria_str')
+    precos_energia = kwargs.get('precos_compra_kwh_siva')
+    modelo_venda = kwargs.get('modelo_venda')
+    valor_comissao = kwargs.get('valor_comissao')
+    venda_excedente_ativa = kwargs.get('venda_excedente_ativa', True)
+
+    n_meses = len(meses_chave)
+    datahora_ns = pd.DatetimeIndex(datahora).asi8
+    mes_linha = datahora.to_numpy().astype('datetime64[M]').astype(np.int64) + 1970 * 12
+    indice_mes = np.searchsorted(meses_chave, mes_linha)
+    indice_mes[indice_mes >= n_meses] = n_meses - 1
+    indice_mes = np.where(meses_chave[indice_mes] == mes_linha, indice_mes, -1)
+    linhas_validas = indice_mes >= 0
+    indice_valido = indice_mes[linhas_validas]
+
+    # Totais mensais e número de dias de cada mês (primeiro ao último registo, como no cálculo por período)
+    linhas_por_mes = np.bincount(indice_valido, minlength=n_meses)
+    consumo_mes = np.bincount(indice_valido, weights=np.nan_to_num(consumo_rede[linhas_validas]), minlength=n_meses)
+    injecao_mes = np.bincount(indice_valido, weights=np.nan_to_num(injecao_rede[linhas_validas]), minlength=n_meses)
+    inicio_mes = np.full(n_meses, np.iinfo(np.int64).max)
+    fim_mes = np.full(n_meses, np.iinfo(np.int64).min)
+    np.minimum.at(inicio_mes, indice_valido, datahora_ns[linhas_validas])
+    np.maximum.at(fim_mes, indice_valido, datahora_ns[linhas_validas])
+    nanossegundos_dia = 86400 * 10**9
+
+    # Matriz (mês x período) de consumo da rede
+    oh_lower = opcao_horaria.lower() if isinstance(opcao_horaria, str) else ''
+    ciclo_col = CICLO_POR_OPCAO_HORARIA.get(oh_lower)
+    matriz_periodos = None
+    if oh_lower != "simples" and ciclo_col and ciclo_col in calendario['codigos']:
+        somas, ocorrencias = cal_tarifario.somar_por_grupo_e_periodo(calendario, ciclo_col, indice_mes, n_meses, consumo_rede)
+        matriz_periodos = (somas, ocorrencias, calendario['rotulos'][ciclo_col])
+
+    # Receita de venda indexada ao OMIE, por mês
+    receita_omie_mes = None
+    if venda_excedente_ativa and modelo_venda == 'Indexado ao OMIE':
+        preco_venda_kwh = cal_tarifario.precos_venda_omie(calendario, kwargs.get('tipo_comissao'), valor_comissao)
+        receita_omie_mes = np.bincount(
+            indice_valido, weights=(np.nan_to_num(injecao_rede) * preco_venda_kwh)[linhas_validas], minlength=n_meses
+        )
+
+    preco_simples = precos_energia.get('S')
+    precos_horarios = {k: v for k, v in precos_energia.items() if k != 'S'}
+
+    balancos = []
+    for m in range(n_meses):
+        if linhas_por_mes[m] == 0:
+            balancos.append(0)
+            continue
+
+        if oh_lower == "simples":
+            consumos_rede_por_periodo = {'S': consumo_mes[m]}
+        elif matriz_periodos is not None:
+            somas, ocorrencias, rotulos = matriz_periodos
+            consumos_rede_por_periodo = {rotulo: somas[m, p] for p, rotulo in enumerate(rotulos) if ocorrencias[m, p] > 0}
+        else:
+            consumos_rede_por_periodo = {}
+
+        custo = calcular_custo_energia_com_iva(
+            consumo_kwh_total_periodo=consumo_mes[m],
+            preco_energia_final_sem_iva_simples=preco_simples,
+            precos_energia_final_sem_iva_horario=precos_horarios,
+            dias_calculo=int((fim_mes[m] - inicio_mes[m]) // nanossegundos_dia) + 1,
+            potencia_kva=kwargs.get('potencia_kva'),
+            opcao_horaria_str=opcao_horaria,
+            consumos_horarios=consumos_rede_por_periodo,
+            familia_numerosa_bool=kwargs.get('familia_numerosa_bool')
+        )['custo_com_iva']
+
+        receita_venda = 0
+        if venda_excedente_ativa and injecao_mes[m] > 0:
+            if modelo_venda == 'Preço Fixo':
+                receita_venda = injecao_mes[m] * valor_comissao
+            elif modelo_venda == 'Indexado ao OMIE':
+                receita_venda = receita_omie_mes[m]
+
+        balancos.append(round(float(custo - receita_venda), 2))
+    return balancos
+
+
+def calcular_custos_mensais(df_original, lista_cenarios_simulados, **kwargs):
+    """
+    Calcula os custos mensais para o cenário original e uma lista de cenários simulados,
+    retornando dados prontos para um gráfico comparativo.
+
+    Todos os meses de cada cenário são calculados numa só passagem (ver _balancos_mensais_cenario);
+    os DataFrames recebidos não são alterados.
+    """
+    # Extrair os parâmetros necessários recebidos via kwargs
+    omie_ciclos = kwargs.pop('df_omie_completo', None)
+    calendario = kwargs.pop('calendario_tarifario', None)
+
+    if df_original is None or df_original.empty:
+        return None
+
+    datahora_original = pd.to_datetime(df_original['DataHora'])
+    meses_chave = np.unique(datahora_original.to_numpy().astype('datetime64[M]').astype(np.int64) + 1970 * 12)
+
+    # Estrutura de dados para o gráfico
+    labels_meses = [pd.Period(year=int(chave // 12), month=int(chave % 12) + 1, freq='M').strftime('%b %Y') for chave in meses_chave]
+    series_grafico = []
+
+    def _calendario_para(datahora):
+        # O calendário pré-calculado serve para todos os cenários com as mesmas linhas do ficheiro
+        if cal_tarifario.calendario_alinhado(calendario, datahora):
+            return calendario
+        return cal_tarifario.construir_calendario_tarifario(datahora, omie_ciclos)
+
+    # 1. Calcular a série do Custo Atual
+    custos_atuais = _balancos_mensais_cenario(
+        datahora_original,
+        df_original['Consumo (kWh)'].to_numpy(dtype=np.float64),
+        df_original['Injecao_Rede_kWh'].to_numpy(dtype=np.float64),
+        meses_chave, _calendario_para(datahora_original), **kwargs
+    )
+    series_grafico.append({'name': 'Custo Atual', 'data': custos_atuais, 'color': '#757575'})
+
+    # 2. Calcular a série para cada cenário simulado
+    for cenario in lista_cenarios_simulados:
+        df_simulado = cenario['dataframe_resultado']
+        datahora_simulado = pd.to_datetime(df_simulado['DataHora'])
+        custos_cenario = _balancos_mensais_cenario(
+            datahora_simulado,
+            df_simulado['Consumo_Rede_Final_kWh'].to_numpy(dtype=np.float64),
+            df_simulado['Injecao_Rede_Final_kWh'].to_numpy(dtype=np.float64),
+            meses_chave, _calendario_para(datahora_simulado), **kwargs
+        )
+        series_grafico.append({'name': cenario['nome'], 'data': custos_cenario})
+
+    return {
+        'meses': labels_meses,
+        'series': series_grafico
+    }
@@ -0,0 +1,613 @@
+# --- Ingestão: diagramas de carga da E-Redes e dados OMIE ---
+#
+# Leitura dos ficheiros da E-Redes e das tabelas OMIE_CICLOS/Constantes, sem depender do Streamlit
+# (ver processamento_dados.py para a camada da aplicação: cache, mensagens e atualização remota).
+import datetime
+import io
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import unescape
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+import cache_consumos
+from motor_autoconsumo.processos import CONTEXTO_PROCESSOS
+
+# O pyarrow é opcional: sem ele os dados OMIE são lidos do Excel
+try:
+    import pyarrow as pa
+    PYARROW_DISPONIVEL = True
+except ImportError:
+    pa = None
+    PYARROW_DISPONIVEL = False
+
+# --- Dados OMIE (Excel ou snapshot Arrow) ---
+def ler_excel_omie(origem):
+    """
+    Lê as abas OMIE_CICLOS e Constantes do Excel ('origem' pode ser um URL, caminho ou BytesIO).
+    """
+    xls = pd.ExcelFile(origem)
+    omie_ciclos = xls.parse("OMIE_CICLOS")
+    # Limpar nomes das colunas em OMIE_CICLOS
+    omie_ciclos.columns = [str(c).strip() for c in omie_ciclos.columns]
+    
+    # GARANTIR QUE TEMOS COLUNAS DE DATA E HORA SEPARADAS
+    if 'Data' not in omie_ciclos.columns and 'DataHora' in omie_ciclos.columns:
+        temp_dt = pd.to_datetime(omie_ciclos['DataHora'])
+        omie_ciclos['Data'] = temp_dt.dt.strftime('%m/%d/%Y')
+        omie_ciclos['Hora'] = temp_dt.dt.strftime('%H:%M')
+
+    if 'Data' in omie_ciclos.columns and 'Hora' in omie_ciclos.columns:
+        # CORREÇÃO: Forçar a leitura com o formato exato MM/DD/YYYY HH:MM
+        omie_ciclos['DataHora'] = pd.to_datetime(
+            omie_ciclos['Data'].astype(str) + ' ' + omie_ciclos['Hora'].astype(str),
+            format='%m/%d/%Y %H:%M',  # Formato Americano
+            errors='coerce'
+        ).dt.tz_localize(None)
+        
+        omie_ciclos.dropna(subset=['DataHora'], inplace=True)
+        omie_ciclos.drop_duplicates(subset=['DataHora'], keep='first', inplace=True)
+    else:
+        raise KeyError("Colunas 'Data' e 'Hora' não encontradas na aba OMIE_CICLOS.")
+
+    constantes = xls.parse("Constantes")
+    return _ordenar_por_datahora(omie_ciclos), constantes
+
+def _ordenar_por_datahora(omie_ciclos):
+    """
+    A aba OMIE_CICLOS não está por ordem cronológica (os anos estão em blocos). Ordena-se uma vez
+    ao carregar, para que os filtros por data sejam fatias (fatia_por_datahora) em vez de máscaras.
+    """
+    if omie_ciclos['DataHora'].is_monotonic_increasing:
+        return omie_ciclos
+    return omie_ciclos.sort_values('DataHora', kind='stable').reset_index(drop=True)
+
+def _ler_arrow(caminho):
+    """Lê um ficheiro Arrow IPC com memory-map (sem copiar o ficheiro para memória antes da conversão)."""
+    with pa.memory_map(str(caminho), 'r') as fonte:
+        return pa.ipc.open_file(fonte).read_all().to_pandas()
+
+def ler_snapshot_omie(caminho_omie, caminho_constantes):
+    """
+    Lê o snapshot Arrow de OMIE_CICLOS e Constantes publicado pela atualização diária
+    (scripts/exportar_snapshot_omie.py), já com DataHora tipada. Retorna os mesmos DataFrames
+    que ler_excel_omie.
+    """
+    omie_ciclos = _ler_arrow(caminho_omie)
+    # Os períodos vêm como categóricos; o resto da aplicação trabalha com texto (ex: fillna('Desconhecido'))
+    for coluna in omie_ciclos.columns:
+        if isinstance(omie_ciclos[coluna].dtype, pd.CategoricalDtype):
+            omie_ciclos[coluna] = omie_ciclos[coluna].astype(object)
+
+    constantes_tipadas = _ler_arrow(caminho_constantes)
+    # Reconstruir a coluna mista original (números e texto)
+    valor = constantes_tipadas['valor_numerico'].astype(object).where(
+        constantes_tipadas['valor_numerico'].notna(), constantes_tipadas['valor_texto']
+    )
+    constantes = pd.DataFrame({'constante': constantes_tipadas['constante'], 'valor_unitário': valor})
+    return _ordenar_por_datahora(omie_ciclos), constantes
+
+def carregar_omie_local(caminho_omie, caminho_constantes=None):
+    """
+    (OMIE_CICLOS, Constantes) a partir de ficheiros locais: o snapshot Arrow (OMIE_CICLOS.arrow e,
+    por omissão, o Constantes.arrow na mesma pasta) ou o Excel do simulador.
+    """
+    if str(caminho_omie).endswith('.arrow'):
+        if not PYARROW_DISPONIVEL:
+            raise ImportError("É preciso o pyarrow para ler o snapshot Arrow (ou indique o ficheiro Excel).")
+        if caminho_constantes is None:
+            caminho_constantes = os.path.join(os.path.dirname(str(caminho_omie)), "Constantes.arrow")
+        return ler_snapshot_omie(caminho_omie, caminho_constantes)
+    return ler_excel_omie(caminho_omie)
+
+# --- Leitura do diagrama de carga da E-Redes ---
+# Mapeamento das colunas da E-Redes (com e sem UPAC, e as várias designações) para nomes padronizados
+MAPA_COLUNAS = {
+    # Consumo
+    'Consumo_Rede_kWh': ["Consumo medido na IC, Ativa (kW)"],
+    'Consumo_Total_Casa_kWh': ["Consumo registado (kW)", "Consumo registado, Ativa (kW)"],
+    # Injeção
+    'Injecao_Rede_kWh': ["Injeção na rede medida na IC, Ativa (kW)"],
+    'Injecao_Total_UPAC_kWh': ["Injeção registada (kW)", "Injeção registada, Ativa (kW)"],
+    # Potência (para análise)
+    'Potencia_kW_Para_Analise': ["Consumo registado (kW)", "Consumo registado, Ativa (kW)", "Consumo medido na IC, Ativa (kW)"]
+}
+COLUNAS_ESSENCIAIS = ['Consumo_Rede_kWh', 'Consumo_Total_Casa_kWh', 'Injecao_Rede_kWh', 'Injecao_Total_UPAC_kWh', 'Potencia_kW_Para_Analise']
+LINHAS_PROCURA_CABECALHO = 20 # O cabeçalho ('Data', 'Hora', ...) está numa das primeiras linhas com dados
+
+# Em vez de abrir o Excel duas vezes com pd.read_excel (uma para encontrar o cabeçalho, outra completa),
+# o XML da primeira folha é percorrido uma única vez, em blocos que terminam sempre numa linha completa,
+# e as células são extraídas com uma expressão regular para arrays NumPy.
+TAMANHO_BLOCO_XLSX = 1 << 22 # 4 MB de XML descomprimido de cada vez
+NS_XLSX = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_XLSX_RELACOES_DOC = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_XLSX_RELACOES_PKG = "http://schemas.openxmlformats.org/package/2006/relationships"
+ORIGEM_DATAS_EXCEL = np.datetime64('1899-12-30') # Dia 0 das datas em número de série do Excel
+# Uma célula <c> (com ou sem prefixo de namespace, ex: <x:c>): os atributos antes e depois da referência r="A1"
+# (em qualquer posição), o valor <v> e o texto de uma inlineStr
+_RE_CELULA_XLSX = re.compile(
+    rb'<(?:\w+:)?c((?:\s+(?!r=)[\w:]+=(?:"[^"]*"|\'[^\']*\'))*)\s+r=["\']([A-Z]+)(\d+)["\']([^>]*?)'
+    rb'(?:/>|>(?:<(?:\w+:)?f\b[^>]*?(?:/>|>[^<]*</(?:\w+:)?f>))?(?:<(?:\w+:)?v>([^<]*)</(?:\w+:)?v>)?'
+    rb'(?:<(?:\w+:)?is>(?:<(?:\w+:)?r>)?(?:<(?:\w+:)?rPr>.*?</(?:\w+:)?rPr>)?<(?:\w+:)?t\b[^>]*>([^<]*)</(?:\w+:)?t>.*?</(?:\w+:)?is>)?</(?:\w+:)?c>)',
+    re.S
+)
+# O mesmo para o caso habitual (Excel, openpyxl): <c r="A1" ...> sem prefixo e com a referência em primeiro lugar.
+# Começa por um literal, por isso é bastante mais rápida; só é usada nos blocos em que todas as células são assim.
+_RE_CELULA_XLSX_SIMPLES = re.compile(
+    rb'<c() r="([A-Z]+)(\d+)"([^>]*?)(?:/>|>(?:<f\b[^>]*?(?:/>|>[^<]*</f>))?(?:<v>([^<]*)</v>)?'
+    rb'(?:<is>(?:<r>)?(?:<rPr>.*?</rPr>)?<t[^>]*>([^<]*)</t>.*?</is>)?</c>)',
+    re.S
+)
+_RE_TIPO_CELULA_XLSX = re.compile(rb'(?:^|\s)t=["\'](\w+)["\']')
+_RE_FIM_LINHA_XLSX = re.compile(rb'</(?:\w+:)?row>')
+
+def _caminho_primeira_folha(zf):
+    """Nome da entrada do zip com o XML da primeira folha do livro (a que o pd.read_excel lê por omissão)."""
+    livro = ET.fromstring(zf.read("xl/workbook.xml"))
+    relacoes = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    id_relacao = next(livro.iter(f"{{{NS_XLSX}}}sheet")).get(f"{{{NS_XLSX_RELACOES_DOC}}}id")
+    for relacao in relacoes.iter(f"{{{NS_XLSX_RELACOES_PKG}}}Relationship"):
+        if relacao.get("Id") == id_relacao:
+            alvo = relacao.get("Target")
+            return alvo.lstrip("/") if alvo.startswith("/") else "xl/" + alvo
+    raise KeyError(f"Relação '{id_relacao}' da primeira folha não encontrada.")
+
+def _fim_ultima_linha(xml):
+    """Posição a seguir ao último </row> (ou </x:row>) completo de 'xml', ou -1 se ainda não houver nenhum."""
+    fim = xml.rfind(b"row>")
+    while fim >= 0:
+        inicio = xml.rfind(b"</", 0, fim)
+        if inicio >= 0 and _RE_FIM_LINHA_XLSX.fullmatch(xml, inicio, fim + 4):
+            return fim + 4
+        fim = xml.rfind(b"row>", 0, fim)
+    return -1
+
+def _expressao_celulas(xml, fim):
+    """_RE_CELULA_XLSX_SIMPLES se todas as células de xml[:fim] começarem por <c r="...">, senão _RE_CELULA_XLSX."""
+    if xml.count(b"<c ", 0, fim) == xml.count(b'<c r="', 0, fim) and xml.find(b":c ", 0, fim) < 0:
+        return _RE_CELULA_XLSX_SIMPLES
+    return _RE_CELULA_XLSX
+
+def _ler_celulas_xlsx(ficheiro_excel):
+    """
+    Lê todas as células da primeira folha de um .xlsx ('ficheiro_excel' pode ser um caminho ou um ficheiro aberto).
+    Retorna um dicionário de arrays alinhados (uma posição por célula, pela ordem do ficheiro):
+    'coluna' (ex: b'A'), 'linha' (int64), 'atributos', 'valor' (<v>) e 'texto' (inlineStr), e
+    'textos_partilhados' (lista do sharedStrings.xml).
+    """
+    celulas = []
+    with zipfile.ZipFile(ficheiro_excel) as zf:
+        textos_partilhados = []
+        if "xl/sharedStrings.xml" in zf.namelist():
+            raiz = ET.fromstring(zf.read("xl/sharedStrings.xml"))
+            textos_partilhados = ["".join(t.text or "" for t in si.iter(f"{{{NS_XLSX}}}t")) for si in raiz.iter(f"{{{NS_XLSX}}}si")]
+
+        with zf.open(_caminho_primeira_folha(zf)) as fluxo:
+            pendente = b""
+            while True:
+                bloco = fluxo.read(TAMANHO_BLOCO_XLSX)
+                if not bloco:
+                    break
+                pendente += bloco
+                fim = _fim_ultima_linha(pendente)
+                if fim < 0:
+                    continue
+                celulas.extend(_expressao_celulas(pendente, fim).findall(pendente, 0, fim))
+                pendente = pendente[fim:]
+            celulas.extend(_expressao_celulas(pendente, len(pendente)).findall(pendente))
+
+    if not celulas:
+        celulas = [(b"", b"", b"0", b"", b"", b"")]
+    atributos_antes, coluna, linha, atributos_depois, valor, texto = (np.array(campo) for campo in zip(*celulas))
+    return {
+        'coluna': coluna,
+        'linha': linha.astype(np.int64),
+        'atributos': np.char.add(atributos_antes, atributos_depois) if np.any(atributos_antes != b"") else atributos_depois,
+        'valor': valor,
+        'texto': texto,
+        'textos_partilhados': textos_partilhados,
+    }
+
+def _tipo_celula(atributos):
+    """Tipo de uma célula ('n', 's', 'inlineStr', 'str', 'b', 'e') a partir dos seus atributos."""
+    tipo = _RE_TIPO_CELULA_XLSX.search(atributos)
+    return tipo.group(1).decode("ascii") if tipo else "n"
+
+def _decodificar_textos(brutos):
+    """Decodifica textos do XML (bytes) para str; como se repetem muito (datas, horas), decodifica só os distintos."""
+    unicos, inverso = np.unique(brutos, return_inverse=True)
+    return np.array([unescape(t.decode("utf-8")) for t in unicos], dtype=object)[inverso]
+
+def _valores_celulas(celulas, indices):
+    """
+    Valores das células nas posições 'indices': (numeros, textos), com numeros em float64 (NaN se a célula
+    não for numérica) e textos num array object (None se a célula não for texto).
+    """
+    atributos_unicos, inverso = np.unique(celulas['atributos'][indices], return_inverse=True)
+    tipos = np.array([_tipo_celula(a) for a in atributos_unicos], dtype=object)[inverso]
+    valores = celulas['valor'][indices]
+    partilhado = tipos == 's'
+    em_linha = tipos == 'inlineStr'
+    texto_em_valor = (tipos == 'str') | (tipos == 'e')
+    numerico = ((tipos == 'n') | (tipos == 'b')) & (valores != b"")
+
+    numeros = np.full(len(indices), np.nan)
+    numeros[numerico] = valores[numerico].astype(np.float64)
+    textos = np.full(len(indices), None, dtype=object)
+    if partilhado.any():
+        textos[partilhado] = np.array(celulas['textos_partilhados'], dtype=object)[valores[partilhado].astype(np.int64)]
+    if em_linha.any():
+        textos[em_linha] = _decodificar_textos(celulas['texto'][indices][em_linha])
+    if texto_em_valor.any():
+        textos[texto_em_valor] = _decodificar_textos(valores[texto_em_valor])
+    return numeros, textos
+
+def _texto_data_excel(numeros, textos):
+    """Texto de cada célula de 'Data': o próprio texto ou, para datas em número de série do Excel, 'AAAA-MM-DD'."""
+    resultado = np.where(pd.isna(textos), 'nan', textos).astype(object)
+    e_numero = ~np.isnan(numeros)
+    if e_numero.any():
+        dias = ORIGEM_DATAS_EXCEL + np.floor(numeros[e_numero]).astype('timedelta64[D]')
+        resultado[e_numero] = np.datetime_as_string(dias, unit='D')
+    return resultado
+
+def _texto_hora_excel(numeros, textos):
+    """Texto de cada célula de 'Hora': o próprio texto ou, para horas em fração de dia do Excel, 'HH:MM:SS'."""
+    resultado = np.where(pd.isna(textos), 'nan', textos).astype(object)
+    e_numero = ~np.isnan(numeros)
+    if e_numero.any():
+        segundos = np.rint((numeros[e_numero] % 1) * 86400).astype(np.int64) % 86400
+        resultado[e_numero] = [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in segundos]
+    return resultado
+
+def _tabela_xlsx(ficheiro_excel):
+    """
+    Cabeçalho e colunas da primeira folha, lidos numa só passagem (ver _ler_celulas_xlsx).
+    Retorna (coluna_por_nome, n_linhas, ler_coluna), com ler_coluna(nome) -> (numeros, textos) das linhas
+    abaixo do cabeçalho, ou None se o cabeçalho ('Data' e 'Hora') não for encontrado.
+    """
+    celulas = _ler_celulas_xlsx(ficheiro_excel)
+    linhas = celulas['linha']
+
+    # Encontrar a linha do cabeçalho (entre as primeiras linhas com dados)
+    linha_cabecalho = None
+    for linha in np.unique(linhas)[:LINHAS_PROCURA_CABECALHO]:
+        indices = np.flatnonzero(linhas == linha)
+        _, textos = _valores_celulas(celulas, indices)
+        if "Data" in textos and "Hora" in textos:
+            linha_cabecalho = linha
+            break
+    if linha_cabecalho is None:
+        return None
+
+    indices_cabecalho = np.flatnonzero(linhas == linha_cabecalho)
+    numeros, textos = _valores_celulas(celulas, indices_cabecalho)
+    coluna_por_nome = {}
+    for letra, numero, texto in zip(celulas['coluna'][indices_cabecalho], numeros, textos):
+        nome = str(texto if texto is not None else numero).strip()
+        coluna_por_nome.setdefault(nome, letra) # Nomes repetidos: fica a primeira coluna
+
+    # Linhas de dados (abaixo do cabeçalho) e posição de cada célula nessas linhas
+    de_dados = linhas > linha_cabecalho
+    linhas_dados = np.unique(linhas[de_dados])
+
+    def ler_coluna(nome):
+        indices = np.flatnonzero(de_dados & (celulas['coluna'] == coluna_por_nome[nome]))
+        posicoes = np.searchsorted(linhas_dados, linhas[indices])
+        numeros, textos = _valores_celulas(celulas, indices)
+        numeros_linhas = np.full(len(linhas_dados), np.nan)
+        textos_linhas = np.full(len(linhas_dados), None, dtype=object)
+        numeros_linhas[posicoes] = numeros
+        textos_linhas[posicoes] = textos
+        return numeros_linhas, textos_linhas
+
+    return coluna_por_nome, len(linhas_dados), ler_coluna
+
+def _tabela_pandas(ficheiro_excel):
+    """
+    O mesmo que _tabela_xlsx, mas lido com pd.read_excel (mais lento): para as folhas que a leitura
+    rápida não entende. As datas e horas já convertidas pelo pandas passam a texto ('AAAA-MM-DD', 'HH:MM:SS').
+    """
+    if hasattr(ficheiro_excel, 'seek'):
+        ficheiro_excel.seek(0)
+    df = pd.read_excel(ficheiro_excel, header=None, dtype=object)
+
+    linha_cabecalho = None
+    for i, row in df.head(LINHAS_PROCURA_CABECALHO).iterrows():
+        if "Data" in row.values and "Hora" in row.values:
+            linha_cabecalho = i
+            break
+    if linha_cabecalho is None:
+        return None
+
+    coluna_por_nome = {}
+    for posicao, valor in enumerate(df.loc[linha_cabecalho]):
+        coluna_por_nome.setdefault(str(valor).strip(), posicao) # Nomes repetidos: fica a primeira coluna
+    dados = df.loc[linha_cabecalho + 1:]
+
+    def ler_coluna(nome):
+        numeros = np.full(len(dados), np.nan)
+        textos = np.full(len(dados), None, dtype=object)
+        for i, valor in enumerate(dados.iloc[:, coluna_por_nome[nome]]):
+            if isinstance(valor, datetime.datetime):
+                textos[i] = valor.strftime('%Y-%m-%d') if valor.time() == datetime.time(0, 0) else str(valor)
+            elif isinstance(valor, datetime.time):
+                textos[i] = valor.strftime('%H:%M:%S')
+            elif isinstance(valor, str):
+                textos[i] = valor
+            elif isinstance(valor, (int, float, np.number)) and not pd.isna(valor):
+                numeros[i] = float(valor)
+        return numeros, textos
+
+    return coluna_por_nome, len(dados), ler_coluna
+
+def processar_ficheiro_consumos(ficheiro_excel):
+    """
+    Lê um ficheiro Excel da E-Redes, deteta se é de uma instalação com ou sem UPAC,
+    extrai os dados relevantes de consumo e injeção, e retorna um DataFrame padronizado.
+    O ficheiro é lido uma única vez (ver _ler_celulas_xlsx) e as colunas são convertidas de forma vetorizada;
+    se essa leitura não encontrar o cabeçalho, o ficheiro é lido com pd.read_excel.
+    """
+    try:
+        # 1. Cabeçalho e colunas da folha
+        tabela = _tabela_xlsx(ficheiro_excel)
+        if tabela is None:
+            tabela = _tabela_pandas(ficheiro_excel)
+        if tabela is None:
+            return None, "Não foi possível encontrar a linha de cabeçalho com 'Data' e 'Hora'."
+        coluna_por_nome, n_linhas, ler_coluna = tabela
+
+        # 2. Deteção do tipo de instalação (com ou sem UPAC)
+        tem_injecao = any("Injeção" in nome for nome in coluna_por_nome)
+
+        df_final = pd.DataFrame(index=pd.RangeIndex(n_linhas))
+
+        # 3. Mapeamento de colunas para nomes padronizados
+        for nome_padrao, nomes_possiveis in MAPA_COLUNAS.items():
+            for nome_col in nomes_possiveis:
+                if nome_col in coluna_por_nome:
+                    numeros, textos = ler_coluna(nome_col)
+                    e_texto = pd.notna(textos)
+                    if e_texto.any():
+                        numeros[e_texto] = pd.to_numeric(pd.Series(textos[e_texto]), errors='coerce').to_numpy(dtype=np.float64)
+                    # Converte para kWh (divide por 4) e guarda com nome padronizado
+                    df_final[nome_padrao] = numeros / 4.0
+                    break # Para ao encontrar a primeira correspondência
+
+        # Lógica especial para o caso SEM UPAC
+        if not tem_injecao:
+            # O consumo total da casa é o que vem da rede
+            if 'Consumo_Total_Casa_kWh' in df_final.columns:
+                 df_final['Consumo_Rede_kWh'] = df_final['Consumo_Total_Casa_kWh']
+
+        # Garantir que todas as colunas essenciais existem, preenchendo com 0 se faltarem
+        for col in COLUNAS_ESSENCIAIS:
+            if col not in df_final.columns:
+                df_final[col] = 0.0
+
+        # 4. Processamento de Data e Hora (o mesmo texto "Data Hora" que a leitura com pandas produzia)
+        texto_data = _texto_data_excel(*ler_coluna('Data'))
+        texto_hora = _texto_hora_excel(*ler_coluna('Hora'))
+        datahora = pd.to_datetime(
+            pd.Series(texto_data, dtype=object) + ' ' + pd.Series(texto_hora, dtype=object),
+            errors='coerce'
+        ).dt.tz_localize(None)
+
+        # Ajuste para o timestamp 00:00 (passa para 23:59 do dia anterior)
+        meia_noite = datahora == datahora.dt.normalize()
+        df_final['DataHora'] = datahora.mask(meia_noite, datahora - pd.Timedelta(minutes=1))
+
+        df_final.dropna(subset=['DataHora'], inplace=True)
+
+        # 5. Cálculo dos valores derivados
+        # Autoconsumo = O que a casa consumiu no total - O que foi preciso ir buscar à rede
+        df_final['Autoconsumo_Settlement_kWh'] = (df_final['Consumo_Total_Casa_kWh'] - df_final['Consumo_Rede_kWh']).round(5)
+        # Garante que não há valores negativos por imprecisões de float
+        df_final['Autoconsumo_Settlement_kWh'] = df_final['Autoconsumo_Settlement_kWh'].clip(lower=0)
+        
+        # Renomear a coluna principal de consumo para consistência com o resto do simulador
+        df_final.rename(columns={'Consumo_Rede_kWh': 'Consumo (kWh)'}, inplace=True)
+        
+        colunas_de_retorno = [
+            'DataHora', 
+            'Consumo (kWh)', # Consumo líquido da rede
+            'Injecao_Rede_kWh', # Injeção líquida na rede
+            'Consumo_Total_Casa_kWh', # Consumo bruto da casa
+            'Injecao_Total_UPAC_kWh', # Injeção bruta da UPAC
+            'Autoconsumo_Settlement_kWh', # Autoconsumo de Settlement/Netmetering
+            'Potencia_kW_Para_Analise'
+        ]
+
+        return df_final[colunas_de_retorno], None
+
+    except Exception as e:
+        return None, f"Erro ao processar ficheiro: {e}"
+    
+# Processos usados para ler vários ficheiros da E-Redes em paralelo (a leitura do XML é CPU-bound e prende o GIL)
+PROCESSOS_INGESTAO = int(os.environ.get("AUTOCONSUMO_PROCESSOS_INGESTAO", os.cpu_count() or 1))
+
+def _processar_conteudo_consumos(conteudo, nome):
+    """
+    Versão de processar_ficheiro_consumos para os processos de trabalho: recebe os bytes e o nome do ficheiro.
+    Os ficheiros lidos com sucesso ficam na cache em disco (cache_consumos), indexados pelo hash do conteúdo.
+    """
+    df, erro = processar_ficheiro_consumos(io.BytesIO(conteudo))
+    if erro is None:
+        cache_consumos.guardar_consumos(conteudo, df)
+    return nome, df, erro
+
+def _resultados_ficheiros(conteudos, processos):
+    """
+    Lê os ficheiros ('conteudos' é uma lista de (nome, bytes)) e devolve (índice, nome, df, erro)
+    à medida que cada um termina. Os ficheiros já conhecidos (mesmo conteúdo) vêm logo da cache em disco;
+    os restantes, se forem mais de um, são lidos num ProcessPoolExecutor (ou em sequência, se não for
+    possível criar processos). Os processos são criados com "spawn" (ver processos.py).
+    """
+    entregues = set()
+    for i, (nome, conteudo) in enumerate(conteudos):
+        df = cache_consumos.ler_consumos(conteudo)
+        if df is not None:
+            entregues.add(i)
+            yield i, nome, df, None
+
+    em_falta = [i for i in range(len(conteudos)) if i not in entregues]
+    if len(em_falta) > 1 and processos > 1:
+        try:
+            executor = ProcessPoolExecutor(
+                max_workers=min(processos, len(em_falta)), mp_context=CONTEXTO_PROCESSOS
+            )
+            futuros = {executor.submit(_processar_conteudo_consumos, conteudos[i][1], conteudos[i][0]): i for i in em_falta}
+        except OSError:
+            executor = None # Ambiente sem suporte para processos: lê em sequência
+        if executor is not None:
+            with executor:
+                try:
+                    for futuro in as_completed(futuros):
+                        resultado = (futuros[futuro],) + futuro.result()
+                        entregues.add(futuros[futuro])
+                        yield resultado
+                except BrokenProcessPool:
+                    pass # Um processo terminou de forma anormal: os ficheiros em falta são lidos em sequência
+                finally:
+                    # Se o gerador for fechado a meio, não ficar à espera dos restantes
+                    for futuro in futuros:
+                        futuro.cancel()
+    for i, (nome, conteudo) in enumerate(conteudos):
+        if i not in entregues:
+            yield (i,) + _processar_conteudo_consumos(conteudo, nome)
+
+def validar_e_juntar_ficheiros(lista_de_ficheiros, progresso=None, processos=PROCESSOS_INGESTAO):
+    """
+    Processa uma lista de ficheiros da E-Redes (objetos com .name e .getvalue(), como os do
+    st.file_uploader), verifica se há sobreposição de datas e, se não houver, junta todos os dados
+    num único DataFrame. Ver validar_e_juntar_conteudos.
+    """
+    if not lista_de_ficheiros:
+        return None, "Nenhum ficheiro carregado."
+    conteudos = [(ficheiro.name, ficheiro.getvalue()) for ficheiro in lista_de_ficheiros]
+    return validar_e_juntar_conteudos(conteudos, progresso, processos)
+
+def validar_e_juntar_conteudos(conteudos, progresso=None, processos=PROCESSOS_INGESTAO):
+    """
+    Versão de validar_e_juntar_ficheiros para uma lista de (nome, bytes).
+    Os ficheiros são lidos em paralelo e validados depois pela ordem em que foram carregados, para que o
+    erro indicado seja sempre o mesmo; 'progresso', se indicado, é chamado como
+    progresso(concluidos, total, nome_ficheiro) à medida que cada ficheiro termina.
+    """
+    if not conteudos:
+        return None, "Nenhum ficheiro carregado."
+
+    resultados = {}
+    for concluidos, (indice, nome, df_individual, erro) in enumerate(_resultados_ficheiros(conteudos, processos), start=1):
+        resultados[indice] = (nome, df_individual, erro)
+        if progresso is not None:
+            progresso(concluidos, len(conteudos), nome)
+
+    dataframes_processados = {}
+    intervalos_por_ficheiro = {}
+    data_limite = datetime.date(2024, 1, 1)
+
+    # Validar pela ordem em que os ficheiros foram carregados, independentemente da ordem de chegada
+    for indice in range(len(conteudos)):
+        nome, df_individual, erro = resultados[indice]
+        if erro:
+            return None, f"Erro ao processar o ficheiro '{nome}': {erro}"
+        
+        if df_individual.empty:
+            continue
+
+        dataframes_processados[indice] = df_individual
+        min_data = df_individual['DataHora'].min()
+        if min_data.date() < data_limite:
+            erro_msg = (
+                f"Erro no ficheiro '{nome}': Contém dados de '{min_data.strftime('%d/%m/%Y')}', "
+                f"que é anterior à data mínima permitida de 01/01/2024. Remova-o!"
+            )
+            return None, erro_msg
+        max_data = df_individual['DataHora'].max()
+        intervalos_por_ficheiro[indice] = (min_data, max_data)
+
+    ordem = sorted(dataframes_processados)
+    intervalos_de_datas = [intervalos_por_ficheiro[i] for i in ordem]
+
+    if not dataframes_processados:
+        return None, "Nenhum dos ficheiros continha dados válidos."
+
+    if len(intervalos_de_datas) > 1:
+        intervalos_ordenados = sorted(intervalos_de_datas, key=lambda x: x[0])
+        
+        for i in range(1, len(intervalos_ordenados)):
+            inicio_atual = intervalos_ordenados[i][0]
+            fim_anterior = intervalos_ordenados[i-1][1]
+            
+            if inicio_atual < fim_anterior:
+                erro_msg = (
+                    f"Erro: Sobreposição de datas detetada! O período que começa em "
+                    f"{inicio_atual.strftime('%d/%m/%Y')} sobrepõe-se ao período que termina em "
+                    f"{fim_anterior.strftime('%d/%m/%Y')}. Por favor, carregue ficheiros com períodos distintos."
+                )
+                return None, erro_msg
+
+    df_final_combinado = pd.concat([dataframes_processados[i] for i in ordem], ignore_index=True)
+    df_final_combinado = df_final_combinado.sort_values(by='DataHora').reset_index(drop=True)
+    df_final_combinado = df_final_combinado.drop_duplicates(subset=['DataHora'], keep='first')
+
+    return df_final_combinado, None
+
+# --- Filtro por intervalo de datas ---
+def fatia_por_datahora(df, inicio, fim):
+    """
+    Linhas de 'df' (ordenado por DataHora) com inicio <= DataHora <= fim.
+
+    Usa pesquisa binária sobre os instantes, em vez de comparar a tabela inteira, e devolve
+    uma fatia posicional: as colunas são vistas sobre os dados de 'df' (sem cópia), por isso
+    o resultado não deve ser alterado no lugar.
+    """
+    datahora = df['DataHora'].to_numpy(dtype='datetime64[ns]')
+    inicio_linha = datahora.searchsorted(pd.Timestamp(inicio).to_datetime64(), side='left')
+    fim_linha = datahora.searchsorted(pd.Timestamp(fim).to_datetime64(), side='right')
+    return df.iloc[inicio_linha:max(inicio_linha, fim_linha)]
+
+def agregar_consumos_por_periodo(df_consumos, df_omie_ciclos):
+    if df_consumos is None or df_consumos.empty: return {}
+
+    df_merged = pd.merge(df_consumos, df_omie_ciclos, on='DataHora', how='left')
+
+    consumos_agregados = {'Simples': df_merged['Consumo (kWh)'].sum()}
+    
+    for ciclo in ['BD', 'BS', 'TD', 'TS']:
+        if ciclo in df_merged.columns:
+            df_merged[ciclo] = df_merged[ciclo].fillna('Desconhecido')
+            soma_por_periodo = df_merged.groupby(ciclo)['Consumo (kWh)'].sum().to_dict()
+            consumos_agregados[ciclo] = soma_por_periodo
+            
+    return consumos_agregados
+
+def calcular_medias_omie_para_todos_ciclos(df_consumos_periodo, df_omie_completo):
+    """
+    Calcula as médias OMIE para todos os ciclos, com base no intervalo de datas
+    do dataframe de consumos fornecido.
+    """
+    if df_consumos_periodo.empty:
+        return {}
+    
+    min_date = df_consumos_periodo['DataHora'].min()
+    max_date = df_consumos_periodo['DataHora'].max()
+    
+    df_omie_filtrado = fatia_por_datahora(df_omie_completo, min_date, max_date)
+
+    if df_omie_filtrado.empty:
+        return {}
+
+    omie_medios = {'S': df_omie_filtrado['OMIE'].mean()}
+    for ciclo in ['BD', 'BS', 'TD', 'TS']:
+        if ciclo in df_omie_filtrado.columns:
+            agrupado = df_omie_filtrado.groupby(ciclo)['OMIE'].mean()
+            for periodo, media in agrupado.items():
+                omie_medios[f"{ciclo}_{periodo}"] = media
+    return omie_medios
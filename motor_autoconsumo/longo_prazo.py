@@ -0,0 +1,152 @@
+# --- Projeção a longo prazo: payback, fluxo de caixa e ROI ---
+import numpy as np
+
+
+def calcular_analise_longo_prazo(
+    custo_instalacao, 
+    poupanca_autoconsumo_anual_base,
+    poupanca_venda_anual_base,
+    anos_analise, 
+    taxa_degradacao_perc, 
+    taxa_inflacao_energia_perc,
+    taxa_variacao_venda_perc
+):
+    """
+    Calcula o payback detalhado, o fluxo de caixa e o ROI simples anual.
+    (Um cenário de calcular_analise_longo_prazo_em_lote, com os resultados em float e listas.)
+    """
+    resultado = calcular_analise_longo_prazo_em_lote(
+        [custo_instalacao], [poupanca_autoconsumo_anual_base], [poupanca_venda_anual_base], anos_analise,
+        taxa_degradacao_perc, taxa_inflacao_energia_perc, taxa_variacao_venda_perc, calcular_tir=False
+    )
+    return {
+        "payback_detalhado": float(resultado['payback_detalhado'][0]),
+        "poupanca_total_periodo": float(resultado['poupanca_total_periodo'][0]),
+        "fluxo_caixa_anual": resultado['fluxo_caixa_anual'][0].tolist(),
+        "fluxo_caixa_acumulado": resultado['fluxo_caixa_acumulado'][0].tolist(),
+        "anos_analise": anos_analise,
+        "roi_simples_anual": float(resultado['roi_simples_anual'][0])
+    }
+
+
+# Intervalo de procura da TIR (taxa anual): de -99 % a 1000 %
+_LIMITES_TIR = (-0.99, 10.0)
+
+
+def _taxa(taxa_perc):
+    return np.asarray(taxa_perc, dtype=np.float64) / 100.0
+
+
+def _potencias(base, expoentes):
+    """
+    base ** expoentes; com uma base por cenário, matriz cenários x expoentes.
+    Com uma base comum, os poucos fatores são calculados com o pow do Python, como no cálculo
+    ano a ano (o np.power vetorizado pode diferir no último bit).
+    """
+    if base.ndim:
+        return base[..., None] ** expoentes
+    return np.array([float(base) ** expoente for expoente in expoentes], dtype=np.float64)
+
+
+def calcular_analise_longo_prazo_em_lote(
+    custos_instalacao,
+    poupancas_autoconsumo_anual_base,
+    poupancas_venda_anual_base,
+    anos_analise,
+    taxa_degradacao_perc,
+    taxa_inflacao_energia_perc,
+    taxa_variacao_venda_perc,
+    taxa_desconto_perc=0.0,
+    calcular_tir=True,
+    desvios_anuais_autoconsumo=0.0,
+    desvios_anuais_venda=0.0
+):
+    """
+    Versão vetorial de calcular_analise_longo_prazo para N cenários de uma só vez.
+
+    Os custos e as poupanças base são arrays de N valores; as taxas podem ser um valor comum
+    ou um array de N valores (um por cenário). O fluxo de caixa é uma matriz N x anos, com os
+    fatores de degradação, inflação e variação do preço de venda calculados por broadcasting.
+
+    Retorna um dicionário de arrays: 'fluxo_caixa_anual' e 'fluxo_caixa_acumulado' (N x anos),
+    'payback_detalhado', 'poupanca_total_periodo', 'roi_simples_anual', 'val' (valor atual líquido
+    à taxa de desconto) e 'tir' (taxa interna de rentabilidade, em %; NaN se não existir), com N valores.
+    A TIR é a parte mais demorada (bisseção); com calcular_tir=False, 'tir' é None.
+
+    'desvios_anuais_autoconsumo' e 'desvios_anuais_venda' (matrizes N x anos, opcionais) somam-se às
+    poupanças base de cada ano antes da degradação e da inflação: a variação de ano para ano
+    (ano meteorológico, preços OMIE) das trajetórias do monte_carlo. O ROI usa só as poupanças base.
+    """
+    custos = np.asarray(custos_instalacao, dtype=np.float64)
+    autoconsumo_base = np.asarray(poupancas_autoconsumo_anual_base, dtype=np.float64)
+    venda_base = np.asarray(poupancas_venda_anual_base, dtype=np.float64)
+    custos, autoconsumo_base, venda_base = np.broadcast_arrays(custos, autoconsumo_base, venda_base)
+    n_anos = int(anos_analise)
+
+    # --- ROI Simples Anual ---
+    poupanca_anual_total_base = autoconsumo_base + venda_base
+    com_roi = (custos > 0) & (poupanca_anual_total_base > 0)
+    roi_simples_anual = np.where(com_roi, poupanca_anual_total_base / np.where(com_roi, custos, 1.0) * 100, 0.0)
+
+    # --- Fluxo de caixa (cenários x anos) ---
+    anos = np.arange(1, n_anos + 1, dtype=np.float64)
+    fator_producao = _potencias(1 - _taxa(taxa_degradacao_perc), anos - 1)
+    poupanca_autoconsumo = (autoconsumo_base[:, None] + desvios_anuais_autoconsumo) * fator_producao * _potencias(1 + _taxa(taxa_inflacao_energia_perc), anos - 1)
+    poupanca_venda = (venda_base[:, None] + desvios_anuais_venda) * fator_producao * _potencias(1 + _taxa(taxa_variacao_venda_perc), anos - 1)
+    fluxo_caixa_anual = poupanca_autoconsumo + poupanca_venda
+    fluxo_caixa_acumulado = np.cumsum(fluxo_caixa_anual, axis=1)
+
+    # --- Payback: primeiro ano em que a poupança acumulada cobre o custo, com a fração desse ano ---
+    recuperado = fluxo_caixa_acumulado >= custos[:, None]
+    tem_payback = recuperado.any(axis=1)
+    ano_payback = np.zeros(len(custos), dtype=np.int64) # índice do ano (ano - 1)
+    poupanca_ano_payback = np.zeros(len(custos))
+    acumulado_anterior = np.zeros(len(custos))
+    if n_anos:
+        linhas = np.arange(len(custos))
+        ano_payback = recuperado.argmax(axis=1)
+        poupanca_ano_payback = fluxo_caixa_anual[linhas, ano_payback]
+        acumulado_anterior = np.where(ano_payback > 0, fluxo_caixa_acumulado[linhas, ano_payback - 1], 0.0)
+    fracao_do_ano = (custos - acumulado_anterior) / np.where(poupanca_ano_payback > 0, poupanca_ano_payback, 1.0)
+    payback = np.where(poupanca_ano_payback > 0, ano_payback + fracao_do_ano, ano_payback + 1.0)
+    payback = np.where(tem_payback, payback, np.inf)
+    payback = np.where(custos <= 0, 0.0, payback)
+
+    # --- VAL e TIR ---
+    val = (fluxo_caixa_anual / _potencias(1 + _taxa(taxa_desconto_perc), anos)).sum(axis=1) - custos
+
+    return {
+        "payback_detalhado": payback,
+        "poupanca_total_periodo": fluxo_caixa_acumulado[:, -1] if n_anos else np.zeros(len(custos)),
+        "fluxo_caixa_anual": fluxo_caixa_anual,
+        "fluxo_caixa_acumulado": fluxo_caixa_acumulado,
+        "anos_analise": anos_analise,
+        "roi_simples_anual": roi_simples_anual,
+        "val": val,
+        "tir": _taxa_interna_rentabilidade(custos, fluxo_caixa_anual, anos) if calcular_tir else None,
+    }
+
+
+def _taxa_interna_rentabilidade(custos, fluxo_caixa_anual, anos):
+    """
+    TIR (%) de cada cenário por bisseção vetorial: a taxa r em que o VAL é zero.
+    NaN sem investimento, sem mudança de sinal do VAL entre os limites ou sem anos de análise.
+    """
+    def val_a(taxas):
+        return (fluxo_caixa_anual / (1 + taxas[:, None]) ** anos).sum(axis=1) - custos
+
+    inferior = np.full(len(custos), _LIMITES_TIR[0])
+    superior = np.full(len(custos), _LIMITES_TIR[1])
+    val_inferior = val_a(inferior)
+    existe = (custos > 0) & (len(anos) > 0) & (np.sign(val_inferior) != np.sign(val_a(superior)))
+
+    # 60 bisseções: precisão muito abaixo de 0,01 %
+    for _ in range(60):
+        meio = (inferior + superior) / 2
+        val_meio = val_a(meio)
+        mesmo_sinal = np.sign(val_meio) == np.sign(val_inferior)
+        inferior = np.where(mesmo_sinal, meio, inferior)
+        val_inferior = np.where(mesmo_sinal, val_meio, val_inferior)
+        superior = np.where(mesmo_sinal, superior, meio)
+
+    return np.where(existe, (inferior + superior) / 2 * 100, np.nan)
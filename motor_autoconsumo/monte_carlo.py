@@ -0,0 +1,232 @@
+# --- Análise de incerteza (Monte Carlo): payback e poupanças em P10 / P50 / P90 ---
+#
+# A simulação habitual usa a produção média de todos os anos do PVGIS, os preços OMIE do calendário
+# e taxas fixas de degradação, inflação e variação do preço de venda. Aqui cada trajetória sorteia,
+# para cada ano da análise, um ano meteorológico do PVGIS (2005-2023) e um ano de preços OMIE
+# (o do calendário ou um dos anos do armazém MIBEL), e sorteia as três taxas de distribuições normais
+# centradas nos valores escolhidos.
+#
+# O trabalho pesado é pequeno e feito uma só vez: a poupança anual base do sistema em cada combinação
+# (ano meteorológico, ano OMIE). Os anos meteorológicos são avaliados em paralelo, com os processos
+# de trabalho e a memória partilhada do dimensionamento, só se o trabalho passar o limiar desses processos
+# (dimensionamento.processos_para_trabalho); senão, em sequência. As milhares de trajetórias são depois uma só
+# chamada vetorial a longo_prazo.calcular_analise_longo_prazo_em_lote.
+import numpy as np
+import pandas as pd
+
+import armazem_mibel
+from motor_autoconsumo import dimensionamento, financeiro, longo_prazo
+
+TRAJETORIAS_MONTE_CARLO = 5000
+PERCENTIS = (10, 50, 90)
+
+# Desvio padrão (pontos percentuais) das taxas anuais sorteadas à volta dos valores escolhidos
+DESVIOS_PADRAO_TAXAS = {'degradacao': 0.2, 'inflacao_energia': 1.5, 'variacao_venda': 2.0}
+
+# Um ano do armazém MIBEL só entra no sorteio se tiver preços para pelo menos esta fração do período
+# em análise (o resto do período usa os preços do calendário)
+COBERTURA_MINIMA_OMIE = 0.5
+
+ROTULO_PRODUCAO_MEDIA = "Perfil médio"
+ROTULO_OMIE_CALENDARIO = "Calendário"
+
+FUSO_ES = "Europe/Madrid"
+FUSO_PT = "Europe/Lisbon"
+
+
+def _chaves_quarto_horarias(datahora):
+    """Chave inteira mês, dia, hora e minuto de cada instante (para alinhar anos diferentes)."""
+    datahora = pd.DatetimeIndex(datahora)
+    return (datahora.month * 1000000 + datahora.day * 10000 + datahora.hour * 100 + datahora.minute).to_numpy(dtype=np.int64)
+
+
+def precos_omie_por_ano(datahora, anos=None, cobertura_minima=COBERTURA_MINIMA_OMIE, diretorio=armazem_mibel.DIRETORIO_ARMAZEM):
+    """
+    Preços OMIE de Portugal (€/MWh) de cada ano do armazém MIBEL, alinhados com 'datahora'
+    (fim de cada quarto de hora, hora de Portugal, como no OMIE_CICLOS) pelo mês, dia, hora e minuto.
+
+    Retorna {'anos': [ano, ...], 'omie': matriz anos x linhas (NaN onde o ano não tem preço),
+    'cobertura': [fração do período com preço, ...]}, só com os anos de cobertura >= 'cobertura_minima'.
+    """
+    chaves = _chaves_quarto_horarias(datahora)
+    resultado = {'anos': [], 'omie': np.empty((0, len(chaves))), 'cobertura': []}
+    df = armazem_mibel.ler_precos(anos=anos, diretorio=diretorio)
+    if df.empty:
+        return resultado
+
+    # Hora de Espanha (Hora = 1..N quartos do dia) -> fim do quarto de hora em hora de Portugal
+    inicio_es = df['Data'].dt.tz_localize(FUSO_ES) + pd.to_timedelta((df['Hora'] - 1) * 15, unit='m')
+    inicio_pt = inicio_es.dt.tz_convert(FUSO_PT).dt.tz_localize(None)
+    precos = pd.DataFrame({
+        'ano': inicio_pt.dt.year.to_numpy(),
+        'chave': _chaves_quarto_horarias(inicio_pt + pd.Timedelta(minutes=15)),
+        'preco': df['Preco_PT'].to_numpy(dtype=np.float64),
+    }).drop_duplicates(['ano', 'chave']) # A hora repetida na mudança para a hora de inverno fica com o primeiro preço
+
+    omie_anos = []
+    for ano, precos_ano in precos.groupby('ano', sort=True):
+        posicoes = pd.Index(precos_ano['chave'].to_numpy()).get_indexer(chaves)
+        cobertura = float(np.mean(posicoes >= 0)) if len(chaves) else 0.0
+        if cobertura < cobertura_minima or cobertura == 0.0:
+            continue
+        omie_anos.append(np.where(posicoes >= 0, precos_ano['preco'].to_numpy()[posicoes], np.nan))
+        resultado['anos'].append(int(ano))
+        resultado['cobertura'].append(cobertura)
+    if omie_anos:
+        resultado['omie'] = np.array(omie_anos)
+    return resultado
+
+
+def preparar_dados_monte_carlo(dados, bases_por_ano=None, fator_sombra=0.0, omie_por_ano=None):
+    """
+    Junta a 'dados' (preparar_dados_dimensionamento) as alternativas sorteadas em cada ano das trajetórias:
+    - 'producao_por_kwp_anos': a produção de 1 kWp de cada ano meteorológico (solar.preparar_bases_producao_por_ano,
+      com a sombra), ou None para usar só a produção média de 'dados' (backup por distrito ou PVGIS indisponível);
+    - 'omie_anos': os preços OMIE do calendário e de cada ano de precos_omie_por_ano (onde um ano não tem
+      preço, fica o do calendário).
+    """
+    producao_por_kwp_anos = None
+    anos_meteorologicos = [ROTULO_PRODUCAO_MEDIA]
+    if dados['producao_por_kwp'] is not None and bases_por_ano and bases_por_ano['anos']:
+        producao_por_kwp_anos = np.asarray(bases_por_ano['producao_por_kwp'], dtype=np.float64) * (1 - (fator_sombra / 100.0))
+        anos_meteorologicos = [str(ano) for ano in bases_por_ano['anos']]
+
+    omie_calendario = dados['calendario']['omie']
+    omie_anos = [omie_calendario]
+    anos_omie = [ROTULO_OMIE_CALENDARIO]
+    if omie_por_ano is not None:
+        for ano, omie in zip(omie_por_ano['anos'], omie_por_ano['omie']):
+            omie_anos.append(np.where(np.isnan(omie), omie_calendario, omie))
+            anos_omie.append(str(ano))
+
+    return {
+        **dados,
+        'producao_por_kwp_anos': producao_por_kwp_anos,
+        'anos_meteorologicos': anos_meteorologicos,
+        'omie_anos': np.array(omie_anos),
+        'anos_omie': anos_omie,
+    }
+
+
+def poupancas_do_ano_meteorologico(dados, parametros, indice_meteorologico, indices_omie, potencia_kwp, bateria):
+    """
+    Poupanças anuais base do sistema (potencia_kwp, bateria = (capacidade_kwh, potencia_kw)) com a produção do ano
+    meteorológico 'indice_meteorologico': uma só simulação solar e um só despacho, e o financeiro com os preços
+    de cada ano OMIE de 'indices_omie' (o cenário atual também é recalculado com esses preços).
+    Retorna uma lista de (custo_evitado_anual, receita_adicional_anual), pela ordem de 'indices_omie'.
+    """
+    producao = dados['producao_por_kwp']
+    if dados.get('producao_por_kwp_anos') is not None:
+        producao = dados['producao_por_kwp_anos'][indice_meteorologico]
+    [(consumo_final, injecao_final)] = dimensionamento.fluxos_da_potencia(
+        {**dados, 'producao_por_kwp': producao}, parametros, potencia_kwp, [bateria]
+    )
+
+    poupancas = []
+    for indice_omie in indices_omie:
+        if indice_omie == 0:
+            dados_omie, financeiro_atual = dados, parametros['financeiro_atual']
+        else:
+            dados_omie = {**dados, 'calendario': {**dados['calendario'], 'omie': dados['omie_anos'][indice_omie]}}
+            financeiro_atual = dimensionamento.financeiro_do_cenario(dados_omie, parametros, dados['consumo'], dados['injecao_base'])
+        financeiro_cenario = dimensionamento.financeiro_do_cenario(dados_omie, parametros, consumo_final, injecao_final)
+        poupancas.append(financeiro.poupancas_anuais_base(financeiro_atual, financeiro_cenario, parametros['dias']))
+    return poupancas
+
+
+def _poupancas_do_ano_no_processo(tarefa):
+    # Os processos de trabalho são os do dimensionamento (mesmos dados em memória partilhada)
+    _, dados, parametros = dimensionamento._ESTADO_PROCESSO
+    return poupancas_do_ano_meteorologico(dados, parametros, *tarefa)
+
+
+def _percentis(valores, eixo=None):
+    # Percentis de valores efetivamente simulados (sem interpolar), para o payback infinito continuar infinito
+    return np.percentile(valores, PERCENTIS, axis=eixo, method='inverted_cdf')
+
+
+def simular_monte_carlo(dados, parametros, potencia_kwp, bateria, custo_instalacao, trajetorias=TRAJETORIAS_MONTE_CARLO,
+                        desvios_padrao=None, semente=0, processos=dimensionamento.PROCESSOS_DIMENSIONAMENTO):
+    """
+    Payback e poupanças do sistema (potencia_kwp, bateria = (capacidade_kwh, potencia_kw)) em 'trajetorias'
+    trajetórias aleatórias. 'dados' vem de preparar_dados_monte_carlo; 'parametros' tem os preços, a venda,
+    o financeiro atual, a eficiência/DoD da bateria e os parâmetros de longo prazo (taxas médias).
+
+    Em cada trajetória, cada ano da análise tem um ano meteorológico e um ano OMIE sorteados (a poupança
+    desse ano é a poupança base dessa combinação) e as taxas de degradação, inflação e variação do preço
+    de venda são sorteadas de normais com os desvios padrão 'desvios_padrao' (DESVIOS_PADRAO_TAXAS por omissão).
+    Os anos OMIE só contam com a venda indexada ao OMIE. 'semente' torna o sorteio reprodutível.
+
+    Retorna {'trajetorias', 'anos_meteorologicos', 'anos_omie', 'poupancas_base', 'percentis',
+    'probabilidade_payback', 'fluxo_caixa_acumulado_percentis'}: as poupanças base de cada combinação,
+    os percentis PERCENTIS do payback, da poupança do 1.º ano, da poupança no período (bruta e líquida)
+    e do VAL, a fração das trajetórias com payback dentro do período e os percentis da poupança acumulada em cada ano.
+    """
+    desvios_padrao = {**DESVIOS_PADRAO_TAXAS, **(desvios_padrao or {})}
+    n_meteorologicos = len(dados['anos_meteorologicos'])
+    venda_indexada = parametros.get('venda_excedente_ativa', True) and parametros['modelo_venda'] == 'Indexado ao OMIE'
+    indices_omie = list(range(len(dados['anos_omie']))) if venda_indexada else [0]
+
+    # --- Poupança base de cada (ano meteorológico, ano OMIE), um ano meteorológico por tarefa ---
+    tarefas = [(i, indices_omie, potencia_kwp, tuple(bateria)) for i in range(n_meteorologicos)]
+    processos = dimensionamento.processos_para_trabalho(dados, n_meteorologicos * len(indices_omie), len(tarefas), processos)
+    with dimensionamento._processos_de_trabalho(dados, parametros, processos) as executor:
+        if executor is not None:
+            lista_poupancas = list(executor.map(_poupancas_do_ano_no_processo, tarefas))
+        else:
+            lista_poupancas = [poupancas_do_ano_meteorologico(dados, parametros, *tarefa) for tarefa in tarefas]
+    poupancas = np.array(lista_poupancas, dtype=np.float64) # anos meteorológicos x anos OMIE x (custo evitado, receita)
+
+    # --- Sorteio das trajetórias ---
+    gerador = np.random.default_rng(semente)
+    n_anos = int(parametros['anos_analise'])
+    sorteio_meteorologico = gerador.integers(poupancas.shape[0], size=(trajetorias, n_anos))
+    sorteio_omie = gerador.integers(poupancas.shape[1], size=(trajetorias, n_anos))
+    degradacao = np.maximum(gerador.normal(parametros['degradacao'], desvios_padrao['degradacao'], trajetorias), 0.0)
+    inflacao_energia = gerador.normal(parametros['inflacao_energia'], desvios_padrao['inflacao_energia'], trajetorias)
+    variacao_venda = gerador.normal(parametros['variacao_venda'], desvios_padrao['variacao_venda'], trajetorias)
+
+    # A poupança base é a média das combinações; cada ano soma o desvio da combinação sorteada
+    base = poupancas.mean(axis=(0, 1))
+    sorteadas = poupancas[sorteio_meteorologico, sorteio_omie]
+    analise_lp = longo_prazo.calcular_analise_longo_prazo_em_lote(
+        np.full(trajetorias, float(custo_instalacao)), np.full(trajetorias, base[0]), np.full(trajetorias, base[1]),
+        anos_analise=n_anos,
+        taxa_degradacao_perc=degradacao,
+        taxa_inflacao_energia_perc=inflacao_energia,
+        taxa_variacao_venda_perc=variacao_venda,
+        taxa_desconto_perc=parametros.get('taxa_desconto', 0.0),
+        calcular_tir=False,
+        desvios_anuais_autoconsumo=sorteadas[..., 0] - base[0],
+        desvios_anuais_venda=sorteadas[..., 1] - base[1]
+    )
+
+    metricas = {
+        'payback_anos': analise_lp['payback_detalhado'],
+        'poupanca_primeiro_ano': analise_lp['fluxo_caixa_anual'][:, 0] if n_anos else np.zeros(trajetorias),
+        'poupanca_total_periodo': analise_lp['poupanca_total_periodo'],
+        'poupanca_liquida': analise_lp['poupanca_total_periodo'] - custo_instalacao,
+        'val': analise_lp['val'],
+    }
+    acumulado_percentis = _percentis(analise_lp['fluxo_caixa_acumulado'], eixo=0) if n_anos else np.zeros((len(PERCENTIS), 0))
+    return {
+        'trajetorias': trajetorias,
+        'anos_meteorologicos': dados['anos_meteorologicos'],
+        'anos_omie': [dados['anos_omie'][k] for k in indices_omie],
+        'poupancas_base': [
+            {
+                'ano_meteorologico': dados['anos_meteorologicos'][i],
+                'ano_omie': dados['anos_omie'][k],
+                'custo_evitado_anual': float(poupancas[i, j, 0]),
+                'receita_adicional_anual': float(poupancas[i, j, 1]),
+                'poupanca_anual': float(poupancas[i, j].sum()),
+            }
+            for i in range(poupancas.shape[0]) for j, k in enumerate(indices_omie)
+        ],
+        'percentis': {
+            nome: dict(zip(PERCENTIS, (float(v) for v in _percentis(valores))))
+            for nome, valores in metricas.items()
+        },
+        'probabilidade_payback': float(np.mean(np.isfinite(analise_lp['payback_detalhado']))),
+        'fluxo_caixa_acumulado_percentis': dict(zip(PERCENTIS, acumulado_percentis)),
+    }
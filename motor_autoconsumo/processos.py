@@ -0,0 +1,38 @@
+# --- Contexto dos processos de trabalho (ProcessPoolExecutor) do pacote ---
+#
+# Os processos são criados com "spawn" e não com fork: o servidor do Streamlit tem várias threads (Tornado,
+# execução do script, atualização do OMIE) e um fork podia copiar um lock ocupado e bloquear o processo filho.
+#
+# Com "spawn", cada processo começa por executar de novo o módulo __main__ do pai; no Streamlit,
+# sys.modules['__main__'] é o script da aplicação, que voltaria a correr inteiro em cada processo.
+# As funções dos processos de trabalho estão todas neste pacote, por isso o __main__ é escondido
+# enquanto cada processo é lançado.
+import sys
+import threading
+import types
+from multiprocessing import context
+
+_TRINCO_MAIN = threading.Lock()
+
+
+class _ProcessoSpawn(context.SpawnProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        with _TRINCO_MAIN:
+            principal = sys.modules['__main__']
+            substituto = types.ModuleType('__main__')
+            sys.modules['__main__'] = substituto
+            try:
+                return context.SpawnProcess._Popen(process_obj)
+            finally:
+                # Se outra thread trocou entretanto o __main__ (nova execução do script), fica o dela
+                if sys.modules.get('__main__') is substituto:
+                    sys.modules['__main__'] = principal
+
+
+class _ContextoSpawn(context.SpawnContext):
+    Process = _ProcessoSpawn
+
+
+# Para usar como ProcessPoolExecutor(..., mp_context=CONTEXTO_PROCESSOS)
+CONTEXTO_PROCESSOS = _ContextoSpawn()
@@ -0,0 +1,367 @@
+# --- Produção solar: perfil PVGIS (ou backup por distrito) e autoconsumo de cada potência ---
+import numpy as np
+import pandas as pd
+import requests
+
+import cache_pvgis
+import constantes as C
+
+MENSAGEM_SEM_BACKUP = "Não foram encontrados dados de backup para o distrito '{distrito}'."
+
+
+def interpolar_perfis_para_quarto_horario(perfis_horarios):
+    """
+    Converte perfis horários em quarto-horários usando interpolação linear
+    que preserva a energia total e cria uma curva de produção suave.
+    """
+    perfis_quarto_horarios = {}
+    for distrito, perfis_mensais in perfis_horarios.items():
+        perfis_quarto_horarios[distrito] = {}
+        for mes, perfil_hora in perfis_mensais.items():
+            novo_perfil_mes = {}
+            horas_ordenadas = sorted(perfil_hora.keys())
+
+            for i, hora_atual in enumerate(horas_ordenadas):
+                # Obter os valores da hora anterior, atual e seguinte para calcular a tendência
+                valor_anterior = perfil_hora.get(hora_atual - 1, 0)
+                valor_atual = perfil_hora[hora_atual]
+                valor_seguinte = perfil_hora.get(hora_atual + 1, 0)
+
+                # Se for a primeira ou última hora de produção, a tendência é mais simples
+                if i == 0: # Nascer do sol
+                    valor_anterior = 0
+                if i == len(horas_ordenadas) - 1: # Pôr do sol
+                    valor_seguinte = 0
+
+                # Calcular a "taxa de produção" no início e no fim da hora atual
+                # A taxa no início da hora é a média entre a hora anterior e a atual
+                taxa_inicio_hora = (valor_anterior + valor_atual) / 2.0
+                # A taxa no fim da hora é a média entre a hora atual e a seguinte
+                taxa_fim_hora = (valor_atual + valor_seguinte) / 2.0
+                
+                # Com base nestas taxas, calculamos a produção para cada intervalo de 15 minutos
+                # usando a fórmula da área de um trapézio, o que garante uma interpolação linear.
+                # O fator 0.25 representa o intervalo de 15 minutos (1/4 de hora).
+                p00 = (taxa_inicio_hora + (taxa_inicio_hora * 0.75 + taxa_fim_hora * 0.25)) / 2.0 * 0.25
+                p15 = ((taxa_inicio_hora * 0.75 + taxa_fim_hora * 0.25) + (taxa_inicio_hora * 0.5 + taxa_fim_hora * 0.5)) / 2.0 * 0.25
+                p30 = ((taxa_inicio_hora * 0.5 + taxa_fim_hora * 0.5) + (taxa_inicio_hora * 0.25 + taxa_fim_hora * 0.75)) / 2.0 * 0.25
+                p45 = ((taxa_inicio_hora * 0.25 + taxa_fim_hora * 0.75) + taxa_fim_hora) / 2.0 * 0.25
+                
+                # A soma de p00, p15, p30, p45 será muito próxima do valor_atual original.
+                soma_calculada = p00 + p15 + p30 + p45
+                if soma_calculada > 0:
+                    fator_correcao = valor_atual / soma_calculada
+                    novo_perfil_mes[(hora_atual, 0)] = p00 * fator_correcao
+                    novo_perfil_mes[(hora_atual, 15)] = p15 * fator_correcao
+                    novo_perfil_mes[(hora_atual, 30)] = p30 * fator_correcao
+                    novo_perfil_mes[(hora_atual, 45)] = p45 * fator_correcao
+
+            perfis_quarto_horarios[distrito][mes] = novo_perfil_mes
+            
+    return perfis_quarto_horarios
+
+
+
+def calcular_producao_anual_pvgis_base(dados_pvgis):
+    """
+    Calcula a produção anual base (kWh/kWp) e a média diária para cada distrito.
+    """
+    producao_anual = {}
+    dias_no_mes = {1: 31, 2: 28.25, 3: 31, 4: 30, 5: 31, 6: 30, 7: 31, 8: 31, 9: 30, 10: 31, 11: 30, 12: 31}
+
+    for distrito, dados_mensais in dados_pvgis.items():
+        producao_total_anual_distrito = 0
+        for mes, prod_diaria_media in dados_mensais.items():
+            producao_total_anual_distrito += prod_diaria_media * dias_no_mes.get(mes, 30)
+        
+        # Calcular a média diária para o ano
+        media_diaria_anual = producao_total_anual_distrito / 365.25
+        
+        producao_anual[distrito] = {
+            "total": round(producao_total_anual_distrito),
+            "media_diaria": round(media_diaria_anual, 2)
+        }
+            
+    return producao_anual
+
+
+def calcular_producao_mensal_pvgis_base(dados_pvgis, mes_num):
+    """
+    Calcula a produção total para um mês específico (kWh/kWp) e a média diária para cada distrito.
+    """
+    producao_mensal = {}
+    dias_no_mes = {1: 31, 2: 28.25, 3: 31, 4: 30, 5: 31, 6: 30, 7: 31, 8: 31, 9: 30, 10: 31, 11: 30, 12: 31}
+    
+    if mes_num not in dias_no_mes:
+        return {}
+
+    for distrito, dados_mensais in dados_pvgis.items():
+        prod_diaria_media_base = dados_mensais.get(mes_num, 0)
+        producao_total_mes = prod_diaria_media_base * dias_no_mes[mes_num]
+        
+        producao_mensal[distrito] = {
+            "total": round(producao_total_mes),
+            "media_diaria": round(prod_diaria_media_base, 2)
+        }
+            
+    return producao_mensal
+
+def obter_perfil_producao_horaria_pvgis(latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem, distrito_backup):
+    """
+    Função atualizada: Obtém a série do PVGIS (cache em disco ou API) e cria um perfil de produção
+    com granularidade diária (média para cada dia específico do mês), em vez de uma média mensal.
+    """
+    try:
+        # A série horária vem da cache em disco (coordenadas quantizadas) ou, se for um local novo, da API
+        df_hourly_raw = cache_pvgis.obter_serie_horaria_pvgis(
+            latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem
+        )
+        df_hourly_raw['Producao_kWh_por_kWp'] = df_hourly_raw['P'] / 1000.0
+        
+        timestamp = df_hourly_raw['time']
+        
+        # 1. Extrair mês, DIA e hora
+        df_hourly_raw['mes'] = timestamp.dt.month
+        df_hourly_raw['dia'] = timestamp.dt.day
+        df_hourly_raw['hora'] = timestamp.dt.hour
+        
+        # 2. Agrupar por mês, DIA e hora para criar o perfil diário
+        perfil_horario_kwh = df_hourly_raw.groupby(['mes', 'dia', 'hora'])['Producao_kWh_por_kWp'].mean().to_dict()
+        
+        return perfil_horario_kwh, None
+
+    except requests.exceptions.RequestException as e:
+        return None, f"Erro ao contactar a API: {e}"
+    except (KeyError, TypeError):
+        return None, "A resposta da API foi inválida."
+
+def preparar_base_producao_solar(df_consumos, latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem, distrito_backup,
+                                 obter_perfil=obter_perfil_producao_horaria_pvgis):
+    """
+    Calcula uma única vez a produção solar de 1 kWp, já suavizada e renormalizada,
+    alinhada linha a linha com df_consumos (a "base de produção").
+
+    Como a produção é linear na potência instalada, cada potência a testar só precisa
+    de aplicar_base_producao_solar (uma multiplicação e os limites min/max),
+    sem repetir a consulta ao PVGIS, o alinhamento por (mês, dia, hora) e a suavização.
+
+    'obter_perfil' é a função que obtém o perfil do PVGIS (a aplicação passa a versão com st.cache_data).
+    Se o backup também não tiver dados para o distrito, 'producao_por_kwp' é None.
+    """
+    perfil_horario_kwh, erro_api = obter_perfil(
+        latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem, distrito_backup
+    )
+
+    if erro_api:
+        # O backup, que já funciona com hora local, permanece inalterado (não aplica o fator de sombra).
+        df_backup = simular_com_dados_distrito(
+            df_consumos, 1.0, inclinacao, orientacao_graus, distrito_backup, system_loss
+        )
+        producao_por_kwp = None if df_backup is None else df_backup['Producao_Solar_kWh'].to_numpy()
+        return {'producao_por_kwp': producao_por_kwp, 'fonte': "Backup por Distrito", 'erro_api': erro_api, 'aplica_sombra': False}
+
+    # --- CAMINHO DA API (SEM CORREÇÃO DE FUSO HORÁRIO) ---
+    chaves_perfil = np.array([mes * 10000 + dia * 100 + hora for (mes, dia, hora) in perfil_horario_kwh.keys()], dtype=np.int64)
+    valores_perfil = np.fromiter(perfil_horario_kwh.values(), dtype=np.float64, count=len(chaves_perfil))
+    producao = _alinhar_perfil(_chaves_consumo(df_consumos), chaves_perfil, valores_perfil)
+    return {'producao_por_kwp': producao, 'fonte': "API PVGIS", 'erro_api': None, 'aplica_sombra': True}
+
+def _chaves_consumo(df_consumos):
+    """Chave inteira mês*10000 + dia*100 + hora de cada linha, extraída DIRETAMENTE da hora local do ficheiro."""
+    interval_start = pd.to_datetime(df_consumos['DataHora']) - pd.Timedelta(minutes=15)
+    return (interval_start.dt.month * 10000 + interval_start.dt.day * 100 + interval_start.dt.hour).to_numpy()
+
+def _alinhar_perfil(chaves_consumo, chaves_perfil, valores_perfil):
+    """
+    Produção de 1 kWp de cada linha de consumo (kWh por quarto de hora) a partir de um perfil
+    horário (mês, dia, hora) dado em chaves inteiras, suavizada e renormalizada.
+    """
+    # 1. Alinhar o perfil (mês, dia, hora) com cada linha de consumo através de uma chave inteira
+    posicoes = pd.Index(chaves_perfil).get_indexer(chaves_consumo)
+    prod_horaria_base = np.where(posicoes >= 0, valores_perfil[posicoes], 0.0)
+    prod_horaria_base[np.isnan(prod_horaria_base)] = 0.0
+
+    producao = pd.Series(prod_horaria_base / 4.0)
+
+    # 2. Suavização e renormalização (a energia total mantém-se)
+    soma_original_precisa = producao.sum()
+    producao = producao.rolling(window=4, center=False, min_periods=1).mean()
+    soma_apos_suavizar = producao.sum()
+    if soma_apos_suavizar > 0:
+        fator_correcao = soma_original_precisa / soma_apos_suavizar
+        producao *= fator_correcao
+
+    return producao.to_numpy()
+
+def preparar_bases_producao_por_ano(df_consumos, latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem,
+                                    obter_serie=cache_pvgis.obter_serie_horaria_pvgis):
+    """
+    Uma base de produção de 1 kWp por ano meteorológico do PVGIS (2005-2023), em vez da média de todos
+    os anos: cada ano alinhado linha a linha com df_consumos como em preparar_base_producao_solar.
+    As horas que um ano não tem (29 de fevereiro nos anos comuns) usam a média dos outros anos.
+
+    Retorna {'anos': [ano, ...], 'producao_por_kwp': matriz anos x linhas, 'erro_api'};
+    sem acesso ao PVGIS, 'anos' fica vazio, 'producao_por_kwp' é None e 'erro_api' diz porquê.
+    """
+    try:
+        df_hourly_raw = obter_serie(latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem)
+        timestamp = df_hourly_raw['time']
+        producao_kwh = df_hourly_raw['P'].to_numpy(dtype=np.float64) / 1000.0
+        anos_serie = timestamp.dt.year.to_numpy()
+        chaves_serie = (timestamp.dt.month * 10000 + timestamp.dt.day * 100 + timestamp.dt.hour).to_numpy()
+    except requests.exceptions.RequestException as e:
+        return {'anos': [], 'producao_por_kwp': None, 'erro_api': f"Erro ao contactar a API: {e}"}
+    except (KeyError, TypeError, AttributeError):
+        return {'anos': [], 'producao_por_kwp': None, 'erro_api': "A resposta da API foi inválida."}
+
+    # Matriz ano x (mês, dia, hora), com a média de todos os anos onde um ano não tem valor
+    anos, linha = np.unique(anos_serie, return_inverse=True)
+    chaves_perfil, coluna = np.unique(chaves_serie, return_inverse=True)
+    perfis = np.full((len(anos), len(chaves_perfil)), np.nan)
+    perfis[linha, coluna] = producao_kwh
+    perfis = np.where(np.isnan(perfis), np.nanmean(perfis, axis=0), perfis)
+
+    chaves_consumo = _chaves_consumo(df_consumos)
+    producao_por_kwp = np.array([_alinhar_perfil(chaves_consumo, chaves_perfil, perfil) for perfil in perfis])
+    return {'anos': [int(ano) for ano in anos], 'producao_por_kwp': producao_por_kwp, 'erro_api': None}
+
+def aplicar_base_producao_solar(df_consumos, base_producao, potencia_kwp, fator_sombra):
+    """
+    Escala a base de produção de 1 kWp para 'potencia_kwp' e calcula autoconsumo,
+    excedente e consumo da rede. Retorna None se a base não tiver produção (backup sem dados).
+    """
+    if base_producao['producao_por_kwp'] is None:
+        return None
+
+    df_resultado = df_consumos.copy()
+    df_resultado['DataHora'] = pd.to_datetime(df_resultado['DataHora'])
+
+    producao = base_producao['producao_por_kwp'] * potencia_kwp
+    if base_producao['aplica_sombra']:
+        producao = producao * (1 - (fator_sombra / 100.0))
+    df_resultado['Producao_Solar_kWh'] = producao
+
+    df_resultado['Autoconsumo_kWh'] = np.minimum(df_resultado['Consumo (kWh)'], df_resultado['Producao_Solar_kWh'])
+    df_resultado['Excedente_kWh'] = np.maximum(0, df_resultado['Producao_Solar_kWh'] - df_resultado['Consumo (kWh)'])
+    df_resultado['Consumo_Rede_kWh'] = np.maximum(0, df_resultado['Consumo (kWh)'] - df_resultado['Autoconsumo_kWh'])
+
+    return df_resultado
+
+def simular_autoconsumo_completo(df_consumos, potencia_kwp, latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem, distrito_backup, fator_sombra,
+                                 obter_perfil=obter_perfil_producao_horaria_pvgis):
+    """
+    Versão sem correção de fuso horário, fazendo uma
+    correspondência direta entre a hora local do consumo e a hora UTC da API.
+    Para testar várias potências, prefira preparar_base_producao_solar + aplicar_base_producao_solar.
+    """
+    if df_consumos is None or df_consumos.empty:
+        return df_consumos.copy(), "Dados de consumo vazios.", None
+
+    base_producao = preparar_base_producao_solar(
+        df_consumos, latitude, longitude, inclinacao, orientacao_graus, system_loss, posicao_montagem, distrito_backup,
+        obter_perfil=obter_perfil
+    )
+    df_resultado = aplicar_base_producao_solar(df_consumos, base_producao, potencia_kwp, fator_sombra)
+    return df_resultado, base_producao['fonte'], base_producao['erro_api']
+
+def simular_com_dados_distrito(df_consumos, potencia_kwp, inclinacao, orientacao_graus, distrito, system_loss):
+    """
+    Função de backup que simula a produção solar usando os dados estáticos por distrito.
+    Retorna None se não houver dados para o distrito (ver MENSAGEM_SEM_BACKUP).
+    """
+    dados_producao_distrito = C.DADOS_PVGIS_DISTRITO.get(distrito)
+    perfis_horarios_distrito = C.PERFIS_HORARIOS_MENSAIS_POR_DISTRITO.get(distrito)
+
+    if not dados_producao_distrito or not perfis_horarios_distrito:
+        return None
+
+    df_resultado = df_consumos.copy()
+    
+    perfis_quarto_horarios = interpolar_perfis_para_quarto_horario({distrito: perfis_horarios_distrito})[distrito]
+
+    # --- FATORES DE AJUSTE (DA SUA VERSÃO ORIGINAL) ---
+    fator_inclinacao = 1.0 - (abs(inclinacao - 35) / 100) * 0.5
+    fator_orientacao = 1.0 # Sul (0°)
+    if abs(orientacao_graus) > 70: # Próximo de Este/Oeste
+        fator_orientacao = 0.80
+    elif abs(orientacao_graus) > 25: # Próximo de Sudeste/Sudoeste
+        fator_orientacao = 0.95
+    
+    # --- FATOR DE PERDAS ---
+    fator_perdas_sistema = system_loss / 100.0
+
+    # --- TABELA (MÊS, HORA, MINUTO) PRÉ-CALCULADA ---
+    # Cada posição guarda a produção do intervalo de 15 min que começa nesse instante.
+    # Minutos fora de 00/15/30/45 (ex: o 00:00 deslocado para 23:59) ficam a zero, como no perfil original.
+    tabela_producao = np.zeros((13, 24, 60))
+    for mes in range(1, 13):
+        energia_diaria_base = dados_producao_distrito.get(mes, 0)
+
+        # Fórmula de cálculo da sua versão original
+        energia_diaria_total_sistema = (
+            energia_diaria_base * potencia_kwp *
+            fator_inclinacao * fator_orientacao *
+            (1 - fator_perdas_sistema)
+        )
+
+        for (hora, minuto), fator_distribuicao in perfis_quarto_horarios.get(mes, {}).items():
+            tabela_producao[mes, hora, minuto] = energia_diaria_total_sistema * fator_distribuicao
+
+    timestamp_inicio = (pd.to_datetime(df_resultado['DataHora']) - pd.Timedelta(minutes=15)).dt
+    df_resultado['Producao_Solar_kWh'] = tabela_producao[
+        timestamp_inicio.month.to_numpy(), timestamp_inicio.hour.to_numpy(), timestamp_inicio.minute.to_numpy()
+    ]
+
+    # Bloco de suavização e cálculo final (mantém-se igual)
+    soma_original_precisa = df_resultado['Producao_Solar_kWh'].sum()
+    df_resultado['Producao_Solar_kWh'] = df_resultado['Producao_Solar_kWh'].rolling(window=4, center=False, min_periods=1).mean()
+    soma_apos_suavizar = df_resultado['Producao_Solar_kWh'].sum()
+    if soma_apos_suavizar > 0:
+        fator_correcao = soma_original_precisa / soma_apos_suavizar
+        df_resultado['Producao_Solar_kWh'] *= fator_correcao
+
+    df_resultado['Autoconsumo_kWh'] = np.minimum(df_resultado['Consumo (kWh)'], df_resultado['Producao_Solar_kWh'])
+    df_resultado['Excedente_kWh'] = np.maximum(0, df_resultado['Producao_Solar_kWh'] - df_resultado['Consumo (kWh)'])
+    df_resultado['Consumo_Rede_kWh'] = np.maximum(0, df_resultado['Consumo (kWh)'] - df_resultado['Autoconsumo_kWh'])
+
+    return df_resultado
+
+def aplicar_simulacao_solar_aos_dados_base(df_original, df_solar_novo):
+    df_final = df_original.copy()
+
+    # Sem simulação -> manter cenário base
+    if df_solar_novo is None or df_solar_novo.empty:
+        df_final['Producao_Solar_kWh_Nova'] = 0.0
+        df_final['Autoconsumo_kWh_Novo']   = 0.0
+        df_final['Excedente_kWh_Novo']     = 0.0
+        df_final['Consumo_Rede_Final_kWh'] = df_final['Consumo (kWh)']
+        df_final['Injecao_Rede_Final_kWh'] = df_final.get('Injecao_Rede_kWh', 0.0)
+        return df_final
+
+    # Garantir tipos/únicos no lado solar
+    solar = df_solar_novo.copy()
+    solar['DataHora'] = pd.to_datetime(solar['DataHora'])
+    solar = (solar
+             .groupby('DataHora', as_index=False)[
+                 ['Producao_Solar_kWh','Autoconsumo_kWh','Excedente_kWh']
+             ].sum())
+
+    # Left-merge para alinhar 1:1 com o base
+    base = df_final[['DataHora']].copy()
+    base['DataHora'] = pd.to_datetime(base['DataHora'])
+    out = (base.merge(solar, on='DataHora', how='left')
+                .fillna({'Producao_Solar_kWh': 0.0,
+                         'Autoconsumo_kWh':     0.0,
+                         'Excedente_kWh':       0.0}))
+
+    # Copiar valores já ALINHADOS
+    df_final['Producao_Solar_kWh_Nova'] = out['Producao_Solar_kWh'].values
+    df_final['Autoconsumo_kWh_Novo']    = out['Autoconsumo_kWh'].values
+    df_final['Excedente_kWh_Novo']      = out['Excedente_kWh'].values
+
+    # Cálculos finais (com “clip” para nunca dar negativo na rede)
+    inj_base = df_final.get('Injecao_Rede_kWh', 0.0)
+    df_final['Consumo_Rede_Final_kWh'] = (df_final['Consumo (kWh)'] - df_final['Autoconsumo_kWh_Novo']).clip(lower=0)
+    df_final['Injecao_Rede_Final_kWh'] = inj_base + df_final['Excedente_kWh_Novo']
+
+    return df_final
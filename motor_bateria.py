@@ -0,0 +1,204 @@
+import math
+import numpy as np
+
+# O Numba é opcional: se estiver instalado o despacho corre compilado,
+# caso contrário usa-se a mesma função em Python puro sobre listas.
+try:
+    from numba import njit
+    NUMBA_DISPONIVEL = True
+except ImportError:
+    njit = None
+    NUMBA_DISPONIVEL = False
+
+
+def _despachar_intervalos(excedente, consumo_rede, capacidade_util_kwh, potencia_max_intervalo_kwh,
+                          eficiencia_lado_unico, soc, carga, descarga, entregue):
+    """
+    Núcleo do despacho da bateria, intervalo a intervalo.
+    Escreve o resultado nas sequências recebidas (excedente e consumo_rede são atualizados no local).
+    Replica exatamente a ordem das operações da versão original linha a linha.
+    """
+    estado_carga_kwh = 0.0
+    for i in range(len(excedente)):
+        excedente_solar_intervalo = excedente[i]
+        consumo_rede_intervalo = consumo_rede[i]
+
+        # --- LÓGICA DE CARGA (com excedente solar) ---
+        if excedente_solar_intervalo > 0:
+            espaco_disponivel = capacidade_util_kwh - estado_carga_kwh
+            energia_para_carregar = min(excedente_solar_intervalo, potencia_max_intervalo_kwh, espaco_disponivel / eficiencia_lado_unico)
+            estado_carga_kwh += energia_para_carregar * eficiencia_lado_unico
+            excedente[i] = excedente_solar_intervalo - energia_para_carregar
+            carga[i] = energia_para_carregar
+
+        # --- LÓGICA DE DESCARGA (para abater consumo da rede) ---
+        elif consumo_rede_intervalo > 0:
+            energia_para_descarregar = min(consumo_rede_intervalo / eficiencia_lado_unico, potencia_max_intervalo_kwh, estado_carga_kwh)
+            energia_entregue = energia_para_descarregar * eficiencia_lado_unico
+            estado_carga_kwh -= energia_para_descarregar
+            consumo_rede[i] = consumo_rede_intervalo - energia_entregue
+            descarga[i] = energia_para_descarregar
+            entregue[i] = energia_entregue
+
+        soc[i] = estado_carga_kwh
+
+
+if NUMBA_DISPONIVEL:
+    _despachar_intervalos_compilado = njit(cache=True, nogil=True)(_despachar_intervalos)
+else:
+    _despachar_intervalos_compilado = None
+
+
+def parametros_bateria(capacidade_kwh, potencia_kw, eficiencia_perc, dod_perc):
+    """
+    Converte os parâmetros da interface para as grandezas usadas no despacho:
+    capacidade útil (kWh), energia máxima por intervalo de 15 min (kWh) e eficiência de um só sentido.
+    """
+    capacidade_util_kwh = capacidade_kwh * (dod_perc / 100.0)
+    potencia_max_intervalo_kwh = potencia_kw / 4.0
+    # A eficiência é dividida: uma parte na carga, outra na descarga
+    eficiencia_lado_unico = math.sqrt(eficiencia_perc / 100.0)
+    return capacidade_util_kwh, potencia_max_intervalo_kwh, eficiencia_lado_unico
+
+
+def despachar_bateria(excedente_kwh, consumo_rede_kwh, capacidade_kwh, potencia_kw, eficiencia_perc, dod_perc):
+    """
+    Simula a bateria sobre arrays contíguos de excedente solar e consumo da rede (kWh por 15 min).
+
+    Retorna um dicionário de arrays float64:
+    'Excedente_kWh' e 'Consumo_Rede_kWh' após a bateria, 'Bateria_SoC_kWh', 'Bateria_Carga_kWh',
+    'Bateria_Descarga_kWh' e 'Bateria_Energia_Entregue_kWh' (NaN nos intervalos sem descarga).
+    """
+    excedente = np.array(excedente_kwh, dtype=np.float64)
+    consumo_rede = np.array(consumo_rede_kwh, dtype=np.float64)
+    n = len(excedente)
+
+    capacidade_util_kwh, potencia_max_intervalo_kwh, eficiencia_lado_unico = parametros_bateria(
+        capacidade_kwh, potencia_kw, eficiencia_perc, dod_perc
+    )
+
+    soc = np.zeros(n)
+    carga = np.zeros(n)
+    descarga = np.zeros(n)
+    entregue = np.full(n, np.nan)
+
+    if _despachar_intervalos_compilado is not None:
+        _despachar_intervalos_compilado(
+            excedente, consumo_rede, capacidade_util_kwh, potencia_max_intervalo_kwh,
+            eficiencia_lado_unico, soc, carga, descarga, entregue
+        )
+    else:
+        # Sem Numba: listas Python são bastante mais rápidas do que indexar arrays NumPy elemento a elemento
+        listas = [a.tolist() for a in (excedente, consumo_rede, soc, carga, descarga, entregue)]
+        _despachar_intervalos(
+            listas[0], listas[1], capacidade_util_kwh, potencia_max_intervalo_kwh,
+            eficiencia_lado_unico, listas[2], listas[3], listas[4], listas[5]
+        )
+        excedente, consumo_rede, soc, carga, descarga, entregue = (np.array(l, dtype=np.float64) for l in listas)
+
+    return {
+        'Excedente_kWh': excedente,
+        'Consumo_Rede_kWh': consumo_rede,
+        'Bateria_SoC_kWh': soc,
+        'Bateria_Carga_kWh': carga,
+        'Bateria_Descarga_kWh': descarga,
+        'Bateria_Energia_Entregue_kWh': entregue,
+    }
+
+
+def _despachar_lote(excedente, consumo_rede, capacidades, potencias, eficiencias,
+                    excedente_final, consumo_rede_final, carga_total, entregue_total):
+    """
+    Núcleo do despacho em lote: um único ciclo no tempo avança todas as configurações em conjunto.
+    O estado (SoC) é um vetor com uma posição por configuração; as saídas são matrizes (configuração x intervalo).
+    """
+    n_config = capacidades.shape[0]
+    soc = np.zeros(n_config)
+    for i in range(excedente.shape[0]):
+        excedente_solar_intervalo = excedente[i]
+        consumo_rede_intervalo = consumo_rede[i]
+        if excedente_solar_intervalo > 0:
+            for k in range(n_config):
+                espaco_disponivel = capacidades[k] - soc[k]
+                energia_para_carregar = min(excedente_solar_intervalo, potencias[k], espaco_disponivel / eficiencias[k])
+                soc[k] += energia_para_carregar * eficiencias[k]
+                excedente_final[k, i] = excedente_solar_intervalo - energia_para_carregar
+                carga_total[k] += energia_para_carregar
+        elif consumo_rede_intervalo > 0:
+            for k in range(n_config):
+                energia_para_descarregar = min(consumo_rede_intervalo / eficiencias[k], potencias[k], soc[k])
+                energia_entregue = energia_para_descarregar * eficiencias[k]
+                soc[k] -= energia_para_descarregar
+                consumo_rede_final[k, i] = consumo_rede_intervalo - energia_entregue
+                entregue_total[k] += energia_entregue
+
+
+if NUMBA_DISPONIVEL:
+    _despachar_lote_compilado = njit(cache=True, nogil=True)(_despachar_lote)
+else:
+    _despachar_lote_compilado = None
+
+
+def _despachar_lote_numpy(excedente, consumo_rede, capacidades, potencias, eficiencias,
+                          excedente_final, consumo_rede_final, carga_total, entregue_total):
+    """
+    Versão sem Numba do despacho em lote: o ciclo no tempo é em Python, mas cada passo
+    atualiza todas as configurações de uma vez com operações vetoriais.
+    Os intervalos sem excedente nem consumo da rede não alteram o estado e são saltados.
+    """
+    soc = np.zeros(capacidades.shape[0])
+    ativos = np.flatnonzero((excedente > 0) | (consumo_rede > 0))
+    for i in ativos.tolist():
+        excedente_solar_intervalo = excedente[i]
+        if excedente_solar_intervalo > 0:
+            energia_para_carregar = np.minimum(np.minimum(excedente_solar_intervalo, potencias), (capacidades - soc) / eficiencias)
+            soc += energia_para_carregar * eficiencias
+            excedente_final[:, i] = excedente_solar_intervalo - energia_para_carregar
+            carga_total += energia_para_carregar
+        else:
+            consumo_rede_intervalo = consumo_rede[i]
+            energia_para_descarregar = np.minimum(np.minimum(consumo_rede_intervalo / eficiencias, potencias), soc)
+            energia_entregue = energia_para_descarregar * eficiencias
+            soc -= energia_para_descarregar
+            consumo_rede_final[:, i] = consumo_rede_intervalo - energia_entregue
+            entregue_total += energia_entregue
+
+
+def despachar_baterias_em_lote(excedente_kwh, consumo_rede_kwh, configuracoes):
+    """
+    Simula várias baterias sobre a mesma série de excedente solar e consumo da rede, numa só passagem.
+
+    'configuracoes' é uma lista de tuplos (capacidade_kwh, potencia_kw, eficiencia_perc, dod_perc).
+    Retorna um dicionário compacto com, para cada configuração (pela mesma ordem):
+    'Consumo_Rede_kWh' e 'Excedente_kWh' (matrizes configuração x intervalo, após a bateria),
+    'Carga_Total_kWh' e 'Energia_Entregue_Total_kWh' (vetores com os totais do período).
+    Cada linha é idêntica ao resultado de despachar_bateria para a mesma configuração.
+    """
+    excedente = np.ascontiguousarray(excedente_kwh, dtype=np.float64)
+    consumo_rede = np.ascontiguousarray(consumo_rede_kwh, dtype=np.float64)
+    n_config = len(configuracoes)
+
+    parametros = np.array([parametros_bateria(*config) for config in configuracoes], dtype=np.float64).reshape(n_config, 3)
+    capacidades = np.ascontiguousarray(parametros[:, 0])
+    potencias = np.ascontiguousarray(parametros[:, 1])
+    eficiencias = np.ascontiguousarray(parametros[:, 2])
+
+    # As saídas partem das séries de entrada; só os intervalos com carga/descarga são reescritos
+    excedente_final = np.tile(excedente, (n_config, 1))
+    consumo_rede_final = np.tile(consumo_rede, (n_config, 1))
+    carga_total = np.zeros(n_config)
+    entregue_total = np.zeros(n_config)
+
+    if n_config > 0:
+        despachar = _despachar_lote_compilado if _despachar_lote_compilado is not None else _despachar_lote_numpy
+        despachar(
+            excedente, consumo_rede, capacidades, potencias, eficiencias,
+            excedente_final, consumo_rede_final, carga_total, entregue_total
+        )
+
+    return {
+        'Consumo_Rede_kWh': consumo_rede_final,
+        'Excedente_kWh': excedente_final,
+        'Carga_Total_kWh': carga_total,
+        'Energia_Entregue_Total_kWh': entregue_total,
+    }
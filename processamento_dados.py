@@ -1,224 +1,192 @@
 import streamlit as st
-import pandas as pd
-import datetime
-from calendar import monthrange
+import requests
+import hashlib
+import io
+import threading
+import time
+import numpy as np
+import cache_disco
+from motor_autoconsumo import ingestao
+from motor_autoconsumo.ingestao import PYARROW_DISPONIVEL, pa
+
+# A leitura dos ficheiros da E-Redes e das tabelas OMIE está no motor de simulação (motor_autoconsumo.ingestao),
+# que não depende do Streamlit. Este módulo mantém a interface usada pela aplicação e acrescenta a cache,
+# as mensagens de erro e a atualização dos dados OMIE em segundo plano.
+from motor_autoconsumo.ingestao import (
+    processar_ficheiro_consumos,
+    PROCESSOS_INGESTAO,
+    validar_e_juntar_ficheiros,
+    fatia_por_datahora,
+    agregar_consumos_por_periodo,
+    calcular_medias_omie_para_todos_ciclos,
+)
+
+SUBDIRETORIO_CACHE_SNAPSHOT = "snapshot_omie"
 
 # --- Carregar ficheiro Excel do GitHub ---
 @st.cache_data(ttl=1800, show_spinner=False) # Cache por 30 minutos (1800 segundos)
 def carregar_dados_excel(url):
-    xls = pd.ExcelFile(url)
-    omie_ciclos = xls.parse("OMIE_CICLOS")
-    # Limpar nomes das colunas em OMIE_CICLOS
-    omie_ciclos.columns = [str(c).strip() for c in omie_ciclos.columns]
-    
-    # GARANTIR QUE TEMOS COLUNAS DE DATA E HORA SEPARADAS
-    if 'Data' not in omie_ciclos.columns and 'DataHora' in omie_ciclos.columns:
-        temp_dt = pd.to_datetime(omie_ciclos['DataHora'])
-        omie_ciclos['Data'] = temp_dt.dt.strftime('%m/%d/%Y')
-        omie_ciclos['Hora'] = temp_dt.dt.strftime('%H:%M')
-
-    if 'Data' in omie_ciclos.columns and 'Hora' in omie_ciclos.columns:
-        # CORREÇÃO: Forçar a leitura com o formato exato MM/DD/YYYY HH:MM
-        omie_ciclos['DataHora'] = pd.to_datetime(
-            omie_ciclos['Data'].astype(str) + ' ' + omie_ciclos['Hora'].astype(str),
-            format='%m/%d/%Y %H:%M',  # Formato Americano
-            errors='coerce'
-        ).dt.tz_localize(None)
-        
-        omie_ciclos.dropna(subset=['DataHora'], inplace=True)
-        omie_ciclos.drop_duplicates(subset=['DataHora'], keep='first', inplace=True)
-    else:
-        st.error("Colunas 'Data' e 'Hora' não encontradas na aba OMIE_CICLOS.")
-
-    constantes = xls.parse("Constantes")
-    return omie_ciclos, constantes
-
-def processar_ficheiro_consumos(ficheiro_excel):
+    try:
+        return ingestao.ler_excel_omie(url)
+    except KeyError as e:
+        st.error(str(e).strip("'\""))
+        raise
+
+# --- Atualização condicional dos dados OMIE ---
+# Os dados só mudam uma vez por dia (GitHub Action das 13:00 UTC). Em vez de voltar a descarregar e
+# processar tudo a cada 30 minutos, guarda-se o validador de cada ficheiro (ETag, Last-Modified e hash
+# do conteúdo) e faz-se, em segundo plano, um pedido condicional: os dados só são substituídos se o
+# ficheiro tiver realmente mudado. Os pedidos dos utilizadores recebem sempre os dados já processados.
+INTERVALO_VERIFICACAO_SEGUNDOS = 600
+
+def _pedido_condicional(url, validador):
     """
-    Lê um ficheiro Excel da E-Redes, deteta se é de uma instalação com ou sem UPAC,
-    extrai os dados relevantes de consumo e injeção, e retorna um DataFrame padronizado.
+    GET condicional (If-None-Match / If-Modified-Since).
+    Retorna (conteudo, novo_validador); conteudo é None se o ficheiro não mudou
+    (resposta 304 ou conteúdo com o mesmo hash).
     """
-    try:
-        # 1. Encontrar a linha do cabeçalho
-        df_temp = pd.read_excel(ficheiro_excel, header=None, nrows=20)
-        header_row_index = -1
-        for i, row in df_temp.iterrows():
-            if "Data" in row.values and "Hora" in row.values:
-                header_row_index = i
-                break
-        if header_row_index == -1:
-            return None, "Não foi possível encontrar a linha de cabeçalho com 'Data' e 'Hora'."
-
-        df = pd.read_excel(ficheiro_excel, header=header_row_index)
-        df.columns = [str(c).strip() for c in df.columns]
-
-        # 2. Deteção do tipo de instalação (com ou sem UPAC)
-        colunas_df = df.columns
-        tem_injecao = any("Injeção" in col for col in colunas_df)
-        
-        df_final = pd.DataFrame()
-
-        # 3. Mapeamento de colunas para nomes padronizados
-        MAPA_COLUNAS = {
-            # Consumo
-            'Consumo_Rede_kWh': ["Consumo medido na IC, Ativa (kW)"],
-            'Consumo_Total_Casa_kWh': ["Consumo registado (kW)", "Consumo registado, Ativa (kW)"],
-            # Injeção
-            'Injecao_Rede_kWh': ["Injeção na rede medida na IC, Ativa (kW)"],
-            'Injecao_Total_UPAC_kWh': ["Injeção registada (kW)", "Injeção registada, Ativa (kW)"],
-            # Potência (para análise)
-            'Potencia_kW_Para_Analise': ["Consumo registado (kW)", "Consumo registado, Ativa (kW)", "Consumo medido na IC, Ativa (kW)"]
-        }
-
-        for nome_padrao, nomes_possiveis in MAPA_COLUNAS.items():
-            for nome_col in nomes_possiveis:
-                if nome_col in colunas_df:
-                    # Converte para kWh (divide por 4) e guarda com nome padronizado
-                    df_final[nome_padrao] = pd.to_numeric(df[nome_col], errors='coerce') / 4.0
-                    break # Para ao encontrar a primeira correspondência
-        
-        # Lógica especial para o caso SEM UPAC
-        if not tem_injecao:
-            # O consumo total da casa é o que vem da rede
-            if 'Consumo_Total_Casa_kWh' in df_final.columns:
-                 df_final['Consumo_Rede_kWh'] = df_final['Consumo_Total_Casa_kWh']
-            
-        # Garantir que todas as colunas essenciais existem, preenchendo com 0 se faltarem
-        colunas_essenciais = ['Consumo_Rede_kWh', 'Consumo_Total_Casa_kWh', 'Injecao_Rede_kWh', 'Injecao_Total_UPAC_kWh', 'Potencia_kW_Para_Analise']
-        for col in colunas_essenciais:
-            if col not in df_final.columns:
-                df_final[col] = 0.0
-
-        # 4. Processamento de Data e Hora
-        df_final['DataHora'] = pd.to_datetime(
-            df['Data'].astype(str) + ' ' + df['Hora'].astype(str),
-            errors='coerce'
-        ).dt.tz_localize(None)
-
-        # Ajuste para o timestamp 00:00
-        df_final['DataHora'] = df_final['DataHora'].apply(
-            lambda ts: ts - pd.Timedelta(minutes=1) if ts and ts.time() == datetime.time(0, 0) else ts
-        )
-        
-        df_final.dropna(subset=['DataHora'], inplace=True)
-
-        # 5. Cálculo dos valores derivados
-        # Autoconsumo = O que a casa consumiu no total - O que foi preciso ir buscar à rede
-        df_final['Autoconsumo_Settlement_kWh'] = (df_final['Consumo_Total_Casa_kWh'] - df_final['Consumo_Rede_kWh']).round(5)
-        # Garante que não há valores negativos por imprecisões de float
-        df_final['Autoconsumo_Settlement_kWh'] = df_final['Autoconsumo_Settlement_kWh'].clip(lower=0)
-        
-        # Renomear a coluna principal de consumo para consistência com o resto do simulador
-        df_final.rename(columns={'Consumo_Rede_kWh': 'Consumo (kWh)'}, inplace=True)
-        
-        colunas_de_retorno = [
-            'DataHora', 
-            'Consumo (kWh)', # Consumo líquido da rede
-            'Injecao_Rede_kWh', # Injeção líquida na rede
-            'Consumo_Total_Casa_kWh', # Consumo bruto da casa
-            'Injecao_Total_UPAC_kWh', # Injeção bruta da UPAC
-            'Autoconsumo_Settlement_kWh', # Autoconsumo de Settlement/Netmetering
-            'Potencia_kW_Para_Analise'
-        ]
-
-        return df_final[colunas_de_retorno], None
-
-    except Exception as e:
-        return None, f"Erro ao processar ficheiro: {e}"
-    
-def validar_e_juntar_ficheiros(lista_de_ficheiros):
+    cabecalhos = {}
+    if validador.get('etag'):
+        cabecalhos['If-None-Match'] = validador['etag']
+    if validador.get('last_modified'):
+        cabecalhos['If-Modified-Since'] = validador['last_modified']
+
+    resposta = requests.get(url, headers=cabecalhos, timeout=30)
+    if resposta.status_code == 304:
+        return None, validador
+    resposta.raise_for_status()
+
+    novo_validador = {
+        'etag': resposta.headers.get('ETag'),
+        'last_modified': resposta.headers.get('Last-Modified'),
+        'hash': hashlib.sha256(resposta.content).hexdigest(),
+    }
+    if novo_validador['hash'] == validador.get('hash'):
+        return None, novo_validador
+    return resposta.content, novo_validador
+
+def _atualizar_snapshot(estado, url_snapshot_omie, url_snapshot_constantes):
+    """
+    Verifica os dois ficheiros do snapshot e, se algum mudou, grava-os na cache em disco
+    e volta a ler ambos. Retorna os novos dados, ou None se nada mudou.
+    Se a rede falhar e ainda não houver dados, usa a última cópia em disco.
+    """
+    caminhos = []
+    houve_mudancas = estado['fonte'] != 'snapshot'
+    novos_validadores = {}
+    for url in (url_snapshot_omie, url_snapshot_constantes):
+        nome_ficheiro = url.rsplit('/', 1)[-1]
+        caminho = cache_disco.DIRETORIO_CACHE / SUBDIRETORIO_CACHE_SNAPSHOT / nome_ficheiro
+        try:
+            conteudo, novos_validadores[url] = _pedido_condicional(url, estado['validadores'].get(url, {}))
+        except requests.exceptions.RequestException:
+            if estado['dados'] is not None or not caminho.exists():
+                raise
+            conteudo = None # Sem rede no arranque: usa a cópia em disco
+        if conteudo is not None:
+            # Sem limite de tamanho efetivo: são apenas os dois ficheiros do snapshot
+            cache_disco.guardar_entrada(SUBDIRETORIO_CACHE_SNAPSHOT, nome_ficheiro, conteudo, limite_bytes=2**40)
+            houve_mudancas = True
+        caminhos.append(caminho)
+
+    estado['validadores'].update(novos_validadores)
+    if not houve_mudancas:
+        return None
+    return ingestao.ler_snapshot_omie(*caminhos)
+
+def _atualizar_excel(estado, url_excel):
+    """Verifica o Excel e, se mudou, volta a processá-lo. Retorna os novos dados, ou None se nada mudou."""
+    # Se os dados atuais não vêm do Excel, é preciso processá-lo mesmo que não tenha mudado:
+    # pedido sem validadores (um só download, sem 304)
+    validador_atual = estado['validadores'].get(url_excel, {}) if estado['fonte'] == 'excel' else {}
+    conteudo, validador = _pedido_condicional(url_excel, validador_atual)
+    estado['validadores'][url_excel] = validador
+    if conteudo is None:
+        return None
+    return ingestao.ler_excel_omie(io.BytesIO(conteudo))
+
+def _so_de_leitura(dados):
     """
-    Processa uma lista de ficheiros da E-Redes, verifica se há sobreposição de datas
-    e, se não houver, junta todos os dados num único DataFrame.
+    Cópia de (OMIE_CICLOS, Constantes) com os arrays de todas as colunas só de leitura. Os mesmos DataFrames
+    são devolvidos a todas as sessões (e as fatias de fatia_por_datahora são vistas sobre eles), por isso
+    uma escrita no lugar dá erro em vez de alterar os dados de todos os utilizadores.
     """
-    if not lista_de_ficheiros:
-        return None, "Nenhum ficheiro carregado."
-
-    dataframes_processados = []
-    intervalos_de_datas = []
-    data_limite = datetime.date(2024, 1, 1)
-
-    for ficheiro in lista_de_ficheiros:
-        df_individual, erro = processar_ficheiro_consumos(ficheiro)
-        if erro:
-            return None, f"Erro ao processar o ficheiro '{ficheiro.name}': {erro}"
-        
-        if df_individual.empty:
-            continue
-
-        dataframes_processados.append(df_individual)
-        min_data = df_individual['DataHora'].min()
-        if min_data.date() < data_limite:
-            erro_msg = (
-                f"Erro no ficheiro '{ficheiro.name}': Contém dados de '{min_data.strftime('%d/%m/%Y')}', "
-                f"que é anterior à data mínima permitida de 01/01/2024. Remova-o!"
-            )
-            return None, erro_msg
-        max_data = df_individual['DataHora'].max()
-        intervalos_de_datas.append((min_data, max_data))
-
-    if not dataframes_processados:
-        return None, "Nenhum dos ficheiros continha dados válidos."
-
-    if len(intervalos_de_datas) > 1:
-        intervalos_ordenados = sorted(intervalos_de_datas, key=lambda x: x[0])
-        
-        for i in range(1, len(intervalos_ordenados)):
-            inicio_atual = intervalos_ordenados[i][0]
-            fim_anterior = intervalos_ordenados[i-1][1]
-            
-            if inicio_atual < fim_anterior:
-                erro_msg = (
-                    f"Erro: Sobreposição de datas detetada! O período que começa em "
-                    f"{inicio_atual.strftime('%d/%m/%Y')} sobrepõe-se ao período que termina em "
-                    f"{fim_anterior.strftime('%d/%m/%Y')}. Por favor, carregue ficheiros com períodos distintos."
-                )
-                return None, erro_msg
-
-    df_final_combinado = pd.concat(dataframes_processados, ignore_index=True)
-    df_final_combinado = df_final_combinado.sort_values(by='DataHora').reset_index(drop=True)
-    df_final_combinado = df_final_combinado.drop_duplicates(subset=['DataHora'], keep='first')
-
-    return df_final_combinado, None
-
-def agregar_consumos_por_periodo(df_consumos, df_omie_ciclos):
-    if df_consumos is None or df_consumos.empty: return {}
-
-    df_merged = pd.merge(df_consumos, df_omie_ciclos, on='DataHora', how='left')
-
-    consumos_agregados = {'Simples': df_merged['Consumo (kWh)'].sum()}
-    
-    for ciclo in ['BD', 'BS', 'TD', 'TS']:
-        if ciclo in df_merged.columns:
-            df_merged[ciclo] = df_merged[ciclo].fillna('Desconhecido')
-            soma_por_periodo = df_merged.groupby(ciclo)['Consumo (kWh)'].sum().to_dict()
-            consumos_agregados[ciclo] = soma_por_periodo
-            
-    return consumos_agregados
-
-def calcular_medias_omie_para_todos_ciclos(df_consumos_periodo, df_omie_completo):
+    copias = []
+    for df in dados:
+        df = df.copy() # Arrays próprios: a base de cada coluna é o array do bloco
+        for _, serie in df.items():
+            array = serie.to_numpy(copy=False)
+            if isinstance(array.base, np.ndarray):
+                array = array.base
+            array.flags.writeable = False
+        copias.append(df)
+    return tuple(copias)
+
+def _atualizar_dados_omie(estado, url_snapshot_omie, url_snapshot_constantes, url_excel):
     """
-    Calcula as médias OMIE para todos os ciclos, com base no intervalo de datas
-    do dataframe de consumos fornecido.
+    Faz uma verificação completa: snapshot Arrow primeiro, Excel se o snapshot não estiver disponível.
+    Os novos dados substituem os antigos de uma só vez (nunca fica um estado parcial).
+    """
+    if PYARROW_DISPONIVEL:
+        try:
+            novos_dados = _atualizar_snapshot(estado, url_snapshot_omie, url_snapshot_constantes)
+            if novos_dados is not None:
+                estado['dados'], estado['fonte'] = _so_de_leitura(novos_dados), 'snapshot'
+            return
+        except (OSError, ValueError, KeyError, pa.ArrowException, requests.exceptions.RequestException):
+            if estado['dados'] is not None and estado['fonte'] == 'snapshot':
+                return # Falha temporária: mantém os dados atuais e tenta na próxima verificação
+    novos_dados = _atualizar_excel(estado, url_excel)
+    if novos_dados is not None:
+        estado['dados'], estado['fonte'] = _so_de_leitura(novos_dados), 'excel'
+
+def _verificar_em_segundo_plano(estado, url_snapshot_omie, url_snapshot_constantes, url_excel):
+    try:
+        _atualizar_dados_omie(estado, url_snapshot_omie, url_snapshot_constantes, url_excel)
+    except Exception:
+        pass # Mantém os dados atuais; a próxima verificação volta a tentar
+    finally:
+        estado['ultima_verificacao'] = time.monotonic()
+        estado['a_verificar'] = False
+
+@st.cache_resource(show_spinner=False)
+def _estado_dados_omie(url_snapshot_omie, url_snapshot_constantes, url_excel):
+    """Estado partilhado por todas as sessões do processo: dados atuais, fonte e validadores."""
+    return {
+        'lock': threading.Lock(),
+        'dados': None,
+        'fonte': None,
+        'validadores': {},
+        'ultima_verificacao': 0.0,
+        'a_verificar': False,
+    }
+
+def carregar_dados_omie(url_snapshot_omie, url_snapshot_constantes, url_excel):
+    """
+    Devolve (OMIE_CICLOS, Constantes): do snapshot Arrow (rápido, com memory-map) ou,
+    se não estiver disponível (ou faltar o pyarrow), do ficheiro Excel.
+
+    Os DataFrames são partilhados por todas as sessões e só de leitura (ver _so_de_leitura).
+    Só o primeiro pedido do processo espera pelo carregamento. Depois disso os dados são
+    devolvidos de imediato e, no máximo a cada INTERVALO_VERIFICACAO_SEGUNDOS, é lançada
+    uma verificação condicional em segundo plano que os substitui se o ficheiro mudou.
     """
-    if df_consumos_periodo.empty:
-        return {}
-    
-    min_date = df_consumos_periodo['DataHora'].min()
-    max_date = df_consumos_periodo['DataHora'].max()
-    
-    df_omie_filtrado = df_omie_completo[
-        (df_omie_completo['DataHora'] >= min_date) & 
-        (df_omie_completo['DataHora'] <= max_date)
-    ].copy()
-
-    if df_omie_filtrado.empty:
-        return {}
-
-    omie_medios = {'S': df_omie_filtrado['OMIE'].mean()}
-    for ciclo in ['BD', 'BS', 'TD', 'TS']:
-        if ciclo in df_omie_filtrado.columns:
-            agrupado = df_omie_filtrado.groupby(ciclo)['OMIE'].mean()
-            for periodo, media in agrupado.items():
-                omie_medios[f"{ciclo}_{periodo}"] = media
-    return omie_medios
\ No newline at end of file
+    estado = _estado_dados_omie(url_snapshot_omie, url_snapshot_constantes, url_excel)
+    with estado['lock']:
+        if estado['dados'] is None:
+            _atualizar_dados_omie(estado, url_snapshot_omie, url_snapshot_constantes, url_excel)
+            estado['ultima_verificacao'] = time.monotonic()
+            return estado['dados']
+
+        verificar = (not estado['a_verificar']
+                     and time.monotonic() - estado['ultima_verificacao'] >= INTERVALO_VERIFICACAO_SEGUNDOS)
+        if verificar:
+            estado['a_verificar'] = True
+
+    if verificar:
+        threading.Thread(
+            target=_verificar_em_segundo_plano,
+            args=(estado, url_snapshot_omie, url_snapshot_constantes, url_excel),
+            daemon=True
+        ).start()
+    return estado['dados']
@@ -2,8 +2,15 @@
 import pandas as pd
 import numpy as np
 import requests
-import openpyxl
 import re
+import os
+import sys
+from openpyxl.utils import get_column_letter
+import xlsx_celulas
+
+# O armazém MIBEL (armazem_mibel.py) está na raiz do repositório, partilhado com a aplicação
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import armazem_mibel
 
 print("✅ Bibliotecas carregadas")
 
@@ -13,12 +20,51 @@ print("✅ Bibliotecas carregadas")
 FICHEIRO_EXCEL = "☀️_Autoconsumo_Tiago_Felicia.xlsx"
 ABA_EXCEL = "OMIE_CICLOS"
 COLUNA_PARA_ESCREVER = 8 # Coluna H
-FICHEIRO_MIBEL_CSV = "data/MIBEL_ano_atual_ACUM.csv"
+DIRETORIO_MIBEL = "data/mibel" # Um CSV por ano + manifesto.json (ver armazem_mibel.py)
+ANOS_EXCEL = [2026, 2027] # Anos (hora de Portugal) escritos na aba OMIE_CICLOS
 
-print(f"ℹ️ Fonte de dados: '{FICHEIRO_MIBEL_CSV}'")
+print(f"ℹ️ Fonte de dados: '{DIRETORIO_MIBEL}'")
 print("⚠️ MODO: Apenas dados reais (sem futuros)")
 # ===================================================================
 
+# ===================================================================
+# ---- CALENDÁRIO QUARTO-HORÁRIO (vetorizado, com mudança de hora) ----
+# ===================================================================
+TZ_ES = 'Europe/Madrid'
+TZ_PT = 'Europe/Lisbon'
+
+def num_quartos_por_dia(datas, tz=TZ_ES):
+    """
+    Número de quartos horários de cada dia (92, 96 ou 100 nos dias de mudança de hora),
+    pela diferença entre a meia-noite local do dia e a do dia seguinte.
+    A meia-noite existe sempre em Madrid e Lisboa (a mudança de hora é de madrugada).
+    """
+    dias = pd.DatetimeIndex(datas).normalize()
+    inicio = dias.tz_localize(tz)
+    fim = (dias + pd.Timedelta(days=1)).tz_localize(tz)
+    return ((fim - inicio) // pd.Timedelta(minutes=15)).to_numpy(dtype=np.int64)
+
+def gerar_quartos_dias(datas, tz=TZ_ES):
+    """
+    Estrutura ('Data', 'Hora') com todos os quartos horários dos dias dados, Hora = 1..N por dia.
+    """
+    dias = pd.DatetimeIndex(datas).normalize()
+    n_quartos = num_quartos_por_dia(dias, tz)
+    inicio_de_cada_dia = np.repeat(np.cumsum(n_quartos) - n_quartos, n_quartos)
+    return pd.DataFrame({
+        'Data': np.repeat(dias.to_numpy(), n_quartos),
+        'Hora': np.arange(n_quartos.sum(), dtype=np.int64) - inicio_de_cada_dia + 1,
+    })
+
+def datetime_quartos(datas, horas, tz=TZ_ES):
+    """
+    Instante (com fuso 'tz') do início de cada quarto horário: meia-noite local do dia + 15 min x (Hora - 1),
+    somados em tempo absoluto (nos dias de mudança de hora a numeração continua sem saltos).
+    """
+    inicio_dia = pd.DatetimeIndex(datas).normalize().tz_localize(tz)
+    deslocamento = pd.to_timedelta(np.asarray(horas, dtype=np.int64) - 1, unit='m') * 15
+    return inicio_dia + deslocamento
+
 def run_update_process():
     """
     Função principal que encapsula todo o processo de ETL (SEM FUTUROS).
@@ -28,9 +74,12 @@ def run_update_process():
         # PASSO 1: Leitura dos Dados
         # ========================================================
         
-        print(f"\n⏳ Passo 1: A ler dados históricos do '{FICHEIRO_MIBEL_CSV}'...")
+        print(f"\n⏳ Passo 1: A ler dados históricos do '{DIRETORIO_MIBEL}'...")
         try:
-            dados_combinados_qh = pd.read_csv(FICHEIRO_MIBEL_CSV, parse_dates=['Data'])
+            # Só os anos necessários (mais o anterior, para a última data com dados no início do ano)
+            dados_combinados_qh = armazem_mibel.ler_precos(data_inicio=f"{min(ANOS_EXCEL) - 1}-01-01", diretorio=DIRETORIO_MIBEL)
+            if dados_combinados_qh.empty:
+                raise FileNotFoundError(DIRETORIO_MIBEL)
             
             # Este script usa internamente a coluna 'Preco' para o preço de PT
             dados_combinados_qh = dados_combinados_qh.rename(columns={'Preco_PT': 'Preco'})
@@ -45,7 +94,7 @@ def run_update_process():
             print(f"   📅 Última data com dados: {ultima_data_omie.date()}")
             
         except FileNotFoundError:
-            print(f"❌ ERRO CRÍTICO: O ficheiro '{FICHEIRO_MIBEL_CSV}' não foi encontrado.")
+            print(f"❌ ERRO CRÍTICO: O armazém '{DIRETORIO_MIBEL}' não foi encontrado (ou está vazio).")
             print("   - Por favor, execute primeiro o script 'update_mibel_historico.py'.")
             return
         except Exception as e:
@@ -58,36 +107,10 @@ def run_update_process():
 
         print("\n⏳ Passo 2: A criar estrutura completa até 2026...")
         
-        def num_quartos_dia(data_obj):
-            """
-            Calcula número de quartos horários considerando DST.
-            Usa a diferença entre dias para garantir que apanha 23h ou 25h.
-            """
-            tz_es = 'Europe/Madrid'
-            
-            # Garantir que estamos a usar apenas a data
-            dia_atual = data_obj.date() if hasattr(data_obj, 'date') else data_obj
-            dia_seguinte = dia_atual + pd.Timedelta(days=1)
-            
-            # Criar Timestamps localizados (00:00 hoje vs 00:00 amanhã)
-            dt0 = pd.Timestamp(f"{dia_atual} 00:00:00", tz=tz_es)
-            dt_next = pd.Timestamp(f"{dia_seguinte} 00:00:00", tz=tz_es)
-            
-            horas = (dt_next - dt0).total_seconds() / 3600
-            return int(round(horas * 4)) 
-        
         datas_futuras = pd.date_range(start=ultima_data_omie + pd.Timedelta(days=1), end='2026-12-31', freq='D')
         
-        futuro_qh = []
-        for data in datas_futuras:
-            n_quartos = num_quartos_dia(data)
-            for hora in range(1, n_quartos + 1):
-                futuro_qh.append({'Data': data, 'Hora': hora, 'Preco': np.nan})
-        
-        if futuro_qh:
-            futuro_qh = pd.DataFrame(futuro_qh)
-        else:
-            futuro_qh = pd.DataFrame(columns=['Data', 'Hora', 'Preco'])
+        futuro_qh = gerar_quartos_dias(datas_futuras)
+        futuro_qh['Preco'] = np.nan
 
         # Combinar histórico + estrutura futura (vazia)
         dados_completos_qh = pd.concat([dados_combinados_qh, futuro_qh], ignore_index=True)
@@ -103,16 +126,9 @@ def run_update_process():
         # ============================================================
         print("\n⏳ Passo 3: A converter para hora de Portugal...")
         
-        # Gerar datetime em hora de Espanha
-        def gerar_datetime_es(row):
-            """Gera timestamp correto considerando DST"""
-            data = row['Data']
-            hora = row['Hora']
-            inicio_dia = pd.Timestamp(f"{data} 00:00:00", tz='Europe/Madrid')
-            return inicio_dia + pd.Timedelta(minutes=15 * (hora - 1))
-        
-        dados_completos_qh['datetime_es'] = dados_completos_qh.apply(gerar_datetime_es, axis=1)
-        dados_completos_qh['datetime_pt'] = dados_completos_qh['datetime_es'].dt.tz_convert('Europe/Lisbon')
+        # Gerar datetime em hora de Espanha (vetorizado)
+        dados_completos_qh['datetime_es'] = datetime_quartos(dados_completos_qh['Data'], dados_completos_qh['Hora'])
+        dados_completos_qh['datetime_pt'] = dados_completos_qh['datetime_es'].dt.tz_convert(TZ_PT)
         dados_completos_qh['Data_PT'] = dados_completos_qh['datetime_pt'].dt.date
         
         # Renumerar horas em hora de Portugal
@@ -120,7 +136,7 @@ def run_update_process():
         dados_finais_pt['Hora_PT'] = dados_finais_pt.groupby('Data_PT').cumcount() + 1
         
         # Selecionar apenas 2026 e 2027
-        dados_finais_pt = dados_finais_pt[dados_finais_pt['datetime_pt'].dt.year.isin([2026, 2027])].copy()
+        dados_finais_pt = dados_finais_pt[dados_finais_pt['datetime_pt'].dt.year.isin(ANOS_EXCEL)].copy()
         dados_finais_pt = dados_finais_pt[['Data_PT', 'Hora_PT', 'Preco']].rename(
             columns={'Data_PT': 'Data', 'Hora_PT': 'Hora'}
         )
@@ -148,12 +164,18 @@ def run_update_process():
         # ============================================================
         print(f"\n⏳ Passo 4: A atualizar o ficheiro '{FICHEIRO_EXCEL}'...")
 
-        # 1. Ler a pauta de tempo 'master' do Excel (Colunas A e B)
+        # 1. Ler a pauta de tempo 'master' do Excel (Colunas A e B), em streaming
         print(f"   - A ler a pauta de tempo da aba '{ABA_EXCEL}' para alinhamento...")
-        df_pauta_excel = pd.read_excel(
-            FICHEIRO_EXCEL,
-            sheet_name=ABA_EXCEL,
-            usecols=['Data', 'Hora'] 
+        linhas_aba = xlsx_celulas.ler_colunas(FICHEIRO_EXCEL, ABA_EXCEL, ['A', 'B'])
+        cabecalho = {valor: coluna for coluna, valor in linhas_aba[0][1].items()}
+        col_data, col_hora = cabecalho['Data'], cabecalho['Hora']
+        df_pauta_excel = pd.DataFrame(
+            {
+                'Data': [valores.get(col_data) for _, valores in linhas_aba[1:]],
+                'Hora': [valores.get(col_hora) for _, valores in linhas_aba[1:]],
+            },
+            # Índice 0-based das linhas de dados, como no pd.read_excel (linha do Excel = índice + 2)
+            index=[numero_linha - 2 for numero_linha, _ in linhas_aba[1:]]
         )
         df_pauta_excel.dropna(subset=['Data', 'Hora'], inplace=True)
         # Preservar a ordem original do Excel (o seu índice 0-based)
@@ -192,30 +214,25 @@ def run_update_process():
         print(f"   - {len(dados_para_escrever)} preços (2026/2027) alinhados e prontos a escrever.")
 
         # 7. Escrever no ficheiro Excel (de forma seletiva)
-        print(f"   - A carregar '{FICHEIRO_EXCEL}' para escrita...")
-        wb = openpyxl.load_workbook(FICHEIRO_EXCEL)
-        sheet = wb[ABA_EXCEL]
-        
-        print(f"   - A escrever {len(dados_para_escrever)} preços na Coluna {COLUNA_PARA_ESCREVER} (H)...")
+        # Só as células da coluna H (e a data em Constantes) são reescritas no XML das folhas;
+        # o resto do livro não é carregado nem alterado.
+        coluna_letra = get_column_letter(COLUNA_PARA_ESCREVER)
+        print(f"   - A escrever {len(dados_para_escrever)} preços na Coluna {COLUNA_PARA_ESCREVER} ({coluna_letra})...")
         
-        # Iterar APENAS sobre as linhas que TÊM dados
-        for _, row in dados_para_escrever.iterrows():
+        celulas_omie = {}
+        for indice, preco in zip(dados_para_escrever['index'].to_numpy(), dados_para_escrever['Preco'].to_numpy()):
             # Usar o 'index' original para encontrar a linha correta no Excel
-            excel_row_index = int(row['index']) + 2  # +1 (0-based to 1-based) +1 (skip header)
-            preco = row['Preco'] # Este 'preco' PODE ser NaN (se for futuro)
-            
-            if pd.isna(preco):
-                sheet.cell(row=excel_row_index, column=COLUNA_PARA_ESCREVER, value=None)
-            else:
-                sheet.cell(row=excel_row_index, column=COLUNA_PARA_ESCREVER, value=preco)
+            excel_row_index = int(indice) + 2  # +1 (0-based to 1-based) +1 (skip header)
+            # Este 'preco' PODE ser NaN (se for futuro): a célula fica vazia
+            celulas_omie[(coluna_letra, excel_row_index)] = None if pd.isna(preco) else float(preco)
             
         # ===================================================================
             
-        # 8. Atualizar data de referência na aba 'Constantes'
-        sheet_const = wb["Constantes"]
-        sheet_const['B42'] = ultima_data_omie.strftime('%d/%m/%Y')
-        
-        wb.save(FICHEIRO_EXCEL)
+        # 8. Atualizar data de referência na aba 'Constantes' (B42)
+        xlsx_celulas.atualizar_celulas(FICHEIRO_EXCEL, {
+            ABA_EXCEL: celulas_omie,
+            "Constantes": {('B', 42): ultima_data_omie.strftime('%d/%m/%Y')},
+        })
         print(f"✅ O ficheiro Excel foi atualizado com sucesso!")
         print(f"   Data_Valores_OMIE = {ultima_data_omie.date()}")
         print(f"   ⚠️ Nota: Apenas dados reais até {ultima_data_omie.date()} foram escritos.")
@@ -3,20 +3,35 @@ import numpy as np
 import requests
 import re
 import io
-import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import os
+from requests.adapters import HTTPAdapter
 
-# Detecta se o script está a correr dentro do GitHub Actions
-RUNNING_IN_GITHUB = "GITHUB_ACTIONS" in os.environ
+# O armazém MIBEL (armazem_mibel.py) está na raiz do repositório, partilhado com a aplicação
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import armazem_mibel
 
 # ============================================================
 # CONFIGURAÇÕES
 # ============================================================
+DIRETORIO_MIBEL = "data/mibel" # Um CSV por ano + manifesto.json (ver armazem_mibel.py)
+# Formatos antigos (CSV/XLS únicos), só usados para criar o armazém se ainda não existir
 FICHEIRO_MIBEL_CSV = "data/MIBEL_ano_atual_ACUM.csv"
 FICHEIRO_MIBEL_XLS = "data/MIBEL_ano_atual_ACUM.xlsx"
 DIAS_MINIMOS_ACUM = 365
-BACKUP_SUFFIX = ".bak"
+ANOS_HISTORICO_LOCAL = 2 # Ano atual e anterior: cobrem a janela de 365 dias do ACUM
+
+# Download dos ficheiros diários do OMIE (marginalpdbcpt_YYYYMMDD.1)
+# O URL base pode ser alterado (ex: servidor local de teste) com a variável OMIE_URL_BASE
+URL_BASE_OMIE = os.environ.get("OMIE_URL_BASE", "https://www.omie.es")
+CAMINHO_FICHEIRO_DIARIO = "/es/file-download?parents=marginalpdbcpt&filename=marginalpdbcpt_{data}.1"
+DOWNLOADS_EM_PARALELO = int(os.environ.get("OMIE_DOWNLOADS_PARALELO", 6))
+TENTATIVAS_DOWNLOAD = 3
+ESPERA_INICIAL_SEGUNDOS = 1.0 # Duplica a cada nova tentativa (1 s, 2 s, ...)
+TIMEOUT_DOWNLOAD = 12
 
 # ============================================================
 # SISTEMA DE LOGS
@@ -28,63 +43,108 @@ def sub(msg): print(f"       • {msg}")
 # ============================================================
 # FUNÇÃO: Extrair dados OMIE (DIÁRIO)
 # ============================================================
-def tentar_extrair_dados_omie_diario(data_inicio, data_fim):
-
-    if data_inicio > data_fim:
-        header("[DIÁRIO] Nenhum intervalo para preencher.")
-        return pd.DataFrame()
-
-    header(f"[DIÁRIO] A preencher buracos de {data_inicio} até {data_fim}")
-    dias = pd.date_range(data_inicio, data_fim, freq="D")
-    sub(f"{len(dias)} dia(s) a verificar…")
-
-    headers = {"User-Agent": "Mozilla/5.0"}
-    lista = []
-    dias_futuros = 0
-    dias_ok = 0
-    dias_vazios = 0
-
-    for d in dias:
-        data_str = d.strftime('%Y%m%d')
-        url = f"https://www.omie.es/es/file-download?parents=marginalpdbcpt&filename=marginalpdbcpt_{data_str}.1"
-
+def criar_sessao_omie(max_ligacoes=DOWNLOADS_EM_PARALELO):
+    """
+    Sessão HTTP partilhada por todos os downloads: as ligações ficam abertas (keep-alive)
+    e são reutilizadas pelas threads, até 'max_ligacoes' em simultâneo.
+    """
+    sessao = requests.Session()
+    sessao.headers.update({"User-Agent": "Mozilla/5.0"})
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_ligacoes)
+    sessao.mount("http://", adaptador)
+    sessao.mount("https://", adaptador)
+    return sessao
+
+def descarregar_dia_omie(sessao, dia, url_base=URL_BASE_OMIE):
+    """
+    Descarrega e interpreta o ficheiro de um dia, com novas tentativas (espera exponencial)
+    para erros de rede e respostas 5xx/429. Um 404 significa que o dia ainda não existe.
+
+    Retorna um dicionário com 'dia', 'estado' ('ok', 'indisponivel', 'vazio' ou 'erro'),
+    'dados' (DataFrame ou None), 'tentativas' e 'detalhe'.
+    """
+    url = url_base + CAMINHO_FICHEIRO_DIARIO.format(data=dia.strftime('%Y%m%d'))
+    resultado = {'dia': dia.date(), 'estado': 'erro', 'dados': None, 'tentativas': 0, 'detalhe': ''}
+
+    for tentativa in range(1, TENTATIVAS_DOWNLOAD + 1):
+        resultado['tentativas'] = tentativa
         try:
-            r = requests.get(url, headers=headers, timeout=12)
-
+            r = sessao.get(url, timeout=TIMEOUT_DOWNLOAD)
             if r.status_code == 404:
-                dias_futuros += 1
-                continue
+                resultado['estado'] = 'indisponivel'
+                return resultado
+            if r.status_code == 429 or r.status_code >= 500:
+                resultado['detalhe'] = f"HTTP {r.status_code}"
+            elif r.status_code >= 400:
+                resultado['detalhe'] = f"HTTP {r.status_code}"
+                return resultado
+            else:
+                break
+        except requests.exceptions.RequestException as e:
+            resultado['detalhe'] = type(e).__name__
+        if tentativa < TENTATIVAS_DOWNLOAD:
+            time.sleep(ESPERA_INICIAL_SEGUNDOS * 2 ** (tentativa - 1))
+    else:
+        return resultado
 
-            r.raise_for_status()
+    try:
+        df = pd.read_csv(
+            io.BytesIO(r.content),
+            sep=';', skiprows=1, decimal=',', encoding='windows-1252',
+            header=None, usecols=[3,4,5],
+            names=['Hora','Preco_PT','Preco_ES']
+        )
+    except Exception as e:
+        resultado['detalhe'] = f"formato inválido ({e})"
+        return resultado
 
-            df = pd.read_csv(
-                io.BytesIO(r.content),
-                sep=';', skiprows=1, decimal=',', encoding='windows-1252',
-                header=None, usecols=[3,4,5],
-                names=['Hora','Preco_PT','Preco_ES']
-            )
+    df.dropna(inplace=True)
+    df['Data'] = dia.date()
 
-            df.dropna(inplace=True)
-            df['Data'] = d.date()
+    if df.empty:
+        resultado['estado'] = 'vazio'
+        return resultado
 
-            if df.empty:
-                dias_vazios += 1
-                continue
+    resultado['estado'] = 'ok'
+    resultado['dados'] = df
+    resultado['detalhe'] = f"{len(df)} registos"
+    return resultado
 
-            dias_ok += 1
-            lista.append(df)
+def tentar_extrair_dados_omie_diario(data_inicio, data_fim, url_base=URL_BASE_OMIE, max_paralelo=DOWNLOADS_EM_PARALELO):
 
-        except Exception:
-            dias_vazios += 1
-            continue
+    if data_inicio > data_fim:
+        header("[DIÁRIO] Nenhum intervalo para preencher.")
+        return pd.DataFrame()
+
+    header(f"[DIÁRIO] A preencher buracos de {data_inicio} até {data_fim}")
+    dias = pd.date_range(data_inicio, data_fim, freq="D")
+    sub(f"{len(dias)} dia(s) a verificar ({min(max_paralelo, len(dias))} em paralelo)…")
+
+    # Downloads em paralelo, limitados a 'max_paralelo', sobre uma única sessão com keep-alive
+    with criar_sessao_omie(max_paralelo) as sessao, ThreadPoolExecutor(max_workers=max_paralelo) as executor:
+        resultados = list(executor.map(lambda d: descarregar_dia_omie(sessao, d, url_base), dias))
+
+    # -------- RELATÓRIO POR DIA --------
+    simbolos = {'ok': '✅', 'indisponivel': '⏳', 'vazio': '⚠️', 'erro': '❌'}
+    for res in resultados:
+        linha = f"{simbolos[res['estado']]} {res['dia']}: {res['estado']}"
+        if res['detalhe']:
+            linha += f" ({res['detalhe']})"
+        if res['tentativas'] > 1:
+            linha += f" — {res['tentativas']} tentativas"
+        sub(linha)
 
     # -------- LOG FINAL DOS DIÁRIOS --------
-    if dias_ok == 0:
-        if dias_futuros + dias_vazios == len(dias):
-            sub("ℹ️ Nenhum dia disponível — pode ser futuro ou falha OMIE.")
+    lista = [res['dados'] for res in resultados if res['estado'] == 'ok']
+    contagem = {estado: sum(res['estado'] == estado for res in resultados) for estado in simbolos}
+    sub(f"Resumo: {contagem['ok']} ok, {contagem['indisponivel']} indisponíveis, "
+        f"{contagem['vazio']} vazios, {contagem['erro']} com erro.")
+
+    if not lista:
+        sub("ℹ️ Nenhum dia disponível — pode ser futuro ou falha OMIE.")
         return pd.DataFrame()
 
-    sub(f"✅ {dias_ok} dias recolhidos com sucesso.")
+    sub(f"✅ {len(lista)} dias recolhidos com sucesso.")
     return pd.concat(lista, ignore_index=True)
 
 # ============================================================
@@ -177,22 +237,28 @@ def ler_historico_local():
 
     header("[HISTÓRICO] A carregar histórico local")
 
-    try:
-        df = pd.read_csv(FICHEIRO_MIBEL_CSV, parse_dates=['Data'])
-        df['Data'] = df['Data'].dt.date
-        log(f"✔️ CSV carregado ({len(df)} registos)")
-        return df
-    except:
-        log("ℹ️ CSV inexistente — tentar XLS…")
-
-    try:
-        df = pd.read_excel(FICHEIRO_MIBEL_XLS)
-        df['Data'] = pd.to_datetime(df['Data']).dt.date
-        log(f"✔️ XLS carregado ({len(df)} registos)")
-        return df
-    except:
-        log("⚠️ Nem CSV nem XLS disponíveis — histórico vazio.")
-        return pd.DataFrame(columns=['Data','Hora','Preco_PT','Preco_ES'])
+    if armazem_mibel.ler_manifesto(DIRETORIO_MIBEL) is None:
+        log(f"ℹ️ Armazém '{DIRETORIO_MIBEL}' inexistente — a criar a partir do formato antigo…")
+        try:
+            resumo = armazem_mibel.migrar_csv_unico(FICHEIRO_MIBEL_CSV, DIRETORIO_MIBEL)
+            log(f"✔️ CSV migrado ({len(resumo['dias_novos'])} dias, anos {resumo['anos_reescritos']})")
+        except:
+            log("ℹ️ CSV inexistente — tentar XLS…")
+            try:
+                df = pd.read_excel(FICHEIRO_MIBEL_XLS)
+                resumo = armazem_mibel.gravar_dias(df, DIRETORIO_MIBEL)
+                log(f"✔️ XLS migrado ({len(resumo['dias_novos'])} dias, anos {resumo['anos_reescritos']})")
+            except:
+                log("⚠️ Nem CSV nem XLS disponíveis — histórico vazio.")
+                return pd.DataFrame(columns=['Data','Hora','Preco_PT','Preco_ES'])
+
+    # Só os anos mais recentes: os restantes não entram na consolidação e ficam intactos no armazém
+    ano_atual = datetime.now().year
+    anos = range(ano_atual - ANOS_HISTORICO_LOCAL + 1, ano_atual + 2)
+    df = armazem_mibel.ler_precos(anos=anos, diretorio=DIRETORIO_MIBEL)
+    df['Data'] = df['Data'].dt.date
+    log(f"✔️ Armazém carregado: anos {sorted({d.year for d in df['Data']})} ({len(df)} registos)")
+    return df
 
 # ============================================================
 # FUNÇÃO PRINCIPAL
@@ -340,23 +406,16 @@ def run_update_historico():
     # Ordenação final e remoção de duplicados exatos
     df_final = df_final.sort_values(['Data','Hora']).drop_duplicates(['Data','Hora'], keep='last')
 
-    # BACKUP INTELIGENTE
-    backup_path = FICHEIRO_MIBEL_CSV + BACKUP_SUFFIX
-
-    if not RUNNING_IN_GITHUB:
-        try:
-            shutil.copy(FICHEIRO_MIBEL_CSV, backup_path)
-            log(f"💾 Backup criado (local): {backup_path}")
-        except Exception as e:
-            log(f"⚠️ Falha ao criar backup local: {e}")
-    else:
-        log("ℹ️ Backup ignorado (GitHub Actions)")
-
-    df_final.to_csv(FICHEIRO_MIBEL_CSV, index=False, encoding='utf-8-sig', float_format="%.2f")
+    # Gravar no armazém só os dias novos ou alterados (os ficheiros dos outros anos não são tocados;
+    # a gravação de cada ano é atómica, por isso já não é preciso backup)
+    resumo = armazem_mibel.gravar_dias(df_final, DIRETORIO_MIBEL)
 
-    log(f"✅ Atualização concluída: {len(df_final)} registos")
+    log(f"✅ Atualização concluída: {len(df_final)} registos consolidados")
     if not df_final.empty:
         log(f"   📅 Dados de: {df_final['Data'].min()} até {df_final['Data'].max()}")
+    log(f"   ➕ Dias novos: {len(resumo['dias_novos'])} {[str(d) for d in resumo['dias_novos']]}")
+    log(f"   🔁 Dias substituídos: {len(resumo['dias_substituidos'])} {[str(d) for d in resumo['dias_substituidos']]}")
+    log(f"   💾 Anos acrescentados: {resumo['anos_acrescentados']} | Anos reescritos: {resumo['anos_reescritos']}")
     log("🏁 FIM")
 
 # ============================================================
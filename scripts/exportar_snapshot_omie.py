@@ -0,0 +1,101 @@
+# --- Carregar as bibliotecas necessárias ---
+import os
+import tempfile
+import pandas as pd
+import pyarrow as pa
+
+print("✅ Bibliotecas carregadas")
+
+# ===================================================================
+# ---- CONFIGURAÇÕES ----
+# ===================================================================
+FICHEIRO_EXCEL = "☀️_Autoconsumo_Tiago_Felicia.xlsx"
+DIRETORIO_SNAPSHOT = "data"
+FICHEIRO_SNAPSHOT_OMIE = os.path.join(DIRETORIO_SNAPSHOT, "OMIE_CICLOS.arrow")
+FICHEIRO_SNAPSHOT_CONSTANTES = os.path.join(DIRETORIO_SNAPSHOT, "Constantes.arrow")
+
+# Colunas de texto com poucos valores distintos, guardadas como dicionário (categóricas)
+COLUNAS_CATEGORICAS = ['Data', 'Hora', 'Simples', 'BD', 'BS', 'TD', 'TS']
+# ===================================================================
+
+
+def ler_omie_ciclos(xls):
+    """
+    Lê a aba OMIE_CICLOS com as mesmas regras da aplicação (processamento_dados.carregar_dados_excel):
+    DataHora a partir de 'Data' (MM/DD/YYYY) e 'Hora' (HH:MM), sem linhas inválidas nem duplicadas.
+    """
+    omie_ciclos = xls.parse("OMIE_CICLOS")
+    omie_ciclos.columns = [str(c).strip() for c in omie_ciclos.columns]
+    omie_ciclos['DataHora'] = pd.to_datetime(
+        omie_ciclos['Data'].astype(str) + ' ' + omie_ciclos['Hora'].astype(str),
+        format='%m/%d/%Y %H:%M',
+        errors='coerce'
+    )
+    omie_ciclos = omie_ciclos.dropna(subset=['DataHora'])
+    omie_ciclos = omie_ciclos.drop_duplicates(subset=['DataHora'], keep='first').reset_index(drop=True)
+
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in omie_ciclos.columns:
+            omie_ciclos[coluna] = omie_ciclos[coluna].astype(str).where(omie_ciclos[coluna].notna()).astype('category')
+    omie_ciclos['OMIE'] = pd.to_numeric(omie_ciclos['OMIE'], errors='coerce').astype('float64')
+    return omie_ciclos
+
+
+def ler_constantes(xls):
+    """
+    Lê a aba Constantes. A coluna 'valor_unitário' mistura números e texto (ex: Data_Valores_OMIE),
+    por isso é dividida em duas colunas tipadas: 'valor_numerico' e 'valor_texto'.
+    """
+    constantes = xls.parse("Constantes")
+    valores = constantes['valor_unitário']
+    e_numero = valores.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+    return pd.DataFrame({
+        'constante': constantes['constante'].astype(str),
+        'valor_numerico': pd.to_numeric(valores.where(e_numero), errors='coerce').astype('float64'),
+        'valor_texto': valores.where(~e_numero & valores.notna()).map(lambda v: v if pd.isna(v) else str(v)).astype(object),
+    })
+
+
+def gravar_arrow(df, caminho):
+    """
+    Grava um DataFrame em formato Arrow IPC (sem compressão, para poder ser lido com memory-map),
+    de forma atómica: ficheiro temporário + rename.
+    """
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    fd, caminho_tmp = tempfile.mkstemp(dir=os.path.dirname(caminho) or ".", prefix=".tmp_", suffix=".arrow")
+    with os.fdopen(fd, "wb") as f:
+        with pa.ipc.new_file(f, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+    os.chmod(caminho_tmp, 0o644)
+    os.replace(caminho_tmp, caminho)
+    return os.path.getsize(caminho)
+
+
+def run_export_process():
+    """
+    Exporta as abas OMIE_CICLOS e Constantes do Excel para ficheiros Arrow tipados,
+    que a aplicação carrega antes (e em vez) do Excel.
+    """
+    try:
+        print(f"\n⏳ Passo 1: A ler '{FICHEIRO_EXCEL}'...")
+        xls = pd.ExcelFile(FICHEIRO_EXCEL)
+        omie_ciclos = ler_omie_ciclos(xls)
+        constantes = ler_constantes(xls)
+        print(f"✅ OMIE_CICLOS: {len(omie_ciclos)} registos ({omie_ciclos['DataHora'].min()} a {omie_ciclos['DataHora'].max()})")
+        print(f"✅ Constantes: {len(constantes)} registos")
+
+        print("\n⏳ Passo 2: A gravar snapshot em formato Arrow...")
+        os.makedirs(DIRETORIO_SNAPSHOT, exist_ok=True)
+        tamanho_omie = gravar_arrow(omie_ciclos, FICHEIRO_SNAPSHOT_OMIE)
+        tamanho_constantes = gravar_arrow(constantes, FICHEIRO_SNAPSHOT_CONSTANTES)
+        print(f"✅ '{FICHEIRO_SNAPSHOT_OMIE}' ({tamanho_omie / 1024:.0f} kB)")
+        print(f"✅ '{FICHEIRO_SNAPSHOT_CONSTANTES}' ({tamanho_constantes / 1024:.0f} kB)")
+
+    except Exception as e:
+        import traceback
+        print(f"❌ Ocorreu um erro inesperado: {e}")
+        traceback.print_exc()
+        raise
+
+if __name__ == "__main__":
+    run_export_process()
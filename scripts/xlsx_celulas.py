@@ -0,0 +1,210 @@
+# --- Leitura e escrita pontual de células num .xlsx, sem carregar o livro inteiro ---
+#
+# Um .xlsx é um zip com um XML por folha. Para atualizar uma só coluna (ex: a coluna H da aba
+# OMIE_CICLOS) não é preciso interpretar nem voltar a gerar o livro: basta percorrer o XML da folha
+# em blocos, linha a linha, e reescrever apenas as células alteradas. Todas as outras entradas do
+# zip (outras folhas, estilos, sharedStrings, ...) são copiadas com o mesmo conteúdo.
+import os
+import re
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, unescape
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL_DOC = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_REL_PKG = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+TAMANHO_BLOCO = 1 << 20 # 1 MB de XML descomprimido de cada vez
+FIM_LINHA = b"</row>"
+
+RE_INICIO_LINHA = re.compile(rb'<row\b[^>]*?\br="(\d+)"')
+RE_CELULA = re.compile(rb'<c\b[^>]*?\br="([A-Z]+)(\d+)"[^>]*?(?:/>|>.*?</c>)', re.S)
+RE_ESTILO = re.compile(rb'\bs="(\d+)"')
+RE_TIPO = re.compile(rb'\bt="(\w+)"')
+RE_VALOR = re.compile(rb'<v>(.*?)</v>', re.S)
+RE_TEXTO = re.compile(rb'<t\b[^>]*>(.*?)</t>', re.S)
+
+
+def _indice_coluna(letras):
+    indice = 0
+    for letra in letras:
+        indice = indice * 26 + (ord(letra) - ord('A') + 1)
+    return indice
+
+
+def caminho_folha(zf, nome_aba):
+    """Devolve o nome da entrada do zip com o XML da aba 'nome_aba' (via workbook.xml e as suas relações)."""
+    livro = ET.fromstring(zf.read("xl/workbook.xml"))
+    relacoes = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    for folha in livro.iter(f"{{{NS_MAIN}}}sheet"):
+        if folha.get("name") == nome_aba:
+            id_relacao = folha.get(f"{{{NS_REL_DOC}}}id")
+            break
+    else:
+        raise KeyError(f"Aba '{nome_aba}' não encontrada no livro.")
+    for relacao in relacoes.iter(f"{{{NS_REL_PKG}}}Relationship"):
+        if relacao.get("Id") == id_relacao:
+            alvo = relacao.get("Target")
+            return alvo.lstrip("/") if alvo.startswith("/") else "xl/" + alvo
+    raise KeyError(f"Relação '{id_relacao}' da aba '{nome_aba}' não encontrada.")
+
+
+def _shared_strings(zf):
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    raiz = ET.fromstring(zf.read("xl/sharedStrings.xml"))
+    return ["".join(t.text or "" for t in si.iter(f"{{{NS_MAIN}}}t")) for si in raiz.iter(f"{{{NS_MAIN}}}si")]
+
+
+def _segmentos_linhas(fluxo):
+    """
+    Percorre o XML de uma folha em blocos e devolve segmentos que terminam sempre num '</row>'
+    (o último segmento tem o resto do ficheiro). Nenhum byte é perdido nem alterado.
+    """
+    pendente = b""
+    while True:
+        bloco = fluxo.read(TAMANHO_BLOCO)
+        if not bloco:
+            break
+        pendente += bloco
+        fim = pendente.rfind(FIM_LINHA)
+        if fim < 0:
+            continue
+        fim += len(FIM_LINHA)
+        completos, pendente = pendente[:fim], pendente[fim:]
+        inicio = 0
+        while inicio < len(completos):
+            proximo = completos.index(FIM_LINHA, inicio) + len(FIM_LINHA)
+            yield completos[inicio:proximo]
+            inicio = proximo
+    if pendente:
+        yield pendente
+
+
+def _valor_celula(celula, shared_strings):
+    tipo = RE_TIPO.search(celula.split(b">", 1)[0])
+    tipo = tipo.group(1) if tipo else b"n"
+    if tipo == b"inlineStr":
+        return unescape("".join(t.decode("utf-8") for t in RE_TEXTO.findall(celula)))
+    valor = RE_VALOR.search(celula)
+    if valor is None:
+        return None
+    texto = unescape(valor.group(1).decode("utf-8"))
+    if tipo == b"s":
+        return shared_strings[int(texto)]
+    if tipo in (b"str", b"e"):
+        return texto
+    if tipo == b"b":
+        return texto == "1"
+    return float(texto)
+
+
+def ler_colunas(caminho_xlsx, nome_aba, colunas):
+    """
+    Lê, em streaming, os valores das 'colunas' (ex: ['A', 'B']) de uma aba.
+    Retorna uma lista de tuplos (número_da_linha, {coluna: valor}) pela ordem do ficheiro.
+    Os valores são texto (inlineStr, sharedStrings) ou float (números); as fórmulas devolvem o valor em cache.
+    """
+    colunas = {c.encode("ascii") for c in colunas}
+    linhas = []
+    with zipfile.ZipFile(caminho_xlsx) as zf:
+        shared_strings = _shared_strings(zf)
+        with zf.open(caminho_folha(zf, nome_aba)) as fluxo:
+            for segmento in _segmentos_linhas(fluxo):
+                inicio = RE_INICIO_LINHA.search(segmento)
+                if inicio is None:
+                    continue
+                valores = {}
+                for celula in RE_CELULA.finditer(segmento, inicio.start()):
+                    if celula.group(1) in colunas:
+                        valores[celula.group(1).decode("ascii")] = _valor_celula(celula.group(0), shared_strings)
+                linhas.append((int(inicio.group(1)), valores))
+    return linhas
+
+
+def _xml_celula(referencia, valor, estilo):
+    """XML de uma célula: número, texto (inlineStr) ou vazia (None; só se mantém se tiver estilo)."""
+    atributo_estilo = f' s="{estilo.decode("ascii")}"' if estilo else ""
+    if valor is None:
+        return f'<c r="{referencia}"{atributo_estilo} />'.encode("utf-8") if estilo else b""
+    if isinstance(valor, str):
+        return f'<c r="{referencia}"{atributo_estilo} t="inlineStr"><is><t>{escape(valor)}</t></is></c>'.encode("utf-8")
+    return f'<c r="{referencia}"{atributo_estilo} t="n"><v>{float(valor)!r}</v></c>'.encode("utf-8")
+
+
+def _alterar_linha(segmento, inicio_linha, numero_linha, alteracoes):
+    """Reescreve as células alteradas de uma linha; o resto do segmento fica igual, byte a byte."""
+    for coluna, valor in sorted(alteracoes.items(), key=lambda item: _indice_coluna(item[0])):
+        referencia = f"{coluna}{numero_linha}"
+        existente = None
+        posicao_insercao = segmento.rindex(FIM_LINHA)
+        for celula in RE_CELULA.finditer(segmento, inicio_linha):
+            coluna_celula = celula.group(1).decode("ascii")
+            if coluna_celula == coluna:
+                existente = celula
+                break
+            if _indice_coluna(coluna_celula) > _indice_coluna(coluna):
+                posicao_insercao = celula.start()
+                break
+
+        if existente is not None:
+            estilo = RE_ESTILO.search(existente.group(0).split(b">", 1)[0])
+            nova = _xml_celula(referencia, valor, estilo.group(1) if estilo else None)
+            segmento = segmento[:existente.start()] + nova + segmento[existente.end():]
+        else:
+            nova = _xml_celula(referencia, valor, None)
+            segmento = segmento[:posicao_insercao] + nova + segmento[posicao_insercao:]
+    return segmento
+
+
+def _copiar_folha_com_alteracoes(fluxo_entrada, fluxo_saida, alteracoes_por_linha):
+    pendentes = set(alteracoes_por_linha)
+    for segmento in _segmentos_linhas(fluxo_entrada):
+        inicio = RE_INICIO_LINHA.search(segmento)
+        if inicio is not None:
+            numero_linha = int(inicio.group(1))
+            if numero_linha in pendentes:
+                segmento = _alterar_linha(segmento, inicio.start(), numero_linha, alteracoes_por_linha[numero_linha])
+                pendentes.discard(numero_linha)
+        fluxo_saida.write(segmento)
+    if pendentes:
+        raise ValueError(f"{len(pendentes)} linha(s) a alterar não existem na folha (ex: {min(pendentes)}).")
+
+
+def atualizar_celulas(caminho_xlsx, alteracoes):
+    """
+    Altera células de um .xlsx sem carregar o livro.
+
+    'alteracoes' é {nome_aba: {(coluna, linha): valor}}, com valor float (número), str (texto)
+    ou None (limpa o valor, mantendo o estilo). Só o XML das abas indicadas é reescrito, e só nas
+    células alteradas; as restantes entradas do zip mantêm o conteúdo. O ficheiro é substituído
+    de forma atómica no fim.
+    """
+    with zipfile.ZipFile(caminho_xlsx) as zin:
+        por_entrada = {}
+        for nome_aba, celulas in alteracoes.items():
+            por_linha = {}
+            for (coluna, linha), valor in celulas.items():
+                por_linha.setdefault(int(linha), {})[coluna] = valor
+            por_entrada[caminho_folha(zin, nome_aba)] = por_linha
+
+        diretorio = os.path.dirname(os.path.abspath(caminho_xlsx))
+        fd, caminho_tmp = tempfile.mkstemp(dir=diretorio, prefix=".tmp_", suffix=".xlsx")
+        try:
+            with os.fdopen(fd, "wb") as destino, zipfile.ZipFile(destino, "w") as zout:
+                for info in zin.infolist():
+                    nova_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                    nova_info.compress_type = info.compress_type
+                    nova_info.external_attr = info.external_attr
+                    if info.filename in por_entrada:
+                        with zin.open(info) as fluxo_entrada, zout.open(nova_info, "w") as fluxo_saida:
+                            _copiar_folha_com_alteracoes(fluxo_entrada, fluxo_saida, por_entrada[info.filename])
+                    else:
+                        zout.writestr(nova_info, zin.read(info))
+            os.chmod(caminho_tmp, 0o644)
+            os.replace(caminho_tmp, caminho_xlsx)
+        except BaseException:
+            if os.path.exists(caminho_tmp):
+                os.remove(caminho_tmp)
+            raise